@@ -0,0 +1,325 @@
+import os
+import json
+from abc import ABC, abstractmethod
+from typing import List, Dict, Any, Optional, Tuple
+import numpy as np
+from langchain.embeddings.base import Embeddings
+
+try:
+    from .flat_index import FlatIndex, _to_distance
+except ImportError:
+    from flat_index import FlatIndex, _to_distance
+
+ANN_PARAMS_FILE = "ann_params.json"
+
+class AnnIndex(FlatIndex, ABC):
+    """近似最近邻检索后端的公共部分
+
+    记录、元数据和过滤逻辑沿用 FlatIndex，检索时改用 ANN 索引取候选。
+    构建参数与索引一起持久化，重新打开时沿用建库时的参数；
+    查询参数（如 ef_search）可随时调整。
+    过滤条件选择性很高或数据量较小时直接在候选行上做精确检索。
+    删除的记录在 ANN 中保留到 compact 时才随索引重建一起移除，检索时按掩码排除。
+    """
+    backend_name = ""
+    index_file = ""
+    default_params: Dict[str, Any] = {}
+    # 只影响查询、不影响索引结构的参数
+    search_params: Tuple[str, ...] = ()
+
+    def __init__(
+        self,
+        embedding: Embeddings,
+        persist_directory: Optional[str] = None,
+        params: Optional[Dict[str, Any]] = None,
+        exact_threshold: int = 2048
+    ):
+        unknown = set(params or {}) - set(self.default_params)
+        if unknown:
+            raise ValueError(f"Unknown {self.backend_name} index params: {sorted(unknown)}")
+        self._explicit_params = dict(params or {})
+        self.params = {**self.default_params, **self._explicit_params}
+        # 候选行不超过该数量时直接精确检索
+        self.exact_threshold = exact_threshold
+        super().__init__(embedding, persist_directory)
+
+    def _reset(self):
+        super()._reset()
+        self._ann = None
+        self._ann_rows = 0
+        self._ann_stale = False
+
+    # ---------- 存储 ----------
+
+    def _load(self):
+        super()._load()
+        params_path = os.path.join(self.persist_directory, ANN_PARAMS_FILE)
+        if not os.path.exists(params_path):
+            return
+        with open(params_path, "r", encoding="utf-8") as f:
+            stored = json.load(f)
+        if stored["backend"] != self.backend_name:
+            raise ValueError(
+                f"Index at {self.persist_directory} was built with {stored['backend']}, not {self.backend_name}"
+            )
+        # 构建参数以已有索引为准，查询参数以显式传入的为准
+        for key, value in stored["params"].items():
+            if key in self.search_params and key in self._explicit_params:
+                continue
+            if key in self._explicit_params and self._explicit_params[key] != value:
+                print(f"索引已使用 {key}={value} 构建，忽略传入的 {key}={self._explicit_params[key]}")
+            self.params[key] = value
+        index_path = os.path.join(self.persist_directory, self.index_file)
+        if stored.get("rows") == self._size and os.path.exists(index_path) and self._size:
+            self._ann = self._load_ann(index_path)
+            self._ann_rows = self._size
+            self._apply_search_params()
+
+    def persist(self):
+        """持久化记录、ANN 索引以及索引参数"""
+        super().persist()
+        with self._lock:
+            self._sync_ann()
+            if self._ann is not None:
+                index_path = os.path.join(self.persist_directory, self.index_file)
+                self._save_ann(index_path + ".tmp")
+                os.replace(index_path + ".tmp", index_path)
+            params_path = os.path.join(self.persist_directory, ANN_PARAMS_FILE)
+            with open(params_path + ".tmp", "w", encoding="utf-8") as f:
+                json.dump({
+                    "backend": self.backend_name,
+                    "params": self.params,
+                    "rows": self._ann_rows if self._ann is not None else 0
+                }, f)
+            os.replace(params_path + ".tmp", params_path)
+
+    # ---------- 写入 ----------
+
+    def add_embeddings(self, texts, embeddings, metadatas=None, ids=None) -> List[str]:
+        with self._lock:
+            # 覆盖已有行时 ANN 中的旧向量失效，需要重建
+            if ids is not None and any(chunk_id in self._id_to_row for chunk_id in ids):
+                self._ann_stale = True
+            return super().add_embeddings(texts, embeddings, metadatas, ids)
+
+    def _build_compacted(self, source: Dict[str, Any]) -> Dict[str, Any]:
+        # 行号重排后索引失效，与压缩后的数据一起在锁外重建，不由下一次查询承担
+        compacted = super()._build_compacted(source)
+        vectors = compacted["vectors"]
+        compacted["ann"] = self._build_ann(np.ascontiguousarray(vectors)) if len(vectors) else None
+        return compacted
+
+    def _install_compacted(self, compacted: Dict[str, Any]):
+        super()._install_compacted(compacted)
+        self._ann = compacted["ann"]
+        self._ann_rows = self._size if self._ann is not None else 0
+        self._ann_stale = False
+        if self._ann is not None:
+            self._apply_search_params()
+
+    def _sync_ann(self):
+        """把尚未建入 ANN 的行加入索引，必要时整体重建"""
+        if not self._size:
+            self._ann = None
+            self._ann_rows = 0
+            return
+        if self._ann is None or self._ann_stale:
+            self._ann = self._build_ann(np.ascontiguousarray(self._vectors[:self._size]))
+            self._ann_stale = False
+        elif self._ann_rows < self._size:
+            self._add_to_ann(np.ascontiguousarray(self._vectors[self._ann_rows:self._size]), self._ann_rows)
+        else:
+            return
+        self._ann_rows = self._size
+        self._apply_search_params()
+
+    # ---------- 查询 ----------
+
+    def set_search_params(self, **params):
+        """调整查询参数，在召回率与延迟之间权衡"""
+        unknown = set(params) - set(self.search_params)
+        if unknown:
+            raise ValueError(f"Not a search-time param for {self.backend_name}: {sorted(unknown)}")
+        with self._lock:
+            self.params.update(params)
+            self._explicit_params.update(params)
+            if self._ann is not None:
+                self._apply_search_params()
+
+    def _search(self, query_vectors: np.ndarray, k: int, mask: np.ndarray) -> List[List[Tuple[int, float]]]:
+        allowed = int(mask.sum())
+        if allowed <= max(k, self.exact_threshold):
+            return self._exact_search(query_vectors, k, mask)
+        self._sync_ann()
+        if self._ann is None:
+            return self._exact_search(query_vectors, k, mask)
+        # 有过滤条件时按选择性多取候选，再在结果中过滤
+        fetch = k if allowed == self._size else int(np.ceil(k * self._size / allowed)) * 2
+        rows, similarities = self._query_ann(query_vectors, min(fetch, self._size))
+        results = []
+        for i in range(len(query_vectors)):
+            hits = [
+                (int(row), _to_distance(similarity))
+                for row, similarity in zip(rows[i], similarities[i])
+                if 0 <= row < self._size and mask[row]
+            ][:k]
+            if len(hits) < min(k, allowed):
+                # 候选不足时退回到精确检索
+                hits = self._exact_search(query_vectors[i:i + 1], k, mask)[0]
+            results.append(hits)
+        return results
+
+    # ---------- 子类实现 ----------
+
+    @abstractmethod
+    def _build_ann(self, vectors: np.ndarray):
+        """用全部向量构建 ANN 索引并返回，不修改实例状态（compact 在锁外调用）"""
+
+    @abstractmethod
+    def _add_to_ann(self, vectors: np.ndarray, start: int):
+        """把从 start 行开始的新向量加入当前索引"""
+
+    @abstractmethod
+    def _apply_search_params(self):
+        """把查询参数应用到当前索引"""
+
+    @abstractmethod
+    def _query_ann(self, query_vectors: np.ndarray, fetch: int) -> Tuple[np.ndarray, np.ndarray]:
+        """返回候选行号和对应的内积相似度"""
+
+    @abstractmethod
+    def _save_ann(self, path: str):
+        """把当前索引写入 path"""
+
+    @abstractmethod
+    def _load_ann(self, path: str):
+        """从 path 读取并返回索引"""
+
+class HnswIndex(AnnIndex):
+    """基于 hnswlib 的 HNSW 检索后端"""
+    backend_name = "hnsw"
+    index_file = "hnsw.bin"
+    default_params = {"M": 16, "ef_construction": 200, "ef_search": 64}
+    search_params = ("ef_search",)
+
+    @staticmethod
+    def _hnswlib():
+        try:
+            import hnswlib
+        except ImportError:
+            raise ImportError(
+                "Could not import hnswlib python package. "
+                "It ships with chromadb as chroma-hnswlib, "
+                "or install it with `pip install chroma-hnswlib`."
+            )
+        return hnswlib
+
+    def _build_ann(self, vectors: np.ndarray):
+        index = self._hnswlib().Index(space="ip", dim=vectors.shape[1])
+        index.init_index(
+            max_elements=max(len(vectors), 1024),
+            M=self.params["M"],
+            ef_construction=self.params["ef_construction"]
+        )
+        index.add_items(vectors, np.arange(len(vectors)))
+        return index
+
+    def _add_to_ann(self, vectors: np.ndarray, start: int):
+        needed = start + len(vectors)
+        if needed > self._ann.get_max_elements():
+            self._ann.resize_index(max(needed, self._ann.get_max_elements() * 2))
+        self._ann.add_items(vectors, np.arange(start, needed))
+
+    def _apply_search_params(self):
+        self._ann.set_ef(self.params["ef_search"])
+
+    def _query_ann(self, query_vectors: np.ndarray, fetch: int) -> Tuple[np.ndarray, np.ndarray]:
+        # ef 不能小于要取的候选数
+        self._ann.set_ef(max(self.params["ef_search"], fetch))
+        labels, distances = self._ann.knn_query(query_vectors, k=fetch)
+        # ip 空间的距离为 1 - 内积
+        return labels.astype(np.int64), 1 - distances
+
+    def _save_ann(self, path: str):
+        self._ann.save_index(path)
+
+    def _load_ann(self, path: str):
+        index = self._hnswlib().Index(space="ip", dim=self._vectors.shape[1])
+        index.load_index(path, max_elements=self._size)
+        return index
+
+class FaissIndex(AnnIndex):
+    """基于 faiss-cpu 的检索后端，支持 HNSW 和 IVF 两种索引"""
+    backend_name = "faiss"
+    index_file = "faiss.index"
+    default_params = {
+        "index_type": "hnsw",
+        "M": 32,
+        "ef_construction": 200,
+        "ef_search": 64,
+        "nlist": 1024,
+        "nprobe": 16
+    }
+    search_params = ("ef_search", "nprobe")
+
+    @staticmethod
+    def _faiss():
+        try:
+            import faiss
+        except ImportError:
+            raise ImportError(
+                "Could not import faiss python package. "
+                "Please install it with `pip install faiss-cpu`."
+            )
+        return faiss
+
+    def _ivf_nlist(self, rows: int) -> int:
+        """rows 行数据可训练的聚类中心数：每个聚类中心至少需要约39个训练样本"""
+        return max(1, min(self.params["nlist"], rows // 39))
+
+    def _sync_ann(self):
+        # 数据量较少时建出的 IVF 聚类中心数不足，可用的聚类中心数翻倍后重新训练
+        if (
+            self.params["index_type"] == "ivf" and self._ann is not None
+            and self._ivf_nlist(self._size) >= 2 * self._ann.nlist
+        ):
+            self._ann_stale = True
+        super()._sync_ann()
+
+    def _build_ann(self, vectors: np.ndarray):
+        faiss = self._faiss()
+        dim = vectors.shape[1]
+        index_type = self.params["index_type"]
+        if index_type == "hnsw":
+            index = faiss.IndexHNSWFlat(dim, self.params["M"], faiss.METRIC_INNER_PRODUCT)
+            index.hnsw.efConstruction = self.params["ef_construction"]
+        elif index_type == "ivf":
+            nlist = self._ivf_nlist(len(vectors))
+            index = faiss.IndexIVFFlat(faiss.IndexFlatIP(dim), dim, nlist, faiss.METRIC_INNER_PRODUCT)
+            index.train(vectors)
+        else:
+            raise ValueError(f"Unknown faiss index_type: {index_type}")
+        # faiss 按加入顺序分配编号，与行号一致
+        index.add(vectors)
+        return index
+
+    def _add_to_ann(self, vectors: np.ndarray, start: int):
+        self._ann.add(vectors)
+
+    def _apply_search_params(self):
+        if self.params["index_type"] == "hnsw":
+            self._ann.hnsw.efSearch = self.params["ef_search"]
+        else:
+            self._ann.nprobe = self.params["nprobe"]
+
+    def _query_ann(self, query_vectors: np.ndarray, fetch: int) -> Tuple[np.ndarray, np.ndarray]:
+        if self.params["index_type"] == "hnsw":
+            self._ann.hnsw.efSearch = max(self.params["ef_search"], fetch)
+        similarities, labels = self._ann.search(np.ascontiguousarray(query_vectors), fetch)
+        return labels, similarities
+
+    def _save_ann(self, path: str):
+        self._faiss().write_index(self._ann, path)
+
+    def _load_ann(self, path: str):
+        return self._faiss().read_index(path)
@@ -5,9 +5,11 @@ from langchain_core.output_parsers import StrOutputParser
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.runnables import RunnableBranch, RunnablePassthrough
 from vector_store import VectorStore
+from sharded_store import ShardedVectorStore
 from zhipuai_embedding import ZhipuAIEmbeddings
 from deepseek_llm import DeepSeekChat
 from search_manager import SearchManager
+from snapshot import is_snapshot
 from datetime import datetime, timedelta
 
 # 加载环境变量
@@ -16,6 +18,23 @@ load_dotenv()
 def get_search_manager():
     """获取搜索管理器"""
     embedding = ZhipuAIEmbeddings()
+    if is_snapshot("../vector_db_snapshot"):
+        # 有快照时以只读方式映射快照文件，启动时无需打开 Chroma；
+        # 多个应用进程共享同一份映射，main.py 发布新版本后自动切换
+        vector_store = VectorStore(
+            embedding=embedding,
+            persist_directory="../vector_db_snapshot",
+            backend="snapshot",
+            read_only=True
+        )
+        return SearchManager(vector_store)
+    if os.path.isdir("../vector_db_shards"):
+        # 按领域分片的向量库，查询时并行检索各分片
+        vector_store = ShardedVectorStore(
+            embedding=embedding,
+            persist_directory="../vector_db_shards"
+        )
+        return SearchManager(vector_store)
     vector_store = VectorStore(
         embedding=embedding,
         persist_directory="../vector_db"
@@ -0,0 +1,144 @@
+import os
+import json
+import hashlib
+from datetime import datetime
+from typing import List, Dict, Any, Optional
+
+try:
+    from .document_processor import DocumentProcessor
+    from .ingest_pipeline import IngestionPipeline
+    from .near_duplicates import DuplicateRegistry
+except ImportError:
+    from document_processor import DocumentProcessor
+    from ingest_pipeline import IngestionPipeline
+    from near_duplicates import DuplicateRegistry
+
+MANIFEST_VERSION = 1
+
+def file_hash(path: str, block_size: int = 1 << 20) -> str:
+    """文件内容的 SHA-256"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+class DirectorySync:
+    """按文件清单增量同步目录到向量库
+
+    清单记录每个文件的路径、大小、修改时间和内容哈希：
+    大小和修改时间都未变的文件直接跳过，不读取内容；变化的文件再比较哈希，
+    只有新增或内容变化的文件会重新加载、分块和嵌入，已删除文件的分块从向量库中移除。
+    加载失败的文件保留旧的清单项，下次同步时重试；不支持类型的文件不加入清单，也不计算哈希。
+    设置 dedup_distance 时跨文件合并近似重复的分块（如同一讲义的 .txt 和 .json 版本），
+    保留分块记录全部来源，登记表保存在清单旁；删除其中一个文件时只去掉该来源，其他副本仍在时分块保留。
+    """
+    def __init__(
+        self,
+        processor: DocumentProcessor,
+        vector_store,
+        manifest_path: str,
+        always_hash: bool = False,
+        batch_size: int = 64,
+        queue_size: int = 4,
+        dedup_distance: Optional[int] = 3
+    ):
+        self.processor = processor
+        self.vector_store = vector_store
+        self.manifest_path = manifest_path
+        # 为 True 时即使大小和修改时间未变也比较哈希
+        self.always_hash = always_hash
+        duplicates = None
+        if dedup_distance is not None:
+            duplicates = DuplicateRegistry(
+                os.path.splitext(manifest_path)[0] + ".duplicates.json",
+                max_distance=dedup_distance
+            )
+        self.pipeline = IngestionPipeline(
+            processor,
+            vector_store,
+            batch_size=batch_size,
+            queue_size=queue_size,
+            duplicates=duplicates
+        )
+
+    def load_manifest(self) -> Dict[str, Dict[str, Any]]:
+        """读取文件清单，不存在或格式不符时返回空清单"""
+        try:
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+        except FileNotFoundError:
+            return {}
+        if manifest.get("version") != MANIFEST_VERSION:
+            print(f"文件清单版本不符，将重新同步全部文件: {self.manifest_path}")
+            return {}
+        return manifest["files"]
+
+    def _save_manifest(self, files: Dict[str, Dict[str, Any]]):
+        directory = os.path.dirname(self.manifest_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.manifest_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump({
+                "version": MANIFEST_VERSION,
+                "synced_at": datetime.now().isoformat(),
+                "files": files
+            }, f, ensure_ascii=False, indent=2)
+        os.replace(self.manifest_path + ".tmp", self.manifest_path)
+
+    def sync(self, folder_path: str) -> Dict[str, int]:
+        """
+        增量同步目录
+
+        Returns:
+            Dict: 新增、变化、删除、未变化和失败的文件数，以及新增、未变化、合并的近似重复和移除的分块数
+        """
+        previous = self.load_manifest()
+        files: Dict[str, Dict[str, Any]] = {}
+        changed: List[str] = []
+        stats = {
+            "added_files": 0, "changed_files": 0, "deleted_files": 0, "unchanged_files": 0, "failed_files": 0,
+            "added": 0, "unchanged": 0, "duplicates": 0, "removed": 0
+        }
+
+        for path in self.processor.list_files(folder_path):
+            stat = os.stat(path)
+            entry = {"size": stat.st_size, "mtime": stat.st_mtime, "sha256": None}
+            old = previous.get(path)
+            if old and not self.always_hash and old["size"] == entry["size"] and old["mtime"] == entry["mtime"]:
+                files[path] = old
+                stats["unchanged_files"] += 1
+                continue
+            entry["sha256"] = file_hash(path)
+            if old and old["sha256"] == entry["sha256"]:
+                # 只有修改时间变化（如被重新复制），内容未变
+                files[path] = entry
+                stats["unchanged_files"] += 1
+                continue
+            stats["changed_files" if old else "added_files"] += 1
+            changed.append(path)
+            files[path] = entry
+
+        # 已删除的文件
+        deleted = [path for path in previous if path not in files]
+        if deleted:
+            stats["removed"] += self.pipeline.remove_sources(deleted)
+            stats["deleted_files"] = len(deleted)
+
+        if changed:
+            pipeline_stats = self.pipeline.run(changed)
+            for key in ("added", "unchanged", "duplicates", "removed"):
+                stats[key] += pipeline_stats[key]
+            for report in self.pipeline.last_report:
+                if report["error"]:
+                    stats["failed_files"] += 1
+                    # 失败的文件恢复旧的清单项（新文件不记录），下次同步时重试
+                    if report["path"] in previous:
+                        files[report["path"]] = previous[report["path"]]
+                    else:
+                        del files[report["path"]]
+        else:
+            self.vector_store.flush()
+
+        self._save_manifest(files)
+        return stats
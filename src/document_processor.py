@@ -1,10 +1,14 @@
 import os
 import json
 import csv
+import time
+import itertools
+import multiprocessing
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor
 from datetime import datetime
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterable, Iterator, Optional, Tuple
 from langchain_community.document_loaders import (
-    PyMuPDFLoader, 
     UnstructuredMarkdownLoader,
     TextLoader,
     CSVLoader,
@@ -13,17 +17,76 @@ from langchain_community.document_loaders import (
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_core.documents import Document
 
+try:
+    from .text_splitter import CJKTextSplitter
+    from .near_duplicates import collapse_near_duplicates
+    from .pdf_loader import PdfLoader, PageTextCache
+except ImportError:
+    from text_splitter import CJKTextSplitter
+    from near_duplicates import collapse_near_duplicates
+    from pdf_loader import PdfLoader, PageTextCache
+
+# 可选的文本分割器
+SPLITTERS = ("cjk", "recursive")
+
+# 支持加载的文件类型（扩展名）
+FILE_TYPES = ("pdf", "md", "txt", "csv", "json")
+
+# 工作进程内的文档处理器，由进程池初始化
+_worker_processor: Optional["DocumentProcessor"] = None
+
+def _init_worker(chunk_size: int, chunk_overlap: int, splitter: str, pdf_cache_dir: Optional[str]):
+    global _worker_processor
+    _worker_processor = DocumentProcessor(
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        splitter=splitter,
+        pdf_cache_dir=pdf_cache_dir
+    )
+
+def _process_file_task(task: Tuple[str, bool]) -> Tuple[List[Document], Dict[str, Any]]:
+    file_path, split = task
+    return _worker_processor._process_file(file_path, split)
+
 class DocumentProcessor:
-    def __init__(self, chunk_size: int = 500, chunk_overlap: int = 50):
+    def __init__(
+        self,
+        chunk_size: int = 500,
+        chunk_overlap: int = 50,
+        workers: Optional[int] = 1,
+        splitter: str = "cjk",
+        dedup_distance: Optional[int] = None,
+        pdf_cache_dir: Optional[str] = None
+    ):
+        if splitter not in SPLITTERS:
+            raise ValueError(f"Unknown splitter: {splitter}, expected one of {SPLITTERS}")
         self._chunk_size = chunk_size
         self._chunk_overlap = chunk_overlap
+        # cjk 按中英文句末标点和 Markdown 标题切分，recursive 为 LangChain 的递归字符分割器
+        self.splitter = splitter
+        # 合并近似重复分块的 SimHash 汉明距离阈值（64 位中不同的位数），None 为不去重；
+        # 较短的分块从不合并
+        self.dedup_distance = dedup_distance
+        # PDF 逐页文本缓存，按文件内容寻址，重复上传的 PDF 不再解析；None 为不缓存
+        self.pdf_cache_dir = pdf_cache_dir
+        self.page_cache = PageTextCache(pdf_cache_dir) if pdf_cache_dir else None
+        # 并行加载文件的进程数，1 为在当前进程中逐个加载，None 为 CPU 核数
+        self.workers = workers
+        # 最近一次 load_documents/process_documents 中每个文件的加载结果
+        self.last_report: List[Dict[str, Any]] = []
         self._create_text_splitter()
     
     def _create_text_splitter(self):
         """创建文本分割器"""
+        if self.splitter == "cjk":
+            # 分块的元数据中记录起止偏移 start_index/end_index
+            self.text_splitter = CJKTextSplitter(chunk_size=self._chunk_size, chunk_overlap=self._chunk_overlap)
+            return
         self.text_splitter = RecursiveCharacterTextSplitter(
             chunk_size=self._chunk_size,
-            chunk_overlap=self._chunk_overlap
+            chunk_overlap=self._chunk_overlap,
+            # 记录分块在原文中的偏移，用于生成稳定的分块ID
+            add_start_index=True
         )
     
     @property
@@ -46,65 +109,216 @@ class DocumentProcessor:
     
     def load_document(self, file_path: str) -> List[Document]:
         """加载单个文档"""
-        file_type = file_path.split('.')[-1].lower()
+        if self._file_type(file_path) not in FILE_TYPES:
+            print(f"不支持的文件类型: {self._file_type(file_path)}")
+            return []
         try:
-            if file_type == 'pdf':
-                loader = PyMuPDFLoader(file_path)
-            elif file_type == 'md':
-                loader = UnstructuredMarkdownLoader(file_path)
-            elif file_type == 'txt':
-                loader = TextLoader(file_path, encoding='utf-8')
-            elif file_type == 'csv':
-                loader = CSVLoader(
-                    file_path=file_path,
-                    encoding='utf-8',
-                    csv_args={
-                        'delimiter': ',',
-                        'quotechar': '"'
-                    }
-                )
-            elif file_type == 'json':
-                loader = JSONLoader(
-                    file_path=file_path,
-                    jq_schema='.[]',
-                    text_content=False
-                )
-            else:
-                print(f"不支持的文件类型: {file_type}")
-                return []
-            
-            documents = loader.load()
-            # 添加日期元数据
-            current_date = datetime.now().strftime("%Y-%m-%d")
-            for doc in documents:
-                if "date" not in doc.metadata:
-                    doc.metadata["date"] = current_date
-            
+            documents = self._load_file(file_path)
             print(f"成功加载文件: {file_path}")
             return documents
         except Exception as e:
             print(f"加载文件 {file_path} 时出错: {str(e)}")
             return []
     
-    def load_documents(self, folder_path: str) -> List[Document]:
-        """加载指定文件夹下的所有文档"""
+    def _load_file(self, file_path: str) -> List[Document]:
+        """加载单个文档，出错时抛出异常"""
+        return list(self.iter_document(file_path))
+    
+    def iter_document(self, file_path: str, executor: Optional[Executor] = None) -> Iterator[Document]:
+        """
+        逐个产出文件中的文档（如 PDF 逐页），不把整个文件的结果一次读入内存，出错时抛出异常
+        
+        PDF 按页区间在 executor（未提供时按 workers 自行启动）的工作进程中并行提取
+        """
+        file_type = self._file_type(file_path)
+        if file_type == 'pdf':
+            loader = PdfLoader(
+                file_path,
+                workers=self.workers or os.cpu_count() or 1,
+                executor=executor,
+                cache=self.page_cache
+            )
+        elif file_type == 'md':
+            loader = UnstructuredMarkdownLoader(file_path)
+        elif file_type == 'txt':
+            loader = TextLoader(file_path, encoding='utf-8')
+        elif file_type == 'csv':
+            loader = CSVLoader(
+                file_path=file_path,
+                encoding='utf-8',
+                csv_args={
+                    'delimiter': ',',
+                    'quotechar': '"'
+                }
+            )
+        elif file_type == 'json':
+            loader = JSONLoader(
+                file_path=file_path,
+                jq_schema='.[]',
+                text_content=False
+            )
+        else:
+            raise ValueError(f"Unsupported file type: {file_type}")
+        
+        # 添加日期元数据
+        current_date = datetime.now().strftime("%Y-%m-%d")
+        for doc in loader.lazy_load():
+            if "date" not in doc.metadata:
+                doc.metadata["date"] = current_date
+            yield doc
+    
+    def _process_file(self, file_path: str, split: bool) -> Tuple[List[Document], Dict[str, Any]]:
+        """加载（并分块）一个文件，返回文档和该文件的加载结果"""
+        started = time.perf_counter()
+        report = {"path": file_path, "documents": 0, "seconds": 0.0, "error": None}
+        try:
+            documents = self._load_file(file_path)
+            if split:
+                documents = self.split_documents(documents)
+            report["documents"] = len(documents)
+        except Exception as e:
+            documents = []
+            report["error"] = f"{type(e).__name__}: {e}"
+        report["seconds"] = time.perf_counter() - started
+        return documents, report
+    
+    def _iter_file(self, file_path: str, split: bool, executor: Executor) -> Tuple[Iterator[Document], Dict[str, Any]]:
+        """在当前进程中逐页产出 PDF 的文档（页面提取交给 executor 并行），加载结果在迭代结束后填写"""
+        report = {"path": file_path, "documents": 0, "seconds": 0.0, "error": None}
+        
+        def documents() -> Iterator[Document]:
+            pages = self.iter_document(file_path, executor)
+            while True:
+                # 只统计加载和分块的耗时，不含调用方处理每页的时间
+                started = time.perf_counter()
+                try:
+                    page = next(pages, None)
+                    chunks = [] if page is None else self.split_documents([page]) if split else [page]
+                except Exception as e:
+                    report["error"] = f"{type(e).__name__}: {e}"
+                    page = None
+                report["seconds"] += time.perf_counter() - started
+                if page is None:
+                    return
+                report["documents"] += len(chunks)
+                yield from chunks
+        
+        return documents(), report
+    
+    @staticmethod
+    def _file_type(file_path: str) -> str:
+        return file_path.split('.')[-1].lower()
+    
+    @classmethod
+    def _is_pdf(cls, file_path: str) -> bool:
+        return cls._file_type(file_path) == 'pdf'
+    
+    def list_files(self, folder_path: str) -> List[str]:
+        """文件夹下支持加载的全部文件，按路径排序以保证结果顺序固定；其他类型的文件跳过"""
         file_paths = []
+        skipped = 0
         for root, _, files in os.walk(folder_path):
             for file in files:
-                file_path = os.path.join(root, file)
-                file_paths.append(file_path)
-        
-        documents = []
-        for file_path in file_paths:
-            documents.extend(self.load_document(file_path))
+                if self._file_type(file) in FILE_TYPES:
+                    file_paths.append(os.path.join(root, file))
+                else:
+                    skipped += 1
+        if skipped:
+            print(f"跳过了 {skipped} 个不支持类型的文件")
+        return sorted(file_paths)
+    
+    def _executor(self, workers: int) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(self._chunk_size, self._chunk_overlap, self.splitter, self.pdf_cache_dir)
+        )
+    
+    @staticmethod
+    def _result(future, file_path: str) -> Tuple[List[Document], Dict[str, Any]]:
+        try:
+            return future.result()
+        except Exception as e:
+            # 工作进程异常退出等情况
+            return [], {"path": file_path, "documents": 0, "seconds": 0.0, "error": f"{type(e).__name__}: {e}"}
+    
+    def _process_files(self, file_paths: List[str], split: bool) -> List[Document]:
+        """加载多个文件，结果按文件路径的顺序合并，每个文件的结果记录在 last_report 中"""
+        workers = self.workers or os.cpu_count() or 1
+        if workers <= 1 or len(file_paths) <= 1:
+            results = [self._process_file(file_path, split) for file_path in file_paths]
+        else:
+            # 大文件先提交，避免最后只剩一个大文件在单核上处理；
+            # PDF 不整份交给一个进程，而是按页区间分给全部进程
+            order = sorted(range(len(file_paths)), key=lambda i: -os.path.getsize(file_paths[i]))
+            with self._executor(min(workers, len(file_paths))) as executor:
+                futures = {
+                    i: executor.submit(_process_file_task, (file_paths[i], split))
+                    for i in order if not self._is_pdf(file_paths[i])
+                }
+                results = []
+                for i, file_path in enumerate(file_paths):
+                    if i in futures:
+                        results.append(self._result(futures[i], file_path))
+                        continue
+                    documents, report = self._iter_file(file_path, split, executor)
+                    documents = list(documents)
+                    results.append(([] if report["error"] else documents, report))
+        self.last_report = [report for _, report in results]
+        return [doc for documents, _ in results for doc in documents]
+    
+    def iter_files(self, file_paths: List[str], split: bool = False) -> Iterator[Tuple[Iterable[Document], Dict[str, Any]]]:
+        """
+        按顺序逐个产出每个文件的文档和加载结果
         
-        return documents
+        多进程时最多同时处理 2 × workers 个文件，内存占用不随文件数增长；
+        PDF 按页区间分给全部进程并行提取，其文档为逐页产出的迭代器，加载结果在迭代结束后填写
+        """
+        workers = self.workers or os.cpu_count() or 1
+        if workers <= 1:
+            for file_path in file_paths:
+                yield self._process_file(file_path, split)
+            return
+        with self._executor(workers) as executor:
+            def submit(file_path: str):
+                # PDF 轮到时再提交各页区间
+                return None if self._is_pdf(file_path) else executor.submit(_process_file_task, (file_path, split))
+            
+            pending = deque()
+            paths = iter(file_paths)
+            for file_path in itertools.islice(paths, 2 * workers):
+                pending.append((file_path, submit(file_path)))
+            while pending:
+                file_path, future = pending.popleft()
+                next_path = next(paths, None)
+                if next_path is not None:
+                    pending.append((next_path, submit(next_path)))
+                if future is None:
+                    yield self._iter_file(file_path, split, executor)
+                else:
+                    yield self._result(future, file_path)
+    
+    def load_documents(self, folder_path: str) -> List[Document]:
+        """加载指定文件夹下的所有文档（workers 大于1时多进程并行加载）"""
+        return self._process_files(self.list_files(folder_path), split=False)
     
     def split_documents(self, documents: List[Document]) -> List[Document]:
-        """将文档分割成更小的块"""
-        return self.text_splitter.split_documents(documents)
+        """将文档分割成更小的块，设置了 dedup_distance 时合并其中近似重复的分块"""
+        return self.deduplicate(self.text_splitter.split_documents(documents))
+    
+    def deduplicate(self, chunks: List[Document]) -> List[Document]:
+        """合并近似重复的分块，只保留每组中第一次出现的分块"""
+        if self.dedup_distance is None:
+            return chunks
+        return collapse_near_duplicates(chunks, self.dedup_distance)
     
     def process_documents(self, folder_path: str) -> List[Document]:
-        """处理文档的完整流程"""
-        documents = self.load_documents(folder_path)
-        return self.split_documents(documents) 
\ No newline at end of file
+        """处理文档的完整流程，加载和分块都在工作进程中完成，近似重复的分块跨文件合并"""
+        chunks = self._process_files(self.list_files(folder_path), split=True)
+        if self.dedup_distance is None:
+            return chunks
+        deduplicated = self.deduplicate(chunks)
+        if len(deduplicated) < len(chunks):
+            print(f"合并了 {len(chunks) - len(deduplicated)} 个近似重复的分块")
+        return deduplicated
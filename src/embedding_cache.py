@@ -0,0 +1,140 @@
+import os
+import sqlite3
+import hashlib
+import threading
+from typing import List, Optional, Dict, Sequence, Union
+import numpy as np
+
+class EmbeddingCache:
+    """基于内容寻址的持久化嵌入缓存
+
+    键为模型名加文本的哈希，向量以 float32 二进制存储在 SQLite 中，
+    超过容量上限时按最近最少使用（LRU）淘汰。
+    """
+    def __init__(self, cache_dir: Optional[str] = None, max_entries: int = 200000):
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+            db_path = os.path.join(cache_dir, "embeddings.sqlite3")
+        else:
+            # 使用内存模式
+            db_path = ":memory:"
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_access INTEGER NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_last_access ON embeddings(last_access)"
+        )
+        self._conn.commit()
+        # 逻辑时钟，用于记录访问先后顺序
+        self._clock = self._conn.execute(
+            "SELECT COALESCE(MAX(last_access), 0) FROM embeddings"
+        ).fetchone()[0]
+
+    def _tick(self) -> int:
+        """推进逻辑时钟（调用方需持有锁）"""
+        self._clock += 1
+        return self._clock
+
+    @staticmethod
+    def make_key(model: str, text: str) -> str:
+        """根据模型名和文本内容生成缓存键"""
+        return hashlib.sha256(f"{model}\0{text}".encode("utf-8")).hexdigest()
+
+    def get_many(self, keys: Sequence[str], as_numpy: bool = False) -> List[Optional[Union[List[float], np.ndarray]]]:
+        """批量读取，未命中的位置返回 None
+
+        as_numpy 为 True 时直接返回 float32 数组视图，不构造 Python 列表。
+        """
+        if not keys:
+            return []
+        found: Dict[str, bytes] = {}
+        unique_keys = list(dict.fromkeys(keys))
+        with self._lock:
+            # SQLite 对参数个数有限制，分段查询
+            for i in range(0, len(unique_keys), 500):
+                part = unique_keys[i:i + 500]
+                placeholders = ",".join("?" * len(part))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})",
+                    part
+                ).fetchall()
+                found.update(rows)
+            if found:
+                now = self._tick()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_access = ? WHERE key = ?",
+                    [(now, key) for key in found]
+                )
+                self._conn.commit()
+
+            results = []
+            for key in keys:
+                blob = found.get(key)
+                if blob is None:
+                    self.misses += 1
+                    results.append(None)
+                else:
+                    self.hits += 1
+                    vector = np.frombuffer(blob, dtype=np.float32)
+                    results.append(vector if as_numpy else vector.tolist())
+        return results
+
+    def put_many(self, keys: Sequence[str], vectors: Sequence[Sequence[float]]):
+        """批量写入，并在超出容量时淘汰最久未使用的条目"""
+        if not keys:
+            return
+        blobs = [np.asarray(vector, dtype=np.float32).tobytes() for vector in vectors]
+        with self._lock:
+            now = self._tick()
+            rows = [(key, blob, now) for key, blob in zip(keys, blobs)]
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector, last_access) VALUES (?, ?, ?)",
+                rows
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        """淘汰超出容量上限的条目（调用方需持有锁）"""
+        count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        overflow = count - self.max_entries
+        if overflow > 0:
+            self._conn.execute(
+                "DELETE FROM embeddings WHERE key IN ("
+                "SELECT key FROM embeddings ORDER BY last_access ASC LIMIT ?)",
+                (overflow,)
+            )
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def stats(self) -> Dict[str, int]:
+        """获取命中统计"""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": len(self)
+        }
+
+    def clear(self):
+        """清空缓存并重置计数"""
+        with self._lock:
+            self._conn.execute("DELETE FROM embeddings")
+            self._conn.commit()
+            self.hits = 0
+            self.misses = 0
+
+    def close(self):
+        """关闭数据库连接"""
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,507 @@
+import os
+import json
+import uuid
+import threading
+from typing import List, Dict, Any, Optional, Tuple, Sequence, Set, Union
+import numpy as np
+from langchain_core.documents import Document
+from langchain.embeddings.base import Embeddings
+
+VECTORS_FILE = "vectors.npy"
+RECORDS_FILE = "records.json"
+# compact 在锁外构建时被写入打断的最多次数，超过后在锁内完成
+COMPACT_RETRIES = 3
+# compact 每次复制的行数
+COMPACT_CHUNK_ROWS = 65536
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    """按行归一化为单位向量（零向量保持不变）"""
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+def _to_distance(similarity: float) -> float:
+    """余弦相似度转换为距离：与 Chroma 默认的 l2 一致，即单位向量的平方欧氏距离"""
+    return float(2 - 2 * similarity)
+
+RANGE_OPERATORS = {
+    "$gt": np.greater,
+    "$gte": np.greater_equal,
+    "$lt": np.less,
+    "$lte": np.less_equal
+}
+
+def _is_number(value: Any) -> bool:
+    """是否为数值（bool 除外）"""
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+def _compare(column: np.ndarray, operator: str, value: Any) -> np.ndarray:
+    """对一列元数据求值单个比较条件"""
+    if operator == "$eq":
+        return column == value
+    if operator == "$ne":
+        return column != value
+    if operator == "$in":
+        return np.isin(column, list(value))
+    if operator == "$nin":
+        return ~np.isin(column, list(value))
+    if operator in RANGE_OPERATORS:
+        if column.dtype != object:
+            # 数值列直接向量化比较，NaN（缺失或非数值）比较结果为 False
+            return RANGE_OPERATORS[operator](column, value)
+        # 缺失值或类型不可比较的行视为不满足条件
+        result = np.zeros(len(column), dtype=bool)
+        for i, item in enumerate(column):
+            if item is None or isinstance(item, bool) != isinstance(value, bool):
+                continue
+            try:
+                if operator == "$gt":
+                    result[i] = item > value
+                elif operator == "$gte":
+                    result[i] = item >= value
+                elif operator == "$lt":
+                    result[i] = item < value
+                else:
+                    result[i] = item <= value
+            except TypeError:
+                pass
+        return result
+    raise ValueError(f"Unsupported filter operator: {operator}")
+
+class FlatIndex:
+    """基于 NumPy 的精确检索后端
+
+    归一化后的 float32 向量保存在一个连续矩阵中（持久化后以内存映射方式打开），
+    查询时用一次矩阵向量乘法加 argpartition 得到 top-k。
+    元数据按列保存在旁路表中，过滤条件采用与 Chroma 相同的 where 语法。
+    删除只记录墓碑并立即从结果中排除，由 compact 统一回收空间。
+    接口与 LangChain 的 Chroma 封装保持一致，VectorStore 可以直接替换使用。
+    """
+    def __init__(self, embedding: Embeddings, persist_directory: Optional[str] = None):
+        self.embedding = embedding
+        self.persist_directory = persist_directory
+        self._lock = threading.RLock()
+        # 每次写入加一，compact 据此判断锁外构建期间数据是否被修改
+        self._version = 0
+        self._reset()
+        if persist_directory and os.path.exists(os.path.join(persist_directory, RECORDS_FILE)):
+            self._load()
+
+    def _reset(self):
+        """清空索引"""
+        self._version += 1
+        self._vectors: Optional[np.ndarray] = None
+        self._size = 0
+        self._ids: List[str] = []
+        self._id_to_row: Dict[str, int] = {}
+        self._documents: List[str] = []
+        self._columns: Dict[str, List[Any]] = {}
+        self._column_arrays: Dict[str, np.ndarray] = {}
+        # 已删除但尚未回收的行
+        self._tombstones: Set[int] = set()
+        self._alive: Optional[np.ndarray] = None
+
+    # ---------- 存储 ----------
+
+    def _load(self):
+        """从磁盘加载，向量矩阵以只读内存映射方式打开"""
+        with open(os.path.join(self.persist_directory, RECORDS_FILE), "r", encoding="utf-8") as f:
+            records = json.load(f)
+        self._ids = records["ids"]
+        self._documents = records["documents"]
+        self._columns = records["columns"]
+        self._tombstones = set(records.get("deleted", []))
+        self._id_to_row = {
+            chunk_id: row for row, chunk_id in enumerate(self._ids)
+            if row not in self._tombstones
+        }
+        self._size = len(self._ids)
+        if self._size:
+            self._vectors = np.load(os.path.join(self.persist_directory, VECTORS_FILE), mmap_mode="r")
+
+    def persist(self):
+        """将向量和元数据写入磁盘（先写临时文件再替换，避免写到一半的状态）"""
+        if not self.persist_directory:
+            raise ValueError("Cannot persist index in memory mode")
+        with self._lock:
+            os.makedirs(self.persist_directory, exist_ok=True)
+            vectors_path = os.path.join(self.persist_directory, VECTORS_FILE)
+            records_path = os.path.join(self.persist_directory, RECORDS_FILE)
+            if self._size:
+                with open(vectors_path + ".tmp", "wb") as f:
+                    np.save(f, np.ascontiguousarray(self._vectors[:self._size]))
+                os.replace(vectors_path + ".tmp", vectors_path)
+            with open(records_path + ".tmp", "w", encoding="utf-8") as f:
+                json.dump({
+                    "ids": self._ids,
+                    "documents": self._documents,
+                    "columns": self._columns,
+                    "deleted": sorted(self._tombstones)
+                }, f, ensure_ascii=False)
+            os.replace(records_path + ".tmp", records_path)
+
+    def _reserve(self, rows: int, dim: int):
+        """保证向量矩阵有足够容量，容量不足时按倍数扩容"""
+        if self._vectors is not None and self._vectors.shape[1] != dim:
+            raise ValueError(f"Embedding dimension mismatch: expected {self._vectors.shape[1]}, got {dim}")
+        capacity = 0 if self._vectors is None else self._vectors.shape[0]
+        writable = self._vectors is not None and self._vectors.flags.writeable
+        if capacity >= self._size + rows and writable:
+            return
+        new_capacity = max(self._size + rows, capacity * 2 if writable else capacity, 64)
+        vectors = self._allocate(new_capacity, dim)
+        if self._size:
+            # 内存映射的矩阵只读，首次写入时复制到内存
+            vectors[:self._size] = self._vectors[:self._size]
+        self._vectors = vectors
+
+    def _allocate(self, rows: int, dim: int) -> np.ndarray:
+        """分配 rows 行的可写向量矩阵"""
+        return np.empty((rows, dim), dtype=np.float32)
+
+    def _set_metadata(self, row: int, metadata: Optional[Dict[str, Any]]):
+        """写入一行元数据"""
+        metadata = metadata or {}
+        for key in metadata:
+            if key not in self._columns:
+                self._columns[key] = [None] * self._size
+        for key, column in self._columns.items():
+            value = metadata.get(key)
+            if row == len(column):
+                column.append(value)
+            else:
+                column[row] = value
+
+    # ---------- 写入 ----------
+
+    def add_embeddings(
+        self,
+        texts: Sequence[str],
+        embeddings: Union[np.ndarray, List[List[float]]],
+        metadatas: Optional[List[Dict[str, Any]]] = None,
+        ids: Optional[List[str]] = None
+    ) -> List[str]:
+        """添加已计算好的向量，ID 已存在时覆盖原记录"""
+        texts = list(texts)
+        if ids is None:
+            ids = [str(uuid.uuid4()) for _ in texts]
+        metadatas = metadatas or [None] * len(texts)
+        if not texts:
+            return ids
+        vectors = _normalize(np.asarray(embeddings, dtype=np.float32).reshape(len(texts), -1))
+        with self._lock:
+            self._reserve(len(texts), vectors.shape[1])
+            for text, vector, metadata, chunk_id in zip(texts, vectors, metadatas, ids):
+                row = self._id_to_row.get(chunk_id)
+                if row is None:
+                    row = self._size
+                    self._id_to_row[chunk_id] = row
+                    self._ids.append(chunk_id)
+                    self._documents.append(text)
+                    self._size += 1
+                else:
+                    self._documents[row] = text
+                self._vectors[row] = vector
+                self._set_metadata(row, metadata)
+            self._column_arrays = {}
+            self._alive = None
+            self._version += 1
+        return ids
+
+    def add_texts(
+        self,
+        texts: Sequence[str],
+        metadatas: Optional[List[Dict[str, Any]]] = None,
+        ids: Optional[List[str]] = None
+    ) -> List[str]:
+        """嵌入文本并添加到索引"""
+        texts = list(texts)
+        if not texts:
+            return []
+        return self.add_embeddings(texts, self.embedding.embed_documents(texts), metadatas, ids)
+
+    def add_documents(self, documents: List[Document], ids: Optional[List[str]] = None) -> List[str]:
+        """添加文档"""
+        return self.add_texts(
+            [doc.page_content for doc in documents],
+            [doc.metadata for doc in documents],
+            ids
+        )
+
+    def update_metadata(self, ids: Sequence[str], metadatas: List[Dict[str, Any]]) -> int:
+        """替换已有记录的元数据，不存在的ID被忽略，返回更新的数量"""
+        with self._lock:
+            updated = 0
+            for chunk_id, metadata in zip(ids, metadatas):
+                row = self._id_to_row.get(chunk_id)
+                if row is not None:
+                    self._set_metadata(row, metadata)
+                    updated += 1
+            if updated:
+                self._column_arrays = {}
+                self._version += 1
+            return updated
+
+    def delete(self, ids: Optional[List[str]] = None) -> int:
+        """按ID删除记录：只记为墓碑并立即从检索结果中排除，返回删除的数量"""
+        if not ids:
+            return 0
+        with self._lock:
+            removed = 0
+            for chunk_id in ids:
+                row = self._id_to_row.pop(chunk_id, None)
+                if row is not None:
+                    self._tombstones.add(row)
+                    removed += 1
+            if removed:
+                self._alive = None
+                self._version += 1
+            return removed
+
+    def clear(self) -> int:
+        """删除全部记录，返回删除的数量"""
+        with self._lock:
+            removed = self.count()
+            self._reset()
+            return removed
+
+    def tombstone_count(self) -> int:
+        """尚未回收的已删除记录数量"""
+        return len(self._tombstones)
+
+    def compact(self) -> int:
+        """回收墓碑记录占用的空间并重排行号，返回回收的数量
+
+        压缩后的数据在锁外构建，期间查询和写入不受阻塞，完成后在锁内替换；
+        构建期间有写入时重新构建，连续 COMPACT_RETRIES 次被打断后在锁内完成。
+        """
+        for attempt in range(COMPACT_RETRIES + 1):
+            with self._lock:
+                if not self._tombstones:
+                    return 0
+                removed = len(self._tombstones)
+                version = self._version
+                # 写入只追加行、原地覆盖或替换整个矩阵，并增加版本号；
+                # 版本号不变时，这里取出的引用在构建期间未被修改
+                source = {
+                    "keep": self._alive_mask(),
+                    "vectors": self._vectors[:self._size],
+                    "ids": self._ids,
+                    "documents": self._documents,
+                    "columns": dict(self._columns)
+                }
+                if attempt == COMPACT_RETRIES:
+                    self._install_compacted(self._build_compacted(source))
+                    return removed
+            compacted = self._build_compacted(source)
+            with self._lock:
+                if self._version == version:
+                    self._install_compacted(compacted)
+                    return removed
+
+    def _build_compacted(self, source: Dict[str, Any]) -> Dict[str, Any]:
+        """按保留掩码生成压缩后的数据，只读取 source，不修改索引"""
+        keep = source["keep"]
+        ids = [chunk_id for chunk_id, kept in zip(source["ids"], keep) if kept]
+        # 分段复制保留的行，不生成整个矩阵的临时副本
+        rows = np.flatnonzero(keep)
+        vectors = self._allocate(len(rows), source["vectors"].shape[1])
+        for start in range(0, len(rows), COMPACT_CHUNK_ROWS):
+            vectors[start:start + COMPACT_CHUNK_ROWS] = source["vectors"][rows[start:start + COMPACT_CHUNK_ROWS]]
+        return {
+            "vectors": vectors,
+            "ids": ids,
+            "documents": [text for text, kept in zip(source["documents"], keep) if kept],
+            "columns": {
+                key: [value for value, kept in zip(column, keep) if kept]
+                for key, column in source["columns"].items()
+            },
+            "id_to_row": {chunk_id: row for row, chunk_id in enumerate(ids)}
+        }
+
+    def _install_compacted(self, compacted: Dict[str, Any]):
+        """替换为压缩后的数据（调用方需持有锁）"""
+        self._vectors = compacted["vectors"]
+        self._ids = compacted["ids"]
+        self._documents = compacted["documents"]
+        self._columns = compacted["columns"]
+        self._id_to_row = compacted["id_to_row"]
+        self._size = len(self._ids)
+        self._tombstones = set()
+        self._alive = None
+        self._column_arrays = {}
+        self._version += 1
+
+    # ---------- 查询 ----------
+
+    def _column(self, key: str) -> np.ndarray:
+        """获取一列元数据的数组形式（带缓存）"""
+        array = self._column_arrays.get(key)
+        if array is None:
+            array = np.empty(self._size, dtype=object)
+            column = self._columns.get(key)
+            if column is not None:
+                array[:] = column
+            self._column_arrays[key] = array
+        return array
+
+    def _numeric_column(self, key: str) -> np.ndarray:
+        """获取一列元数据的 float 数组形式，非数值记为 NaN（带缓存）"""
+        cache_key = (key, float)
+        array = self._column_arrays.get(cache_key)
+        if array is None:
+            array = np.full(self._size, np.nan)
+            for row, value in enumerate(self._columns.get(key) or []):
+                if _is_number(value):
+                    array[row] = value
+            self._column_arrays[cache_key] = array
+        return array
+
+    def _filter_mask(self, where: Optional[Dict[str, Any]]) -> np.ndarray:
+        """将 Chroma 风格的 where 条件编译为布尔掩码"""
+        mask = np.ones(self._size, dtype=bool)
+        if not where:
+            return mask
+        for key, condition in where.items():
+            if key == "$and":
+                for sub in condition:
+                    mask &= self._filter_mask(sub)
+            elif key == "$or":
+                any_mask = np.zeros(self._size, dtype=bool)
+                for sub in condition:
+                    any_mask |= self._filter_mask(sub)
+                mask &= any_mask
+            elif isinstance(condition, dict):
+                for operator, value in condition.items():
+                    if operator in RANGE_OPERATORS and _is_number(value):
+                        # 数值范围条件（如日期时间戳）向量化求值
+                        mask &= _compare(self._numeric_column(key), operator, value)
+                    else:
+                        mask &= _compare(self._column(key), operator, value)
+            else:
+                mask &= _compare(self._column(key), "$eq", condition)
+        return mask
+
+    def _alive_mask(self) -> np.ndarray:
+        """未删除行的掩码（带缓存）"""
+        if self._alive is None:
+            alive = np.ones(self._size, dtype=bool)
+            if self._tombstones:
+                alive[list(self._tombstones)] = False
+            self._alive = alive
+        return self._alive
+
+    def _live_mask(self, where: Optional[Dict[str, Any]]) -> np.ndarray:
+        """满足过滤条件且未删除的行"""
+        return self._filter_mask(where) & self._alive_mask()
+
+    def _metadata(self, row: int) -> Dict[str, Any]:
+        """还原一行的元数据字典"""
+        return {
+            key: column[row]
+            for key, column in self._columns.items()
+            if column[row] is not None
+        }
+
+    def _similarities(self, query_vectors: np.ndarray, rows: Optional[np.ndarray]) -> np.ndarray:
+        """计算查询与指定行（None 表示全部）的内积，返回 (查询数, 行数) 矩阵"""
+        matrix = self._vectors[:self._size] if rows is None else self._vectors[rows]
+        return query_vectors @ matrix.T
+
+    def _exact_search(self, query_vectors: np.ndarray, k: int, mask: np.ndarray) -> List[List[Tuple[int, float]]]:
+        """在满足过滤条件的行上做精确检索，返回每个查询的 (行号, 距离) 列表"""
+        # 过滤条件有选择性时只计算候选行
+        rows = None if mask.all() else np.flatnonzero(mask)
+        k = min(k, self._size if rows is None else len(rows))
+        if k <= 0:
+            return [[] for _ in range(len(query_vectors))]
+        similarities = self._similarities(query_vectors, rows)
+        top = np.argpartition(-similarities, k - 1, axis=1)[:, :k]
+        results = []
+        for i, columns in enumerate(top):
+            columns = columns[np.argsort(-similarities[i, columns], kind="stable")]
+            row_ids = columns if rows is None else rows[columns]
+            results.append([
+                (int(row), _to_distance(similarities[i, column]))
+                for row, column in zip(row_ids, columns)
+            ])
+        return results
+
+    def _search(self, query_vectors: np.ndarray, k: int, mask: np.ndarray) -> List[List[Tuple[int, float]]]:
+        """批量检索，子类可替换为近似检索"""
+        return self._exact_search(query_vectors, k, mask)
+
+    def similarity_search_by_vector_with_score(
+        self,
+        embedding: Union[np.ndarray, List[float]],
+        k: int = 4,
+        filter: Optional[Dict[str, Any]] = None
+    ) -> List[Tuple[Document, float]]:
+        """按向量检索，分数为距离（越小越相似）"""
+        return self.similarity_search_by_vectors_with_score([embedding], k, filter)[0]
+
+    def similarity_search_by_vectors_with_score(
+        self,
+        embeddings: Union[np.ndarray, List[List[float]]],
+        k: int = 4,
+        filter: Optional[Dict[str, Any]] = None
+    ) -> List[List[Tuple[Document, float]]]:
+        """多个查询向量一次矩阵运算检索，按输入顺序返回每个查询的结果"""
+        if len(embeddings) == 0:
+            return []
+        queries = np.asarray(embeddings, dtype=np.float32)
+        queries = _normalize(queries.reshape(len(queries), -1))
+        with self._lock:
+            batch_hits = self._search(queries, k, self._live_mask(filter))
+            return [
+                [
+                    (Document(page_content=self._documents[row], metadata=self._metadata(row)), score)
+                    for row, score in hits
+                ]
+                for hits in batch_hits
+            ]
+
+    def similarity_search_with_score(
+        self,
+        query: str,
+        k: int = 4,
+        filter: Optional[Dict[str, Any]] = None
+    ) -> List[Tuple[Document, float]]:
+        """带分数的相似度搜索"""
+        return self.similarity_search_by_vector_with_score(self.embedding.embed_query(query), k, filter)
+
+    def similarity_search(
+        self,
+        query: str,
+        k: int = 4,
+        filter: Optional[Dict[str, Any]] = None
+    ) -> List[Document]:
+        """相似度搜索"""
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, filter)]
+
+    def get(
+        self,
+        ids: Optional[Sequence[str]] = None,
+        where: Optional[Dict[str, Any]] = None,
+        include: Optional[List[str]] = None
+    ) -> Dict[str, Any]:
+        """按ID或元数据条件读取记录，返回格式与 Chroma 的 get 一致"""
+        include = ["metadatas", "documents"] if include is None else include
+        with self._lock:
+            if ids is not None:
+                rows = [self._id_to_row[chunk_id] for chunk_id in ids if chunk_id in self._id_to_row]
+                if where:
+                    mask = self._filter_mask(where)
+                    rows = [row for row in rows if mask[row]]
+            else:
+                rows = np.flatnonzero(self._live_mask(where)).tolist()
+            return {
+                "ids": [self._ids[row] for row in rows],
+                # 向量以 float32 矩阵返回，避免逐个转换为 list
+                "embeddings": (self._vectors[rows] if rows else []) if "embeddings" in include else None,
+                "metadatas": [self._metadata(row) for row in rows] if "metadatas" in include else None,
+                "documents": [self._documents[row] for row in rows] if "documents" in include else None
+            }
+
+    def count(self) -> int:
+        """获取记录数量（不含已删除的记录）"""
+        return self._size - len(self._tombstones)
@@ -0,0 +1,109 @@
+import os
+import multiprocessing
+from typing import List, Dict, Any, Optional, Tuple, Union
+import numpy as np
+from langchain_core.documents import Document
+from langchain.embeddings.base import Embeddings
+
+try:
+    from .snapshot import SnapshotIndex, read_manifest, resolve_snapshot
+except ImportError:
+    from snapshot import SnapshotIndex, read_manifest, resolve_snapshot
+
+# 工作进程内只读打开的快照（每个进程一份映射，数据页由系统页缓存共享）
+_worker_index: Optional[SnapshotIndex] = None
+
+def _init_worker(snapshot_directory: str, refresh_interval: float):
+    global _worker_index
+    # 工作进程只按向量检索，不需要嵌入模型
+    _worker_index = SnapshotIndex(None, snapshot_directory, read_only=True, refresh_interval=refresh_interval)
+
+def _search_worker(task: Tuple[np.ndarray, int, Optional[Dict[str, Any]]]) -> List[List[Tuple[Document, float]]]:
+    vectors, k, where = task
+    return _worker_index.similarity_search_by_vectors_with_score(vectors, k=k, filter=where)
+
+def _count_worker(_) -> int:
+    return _worker_index.count()
+
+class ReadOnlyIndexPool:
+    """多进程只读检索服务
+
+    每个工作进程以只读方式映射同一份快照，数据只在系统页缓存中保存一份，
+    进程的常驻内存不会随进程数成倍增长；查询在父进程中嵌入一次，
+    按批拆分给各工作进程并行检索，吞吐量随 CPU 核数增长而不受 GIL 限制。
+    写入进程用 export_snapshot(publish=True) 发布新版本，工作进程每隔 refresh_interval 秒切换。
+    接口与 VectorStore 的查询部分保持一致，SearchManager 可以直接使用。
+    """
+    def __init__(
+        self,
+        snapshot_directory: str,
+        embedding: Embeddings,
+        processes: Optional[int] = None,
+        refresh_interval: float = 1.0,
+        start_method: str = "spawn"
+    ):
+        manifest = read_manifest(resolve_snapshot(snapshot_directory))
+        model = getattr(embedding, "model", None)
+        expected = manifest["embedding"].get("model")
+        if model and expected and model != expected:
+            raise ValueError(f"Snapshot was built with embedding model {expected}, not {model}")
+        self.embedding = embedding
+        self.snapshot_directory = snapshot_directory
+        self.processes = processes or os.cpu_count() or 1
+        # 默认使用 spawn，避免在已有后台线程的进程中 fork
+        self._pool = multiprocessing.get_context(start_method).Pool(
+            self.processes,
+            initializer=_init_worker,
+            initargs=(snapshot_directory, refresh_interval)
+        )
+
+    def similarity_search_by_vectors_with_score(
+        self,
+        embeddings: Union[np.ndarray, List[List[float]]],
+        k: int = 4,
+        filter: Optional[Dict[str, Any]] = None
+    ) -> List[List[Tuple[Document, float]]]:
+        """用已嵌入的查询向量检索，查询按进程数拆分后并行执行，按输入顺序返回"""
+        if len(embeddings) == 0:
+            return []
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        vectors = vectors.reshape(len(vectors), -1)
+        batches = np.array_split(vectors, min(self.processes, len(vectors)))
+        results = self._pool.map(_search_worker, [(batch, k, filter) for batch in batches])
+        return [hits for batch in results for hits in batch]
+
+    def similarity_search_batch(
+        self,
+        queries: List[str],
+        k: int = 4,
+        filter: Optional[Dict[str, Any]] = None
+    ) -> List[List[Tuple[Document, float]]]:
+        """批量相似度搜索：一次嵌入所有查询，各工作进程并行检索"""
+        if not queries:
+            return []
+        return self.similarity_search_by_vectors_with_score(
+            self.embedding.embed_documents(list(queries)), k=k, filter=filter
+        )
+
+    def similarity_search_with_score(
+        self,
+        query: str,
+        k: int = 4,
+        filter: Optional[Dict[str, Any]] = None
+    ) -> List[Tuple[Document, float]]:
+        """带分数的相似度搜索"""
+        vector = np.asarray(self.embedding.embed_query(query), dtype=np.float32)
+        return self._pool.apply(_search_worker, ((vector[None, :], k, filter),))[0]
+
+    def similarity_search(self, query: str, k: int = 4, filter: Optional[Dict[str, Any]] = None) -> List[Document]:
+        """相似度搜索"""
+        return [doc for doc, _ in self.similarity_search_with_score(query, k=k, filter=filter)]
+
+    def get_document_count(self) -> int:
+        """获取文档数量"""
+        return self._pool.apply(_count_worker, (None,))
+
+    def close(self):
+        """关闭工作进程"""
+        self._pool.close()
+        self._pool.join()
@@ -0,0 +1,240 @@
+import time
+import queue
+import threading
+from typing import List, Dict, Any, Iterator, Optional, Tuple, Union
+
+try:
+    from .document_processor import DocumentProcessor
+    from .vector_store import make_chunk_id
+    from .near_duplicates import DuplicateRegistry
+except ImportError:
+    from document_processor import DocumentProcessor
+    from vector_store import make_chunk_id
+    from near_duplicates import DuplicateRegistry
+
+# 生产者线程结束的标记
+_DONE = object()
+
+class _Failure:
+    """生产者线程中抛出的异常，交给消费者重新抛出"""
+    def __init__(self, error: BaseException):
+        self.error = error
+
+def prefetch(iterator: Iterator, maxsize: int, name: str = "prefetch") -> Iterator:
+    """
+    在后台线程中运行生成器，结果经有界队列交给消费者
+
+    队列满时生产者阻塞等待（背压）；消费者提前结束时生产者随之停止，
+    生产者中的异常在消费者中重新抛出。
+    """
+    items: queue.Queue = queue.Queue(maxsize=maxsize)
+    stop = threading.Event()
+
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def run():
+        try:
+            for item in iterator:
+                if not put(item):
+                    return
+            put(_DONE)
+        except BaseException as e:
+            put(_Failure(e))
+        finally:
+            # 逐级关闭上游的生成器
+            close = getattr(iterator, "close", None)
+            if close:
+                close()
+
+    thread = threading.Thread(target=run, name=name, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = items.get()
+            if item is _DONE:
+                return
+            if isinstance(item, _Failure):
+                raise item.error
+            yield item
+    finally:
+        stop.set()
+        thread.join()
+
+class IngestionPipeline:
+    """流式入库：加载 → 分块 → 嵌入 → 写入
+
+    四个阶段各在一个线程中运行，阶段之间用长度为 queue_size 的有界队列连接，
+    队列满时上游阻塞等待，内存占用只取决于队列长度和批大小，与语料规模无关。
+    每批分块写入后立即可以检索；一个文件的全部分块写入后再清理该文件的旧分块，
+    已存在且未变化的分块不会重复嵌入，效果与 upsert_documents 相同。
+    设置 duplicates 登记表时跨文件合并近似重复的分块：重复的分块不嵌入，只把来源记到保留分块上。
+    """
+    def __init__(
+        self,
+        processor: DocumentProcessor,
+        vector_store,
+        batch_size: int = 64,
+        queue_size: int = 4,
+        duplicates: Optional[DuplicateRegistry] = None
+    ):
+        if batch_size < 1 or queue_size < 1:
+            raise ValueError("batch_size and queue_size must be positive")
+        self.processor = processor
+        self.vector_store = vector_store
+        self.batch_size = batch_size
+        self.queue_size = queue_size
+        self.duplicates = duplicates
+        # 最近一次 run 中每个文件的处理结果
+        self.last_report: List[Dict[str, Any]] = []
+
+    # ---------- 各阶段 ----------
+
+    def _load(self, file_paths: List[str]) -> Iterator[Tuple[str, Any]]:
+        """逐个产出文档，每个文件结束时产出该文件的加载结果"""
+        if (self.processor.workers or 0) == 1:
+            for file_path in file_paths:
+                started = time.perf_counter()
+                report = {"path": file_path, "documents": 0, "seconds": 0.0, "error": None}
+                try:
+                    # 逐页/逐条加载，不把整个文件读入内存
+                    for doc in self.processor.iter_document(file_path):
+                        report["documents"] += 1
+                        yield "document", doc
+                except Exception as e:
+                    report["error"] = f"{type(e).__name__}: {e}"
+                report["seconds"] = time.perf_counter() - started
+                yield "file", report
+        else:
+            # 多进程加载，同时处理的文件数有上限
+            for documents, report in self.processor.iter_files(file_paths):
+                for doc in documents:
+                    yield "document", doc
+                yield "file", report
+
+    def _split(self, items: Iterator[Tuple[str, Any]]) -> Iterator[Tuple[str, Any]]:
+        """
+        把文档切分为分块并按 batch_size 成批产出
+
+        文件结束时附带该文件全部来源的分块ID和需要写回的来源列表变化；
+        近似重复的分块不产出，其来源对应的分块ID为保留分块的ID，清理旧分块时不会删除保留分块。
+        """
+        batch: Dict[str, Any] = {}
+        file_ids: Dict[str, set] = {}
+        duplicates = 0
+        for kind, item in items:
+            if kind == "document":
+                for chunk in self.processor.split_documents([item]):
+                    chunk_id = make_chunk_id(chunk)
+                    kept_id = chunk_id if self.duplicates is None else self.duplicates.register(chunk, chunk_id)
+                    file_ids.setdefault(chunk.metadata.get("source"), set()).add(kept_id)
+                    if kept_id != chunk_id:
+                        duplicates += 1
+                        continue
+                    batch[chunk_id] = chunk
+                    if len(batch) >= self.batch_size:
+                        yield "batch", batch
+                        batch = {}
+            else:
+                # 先产出该文件剩余的分块，保证清理旧分块时新分块已全部写入
+                if batch:
+                    yield "batch", batch
+                    batch = {}
+                item["chunks"] = sum(len(ids) for ids in file_ids.values())
+                item["duplicates"] = duplicates
+                source_changes = {}
+                if self.duplicates is not None:
+                    # 文件中不再包含的内容从保留分块的来源列表中去掉（加载出错的文件不处理）
+                    if not item["error"]:
+                        for source, ids in (file_ids or {item["path"]: set()}).items():
+                            if source is not None:
+                                self.duplicates.release(source, ids)
+                    source_changes = self.duplicates.pop_changes()
+                # 加载出错的文件不清理旧分块
+                yield "file", (item, None if item["error"] else file_ids, source_changes)
+                file_ids = {}
+                duplicates = 0
+        if batch:
+            yield "batch", batch
+
+    def _embed(self, items: Iterator[Tuple[str, Any]]) -> Iterator[Tuple[str, Any]]:
+        """只为尚未写入的分块计算向量"""
+        for kind, item in items:
+            if kind == "batch":
+                existing = self.vector_store.existing_ids(list(item))
+                new_ids = [chunk_id for chunk_id in item if chunk_id not in existing]
+                embeddings = []
+                if new_ids:
+                    embeddings = self.vector_store.embedding.embed_documents(
+                        [item[chunk_id].page_content for chunk_id in new_ids]
+                    )
+                yield "batch", (item, new_ids, embeddings)
+            else:
+                yield kind, item
+
+    # ---------- 运行 ----------
+
+    def run(self, path: Union[str, List[str]]) -> Dict[str, int]:
+        """
+        流式处理文件夹（或文件列表）中的全部文件
+
+        Returns:
+            Dict: {"files": 文件数, "added": 新增分块数, "unchanged": 未变化分块数,
+                   "duplicates": 合并到已有分块的近似重复分块数, "removed": 移除的旧分块数}
+        """
+        file_paths = self.processor.list_files(path) if isinstance(path, str) else list(path)
+        stats = {"files": 0, "added": 0, "unchanged": 0, "duplicates": 0, "removed": 0}
+        report = []
+        stages = prefetch(self._load(file_paths), self.queue_size, "ingest-load")
+        stages = prefetch(self._split(stages), self.queue_size, "ingest-split")
+        stages = prefetch(self._embed(stages), self.queue_size, "ingest-embed")
+        for kind, item in stages:
+            if kind == "batch":
+                chunks, new_ids, embeddings = item
+                if new_ids:
+                    self.vector_store.add_embeddings(
+                        [chunks[chunk_id].page_content for chunk_id in new_ids],
+                        embeddings,
+                        [chunks[chunk_id].metadata for chunk_id in new_ids],
+                        new_ids
+                    )
+                stats["added"] += len(new_ids)
+                stats["unchanged"] += len(chunks) - len(new_ids)
+            else:
+                file_report, file_ids, source_changes = item
+                # 先写回来源列表：保留分块改记到其他来源后，清理本文件的旧分块时不会被删除
+                stats["removed"] += self.vector_store.update_sources(source_changes)
+                if file_ids is not None:
+                    # 文件变为空时按文件路径（加载器记录的来源）清理
+                    for source, ids in (file_ids or {file_report["path"]: set()}).items():
+                        if source is not None:
+                            stats["removed"] += self.vector_store.prune_source(source, ids)
+                stats["duplicates"] += file_report["duplicates"]
+                stats["files"] += 1
+                report.append(file_report)
+        self.vector_store.flush()
+        if self.duplicates is not None:
+            self.duplicates.save()
+        self.last_report = report
+        return stats
+
+    def remove_sources(self, sources: List[str]) -> int:
+        """
+        删除来源文件的分块；合并了近似重复的保留分块只去掉这些来源，仍有其他来源时保留
+
+        Returns:
+            int: 删除的分块数量
+        """
+        removed = 0
+        if self.duplicates is not None:
+            for source in sources:
+                self.duplicates.release(source)
+            removed += self.vector_store.update_sources(self.duplicates.pop_changes())
+            self.duplicates.save()
+        return removed + self.vector_store.delete_by_source(sources)
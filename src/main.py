@@ -1,29 +1,72 @@
 import os
 from dotenv import load_dotenv
 from document_processor import DocumentProcessor
-from vector_store import VectorStore
+from sharded_store import ShardedVectorStore
+from directory_sync import DirectorySync
+from snapshot import is_snapshot
 from zhipuai_embedding import ZhipuAIEmbeddings
+from embedding_cache import EmbeddingCache
 
 def main():
     # 加载环境变量
     load_dotenv()
     
-    # 初始化文档处理器
-    doc_processor = DocumentProcessor()
+    # 初始化文档处理器，PDF 和 Markdown 解析较耗 CPU，按核数多进程并行加载（PDF 按页区间并行）；
+    # PDF 的逐页文本按内容缓存，文件改名或被重新复制时不再解析
+    doc_processor = DocumentProcessor(workers=None, pdf_cache_dir="../pdf_page_cache")
     
     # 初始化向量数据库
-    embedding = ZhipuAIEmbeddings()
-    vector_store = VectorStore(
+    # 未变化的文本直接命中缓存，不再重复调用嵌入接口
+    embedding_cache = EmbeddingCache(cache_dir="../embedding_cache")
+    # 多个批次并发请求，QPS 按账号配额设置
+    embedding = ZhipuAIEmbeddings(
+        cache=embedding_cache,
+        max_workers=4,
+        requests_per_second=5
+    )
+    # 知识库按领域目录分片（easy_rl、prompt_engineering、pumkin_book），各分片并行写入和检索；
+    # 流式写入时每隔几秒统一持久化一次
+    vector_store = ShardedVectorStore(
         embedding=embedding,
-        persist_directory="../vector_db"
+        persist_directory="../vector_db_shards",
+        commit_interval=5.0
     )
     
-    # 处理文档
-    documents = doc_processor.process_documents("../data")
+    # 按文件清单增量同步：只有新增或变化的文件会流式加载、分块、嵌入和写入，
+    # 已删除文件的分块被移除，未变化的文件不会被读取；
+    # 跨文件的近似重复分块（如 easy_rl 中同一讲义的 .txt 和 .json）只嵌入和存储一份，并记录全部来源
+    sync = DirectorySync(
+        doc_processor,
+        vector_store,
+        manifest_path="../vector_db_shards/sync_manifest.json",
+        dedup_distance=3
+    )
+    stats = sync.sync("../data")
+    print(
+        f"新增 {stats['added_files']} 个文件，变化 {stats['changed_files']} 个，删除 {stats['deleted_files']} 个，"
+        f"未变化 {stats['unchanged_files']} 个"
+    )
+    for item in sync.pipeline.last_report:
+        if item["error"]:
+            print(f"加载文件 {item['path']} 失败：{item['error']}")
+    print(
+        f"新增 {stats['added']} 个分块，跳过 {stats['unchanged']} 个未变化分块，"
+        f"合并 {stats['duplicates']} 个近似重复分块，移除 {stats['removed']} 个旧分块"
+    )
+    # 有分块被移除时回收空间（非 Chroma 后端只记墓碑），导出快照前完成
+    if stats["removed"]:
+        vector_store.compact()
+    print(f"向量库中存储的文档数量：{vector_store.get_document_count()}（分片：{', '.join(vector_store.shard_names())}）")
+    print(f"嵌入缓存统计：{embedding_cache.stats()}")
     
-    # 创建向量数据库
-    vector_store.create_from_documents(documents)
-    print(f"向量库中存储的文档数量：{vector_store.get_document_count()}")
+    # 以新版本发布快照，问答应用启动时直接映射，运行中的只读进程会切换到新版本；
+    # 向量库没有变化时沿用现有快照
+    if stats["added"] or stats["removed"] or not is_snapshot("../vector_db_snapshot"):
+        vector_store.export_snapshot(
+            "../vector_db_snapshot",
+            chunking={"chunk_size": doc_processor.chunk_size, "chunk_overlap": doc_processor.chunk_overlap},
+            publish=True
+        )
     
     # 测试搜索
     query = "什么是机器学习？"
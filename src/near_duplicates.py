@@ -0,0 +1,280 @@
+import os
+import re
+import json
+import hashlib
+from typing import List, Dict, Any, Iterable, Optional, Set
+import numpy as np
+from langchain_core.documents import Document
+
+# 64 位 SimHash
+FINGERPRINT_BITS = 64
+# 合并后的分块在该字段中记录全部来源，每行一个（Chroma 的元数据不支持列表）
+SOURCES_FIELD = "sources"
+SOURCES_SEPARATOR = "\n"
+# 参与合并的最小长度（去掉空白和标点后的字符数）：短文本中改动一两个字（如数值）
+# 指纹就会变化多位，与真正的近似重复无法区分，因此短分块从不合并
+MIN_LENGTH = 200
+
+# 计算指纹前去掉空白和标点，只保留文字和数字
+_NON_WORD = re.compile(r"[\W_]+")
+
+def _normalize(text: str) -> str:
+    return _NON_WORD.sub("", text.lower())
+
+def simhash(text: str, ngram: int = 3) -> int:
+    """
+    文本的 64 位 SimHash
+
+    以字符 n-gram 为特征（中文没有空格分词），每个特征取 blake2b 哈希，
+    各位按特征出现次数投票，结果在不同进程间保持一致。
+    """
+    text = _normalize(text)
+    if len(text) <= ngram:
+        shingles = [text]
+    else:
+        shingles = [text[i:i + ngram] for i in range(len(text) - ngram + 1)]
+    digests = b"".join(hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest() for shingle in shingles)
+    bits = np.unpackbits(np.frombuffer(digests, dtype=np.uint8).reshape(len(shingles), 8), axis=1)
+    votes = bits.sum(axis=0, dtype=np.int64) * 2 > len(shingles)
+    return int.from_bytes(np.packbits(votes).tobytes(), "big")
+
+def hamming_distance(a: int, b: int) -> int:
+    """两个指纹不同的位数"""
+    return (a ^ b).bit_count()
+
+def chunk_sources(metadata: Optional[Dict]) -> List[str]:
+    """分块的全部来源：合并过的分块取 sources 字段，否则为 source"""
+    metadata = metadata or {}
+    if metadata.get(SOURCES_FIELD):
+        return metadata[SOURCES_FIELD].split(SOURCES_SEPARATOR)
+    return [metadata["source"]] if metadata.get("source") else []
+
+def with_sources(metadata: Optional[Dict], sources: List[str]) -> Dict:
+    """元数据的副本，第一个来源写入 source 字段，全部来源写入 sources 字段"""
+    return {**(metadata or {}), "source": sources[0], SOURCES_FIELD: SOURCES_SEPARATOR.join(sources)}
+
+class NearDuplicateIndex:
+    """SimHash 指纹的 LSH 索引
+
+    指纹切成 max_distance + 1 段，由抽屉原理，汉明距离不超过 max_distance 的两个指纹
+    至少有一段完全相同。每段建一个哈希表，查询时只比较至少一段相同的候选，
+    不会漏掉阈值内的近似重复，也不需要两两比较。
+    """
+    def __init__(self, max_distance: int = 3):
+        if not 0 <= max_distance < 16:
+            raise ValueError("max_distance must be between 0 and 15")
+        self.max_distance = max_distance
+        bands = max_distance + 1
+        # 各段的 (起始位, 位数)，位数不能整除时前几段多一位
+        width, extra = divmod(FINGERPRINT_BITS, bands)
+        self._bands = []
+        offset = 0
+        for band in range(bands):
+            size = width + (1 if band < extra else 0)
+            self._bands.append((offset, size))
+            offset += size
+        self._tables: List[Dict[int, List[int]]] = [{} for _ in self._bands]
+        # 已移除的指纹记为 None，序号保持不变
+        self._fingerprints: List[Optional[int]] = []
+        self._removed = 0
+
+    def __len__(self) -> int:
+        return len(self._fingerprints) - self._removed
+
+    def _keys(self, fingerprint: int) -> List[int]:
+        return [(fingerprint >> offset) & ((1 << size) - 1) for offset, size in self._bands]
+
+    def query(self, fingerprint: int) -> Optional[int]:
+        """返回最早加入的、距离在阈值内的指纹序号，没有时返回 None"""
+        best = None
+        for table, key in zip(self._tables, self._keys(fingerprint)):
+            for position in table.get(key, ()):
+                if (best is None or position < best) and \
+                        hamming_distance(fingerprint, self._fingerprints[position]) <= self.max_distance:
+                    best = position
+        return best
+
+    def add(self, fingerprint: int) -> int:
+        """加入指纹，返回其序号"""
+        position = len(self._fingerprints)
+        self._fingerprints.append(fingerprint)
+        for table, key in zip(self._tables, self._keys(fingerprint)):
+            table.setdefault(key, []).append(position)
+        return position
+
+    def remove(self, position: int):
+        """移除一个指纹，其他指纹的序号不变"""
+        fingerprint = self._fingerprints[position]
+        if fingerprint is None:
+            return
+        for table, key in zip(self._tables, self._keys(fingerprint)):
+            bucket = table[key]
+            bucket.remove(position)
+            if not bucket:
+                del table[key]
+        self._fingerprints[position] = None
+        self._removed += 1
+
+def collapse_near_duplicates(
+    documents: List[Document],
+    max_distance: int = 3,
+    min_length: int = MIN_LENGTH
+) -> List[Document]:
+    """
+    合并近似重复的分块
+
+    按顺序保留每组中第一次出现的分块，其余分块丢弃，来源追加到保留分块的 sources 字段；
+    保留分块的 source 和位置元数据不变，分块ID保持稳定。
+    长度不足 min_length 的分块原样保留，也不作为其他分块的合并目标。
+
+    Returns:
+        List[Document]: 去重后的分块，合并了其他来源的分块是带 sources 字段的新副本
+    """
+    index = NearDuplicateIndex(max_distance)
+    kept: List[Document] = []
+    sources: List[Optional[List[str]]] = []
+    # 指纹序号 -> 保留分块在 kept 中的位置
+    positions: List[int] = []
+    for doc in documents:
+        if len(_normalize(doc.page_content)) < min_length:
+            kept.append(doc)
+            sources.append(None)
+            continue
+        fingerprint = simhash(doc.page_content)
+        position = index.query(fingerprint)
+        if position is None:
+            index.add(fingerprint)
+            positions.append(len(kept))
+            kept.append(doc)
+            sources.append(chunk_sources(doc.metadata))
+            continue
+        doc_sources = sources[positions[position]]
+        for source in chunk_sources(doc.metadata):
+            if source not in doc_sources:
+                doc_sources.append(source)
+    result = []
+    for doc, doc_sources in zip(kept, sources):
+        if doc_sources is not None and len(doc_sources) > 1:
+            doc = Document(page_content=doc.page_content, metadata=with_sources(doc.metadata, doc_sources))
+        result.append(doc)
+    return result
+
+# 登记表文件格式的版本
+REGISTRY_VERSION = 1
+
+class DuplicateRegistry:
+    """跨文件的近似重复登记表
+
+    记录每个保留分块的指纹和全部来源（第一个来源与分块的 source 字段一致）。
+    流式入库时新分块先与已登记的分块比较，近似重复的只把来源追加到保留分块上，不再嵌入和写入；
+    某个来源被删除或不再包含该内容时只从来源列表中去掉它，其余来源仍在时保留分块不删除。
+    来源列表的变化由 pop_changes 取出后写回向量库。设置 path 时可保存为 JSON，增量同步时与文件清单一起持久化。
+    """
+    def __init__(self, path: Optional[str] = None, max_distance: int = 3, min_length: int = MIN_LENGTH):
+        self.path = path
+        self.max_distance = max_distance
+        self.min_length = min_length
+        self._index = NearDuplicateIndex(self.max_distance)
+        # 保留分块ID -> {"fingerprint": 指纹, "position": 指纹序号, "sources": 来源列表}
+        self._chunks: Dict[str, Dict[str, Any]] = {}
+        self._positions: Dict[int, str] = {}
+        # 来源 -> 列出该来源的保留分块ID
+        self._source_chunks: Dict[str, Set[str]] = {}
+        # 来源列表有变化、需要写回向量库的分块
+        self._changed: Set[str] = set()
+        if path and os.path.exists(path):
+            self._load()
+
+    def __len__(self) -> int:
+        return len(self._chunks)
+
+    def sources(self, chunk_id: str) -> List[str]:
+        """保留分块的全部来源，未登记的分块返回空列表"""
+        entry = self._chunks.get(chunk_id)
+        return list(entry["sources"]) if entry else []
+
+    def _insert(self, chunk_id: str, fingerprint: int, sources: List[str]):
+        position = self._index.add(fingerprint)
+        self._positions[position] = chunk_id
+        self._chunks[chunk_id] = {"fingerprint": fingerprint, "position": position, "sources": list(sources)}
+        for source in sources:
+            self._source_chunks.setdefault(source, set()).add(chunk_id)
+
+    def _add_source(self, chunk_id: str, source: Optional[str]):
+        sources = self._chunks[chunk_id]["sources"]
+        if source and source not in sources:
+            sources.append(source)
+            self._source_chunks.setdefault(source, set()).add(chunk_id)
+            self._changed.add(chunk_id)
+
+    def register(self, document: Document, chunk_id: str) -> str:
+        """
+        登记一个新分块
+
+        Returns:
+            str: 应保存的分块ID，与 chunk_id 不同时说明该分块是已登记分块的近似重复，不需要写入
+        """
+        source = (document.metadata or {}).get("source")
+        if chunk_id in self._chunks:
+            self._add_source(chunk_id, source)
+            return chunk_id
+        if len(_normalize(document.page_content)) < self.min_length:
+            return chunk_id
+        fingerprint = simhash(document.page_content)
+        position = self._index.query(fingerprint)
+        if position is not None:
+            kept_id = self._positions[position]
+            self._add_source(kept_id, source)
+            return kept_id
+        # 新的保留分块以自身元数据写入，不需要写回
+        self._insert(chunk_id, fingerprint, [source] if source else [])
+        return chunk_id
+
+    def release(self, source: str, keep_ids: Iterable[str] = ()):
+        """从不在 keep_ids 中的保留分块的来源列表中去掉 source，来源全部去掉的分块不再登记"""
+        keep_ids = set(keep_ids)
+        chunk_ids = self._source_chunks.get(source, set())
+        for chunk_id in [chunk_id for chunk_id in chunk_ids if chunk_id not in keep_ids]:
+            chunk_ids.discard(chunk_id)
+            entry = self._chunks[chunk_id]
+            entry["sources"].remove(source)
+            self._changed.add(chunk_id)
+            if not entry["sources"]:
+                self._index.remove(entry["position"])
+                del self._positions[entry["position"]]
+                del self._chunks[chunk_id]
+        if not chunk_ids:
+            self._source_chunks.pop(source, None)
+
+    def pop_changes(self) -> Dict[str, List[str]]:
+        """取出来源列表有变化的分块及其当前来源，来源为空表示分块应删除"""
+        changes = {chunk_id: self.sources(chunk_id) for chunk_id in self._changed}
+        self._changed = set()
+        return changes
+
+    def _load(self):
+        with open(self.path, "r", encoding="utf-8") as f:
+            registry = json.load(f)
+        if registry.get("version") != REGISTRY_VERSION:
+            print(f"近似重复登记表版本不符，将重新登记: {self.path}")
+            return
+        # 指纹按登记顺序重建索引，阈值以当前设置为准
+        for chunk_id, entry in registry["chunks"].items():
+            self._insert(chunk_id, int(entry["fingerprint"], 16), entry["sources"])
+
+    def save(self):
+        """写入登记表文件（先写临时文件再替换），未设置 path 时不做任何事"""
+        if not self.path:
+            return
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump({
+                "version": REGISTRY_VERSION,
+                "chunks": {
+                    chunk_id: {"fingerprint": format(entry["fingerprint"], "016x"), "sources": entry["sources"]}
+                    for chunk_id, entry in self._chunks.items()
+                }
+            }, f, ensure_ascii=False)
+        os.replace(self.path + ".tmp", self.path)
@@ -0,0 +1,272 @@
+import os
+import json
+import sqlite3
+import hashlib
+import itertools
+import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
+from typing import List, Dict, Any, Iterator, Optional, Tuple
+from langchain_core.documents import Document
+
+# 自行启动进程池的最小页数：工作进程启动和导入约需 1 秒，页数较少时在当前进程中逐页提取更快；
+# 使用调用方已启动的进程池时不受此限制
+PARALLEL_MIN_PAGES = 500
+
+def _document_info(file_path: str) -> Tuple[int, Dict[str, Any]]:
+    """PDF 的页数和文档级元数据（只解析目录结构，不提取页面文本）"""
+    import fitz
+    with fitz.open(file_path) as doc:
+        # 与 PyMuPDFLoader 一致，只保留字符串和整数类型的元数据
+        metadata = {key: value for key, value in doc.metadata.items() if type(value) in [str, int]}
+        return len(doc), metadata
+
+def _page_texts(doc, start: int, stop: int) -> List[str]:
+    """[start, stop) 页的文本，与 PyMuPDFLoader 相同使用默认的 get_text"""
+    return [doc[number].get_text() for number in range(start, stop)]
+
+def _extract_pages(task: Tuple[str, int, int]) -> List[str]:
+    """提取 [start, stop) 页的文本，在工作进程中运行"""
+    import fitz
+    file_path, start, stop = task
+    with fitz.open(file_path) as doc:
+        return _page_texts(doc, start, stop)
+
+class PageTextCache:
+    """PDF 逐页文本的持久化缓存
+
+    键为文件内容的哈希加页码，重复上传或改名后的同一文件不再解析；
+    文本存储在 SQLite 中，超过文件数上限时按最近最少使用（LRU）整份淘汰。
+    """
+    def __init__(self, cache_dir: Optional[str] = None, max_documents: int = 100):
+        self.cache_dir = cache_dir
+        self.max_documents = max_documents
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+            db_path = os.path.join(cache_dir, "pdf_pages.sqlite3")
+        else:
+            # 使用内存模式
+            db_path = ":memory:"
+        # 多个进程共用同一个缓存文件时，写入冲突等待而不是立即报错
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS documents ("
+            "digest TEXT PRIMARY KEY, total_pages INTEGER NOT NULL, metadata TEXT NOT NULL, last_access INTEGER NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS pages ("
+            "digest TEXT NOT NULL, page INTEGER NOT NULL, text TEXT NOT NULL, PRIMARY KEY (digest, page))"
+        )
+        self._conn.commit()
+        # 逻辑时钟，用于记录访问先后顺序
+        self._clock = self._conn.execute(
+            "SELECT COALESCE(MAX(last_access), 0) FROM documents"
+        ).fetchone()[0]
+
+    @staticmethod
+    def make_key(file_path: str, block_size: int = 1 << 20) -> str:
+        """根据文件内容生成缓存键"""
+        digest = hashlib.sha256()
+        with open(file_path, "rb") as f:
+            for block in iter(lambda: f.read(block_size), b""):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def get_document(self, key: str) -> Optional[Tuple[int, Dict[str, Any]]]:
+        """读取页数和文档级元数据，未命中时返回 None"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT total_pages, metadata FROM documents WHERE digest = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            self._clock += 1
+            self._conn.execute("UPDATE documents SET last_access = ? WHERE digest = ?", (self._clock, key))
+            self._conn.commit()
+        return row[0], json.loads(row[1])
+
+    def put_document(self, key: str, total_pages: int, metadata: Dict[str, Any]):
+        """写入页数和文档级元数据，并在超出容量时淘汰最久未使用的文件"""
+        with self._lock:
+            self._clock += 1
+            self._conn.execute(
+                "INSERT OR REPLACE INTO documents (digest, total_pages, metadata, last_access) VALUES (?, ?, ?, ?)",
+                (key, total_pages, json.dumps(metadata, ensure_ascii=False), self._clock)
+            )
+            self._evict()
+            self._conn.commit()
+
+    def get_pages(self, key: str, start: int, stop: int) -> Dict[int, str]:
+        """读取 [start, stop) 中已缓存的页面文本"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT page, text FROM pages WHERE digest = ? AND page >= ? AND page < ?",
+                (key, start, stop)
+            ).fetchall()
+        pages = dict(rows)
+        self.hits += len(pages)
+        self.misses += stop - start - len(pages)
+        return pages
+
+    def count_pages(self, key: str) -> int:
+        """已缓存的页数"""
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM pages WHERE digest = ?", (key,)).fetchone()[0]
+
+    def put_pages(self, key: str, start: int, texts: List[str]):
+        """写入从 start 开始的连续页面文本"""
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO pages (digest, page, text) VALUES (?, ?, ?)",
+                [(key, start + offset, text) for offset, text in enumerate(texts)]
+            )
+            self._conn.commit()
+
+    def _evict(self):
+        """淘汰超出容量上限的文件（调用方需持有锁）"""
+        count = self._conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+        overflow = count - self.max_documents
+        if overflow > 0:
+            keys = [row[0] for row in self._conn.execute(
+                "SELECT digest FROM documents ORDER BY last_access ASC LIMIT ?", (overflow,)
+            )]
+            self._conn.executemany("DELETE FROM pages WHERE digest = ?", [(key,) for key in keys])
+            self._conn.executemany("DELETE FROM documents WHERE digest = ?", [(key,) for key in keys])
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+
+    def stats(self) -> Dict[str, int]:
+        """获取命中统计（按页计数）"""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "documents": len(self)
+        }
+
+    def clear(self):
+        """清空缓存并重置计数"""
+        with self._lock:
+            self._conn.execute("DELETE FROM pages")
+            self._conn.execute("DELETE FROM documents")
+            self._conn.commit()
+            self.hits = 0
+            self.misses = 0
+
+    def close(self):
+        """关闭数据库连接"""
+        with self._lock:
+            self._conn.close()
+
+class PdfLoader:
+    """按页区间并行、逐页产出的 PDF 加载器
+
+    页面按 pages_per_task 页一段交给工作进程提取文本，按页码顺序逐页产出，
+    同时在途的区间不超过 2 × workers 个，内存占用与页数无关。
+    产出的文档与 PyMuPDFLoader 的文本和元数据相同，分块ID保持不变。
+    提供缓存时，已缓存的页面直接读取，全部命中时不打开 PDF。
+    """
+    def __init__(
+        self,
+        file_path: str,
+        workers: int = 1,
+        executor: Optional[Executor] = None,
+        pages_per_task: int = 16,
+        cache: Optional[PageTextCache] = None
+    ):
+        if pages_per_task < 1:
+            raise ValueError("pages_per_task must be positive")
+        self.file_path = file_path
+        # executor 为调用方共用的进程池，workers 为其进程数；未提供时按需创建
+        self.workers = max(workers, 1)
+        self.executor = executor
+        self.pages_per_task = pages_per_task
+        self.cache = cache
+
+    def _info(self, key: Optional[str]) -> Tuple[int, Dict[str, Any]]:
+        info = self.cache.get_document(key) if self.cache is not None else None
+        if info is None:
+            info = _document_info(self.file_path)
+            if self.cache is not None:
+                self.cache.put_document(key, *info)
+        return info
+
+    def lazy_load(self) -> Iterator[Document]:
+        """按页码顺序逐页产出文档"""
+        key = PageTextCache.make_key(self.file_path) if self.cache is not None else None
+        total_pages, doc_metadata = self._info(key)
+        ranges = iter([
+            (start, min(start + self.pages_per_task, total_pages))
+            for start in range(0, total_pages, self.pages_per_task)
+        ])
+        executor, owned = self.executor, False
+        if executor is None and self.workers > 1 and total_pages >= PARALLEL_MIN_PAGES:
+            # 只有存在未缓存的页面时才启动进程池
+            if self.cache is None or self.cache.count_pages(key) < total_pages:
+                executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn")
+                )
+                owned = True
+        # 没有进程池时在当前进程中提取，整个文件只打开一次
+        document = None
+        pending = deque()
+
+        def submit(start: int, stop: int):
+            pages = self.cache.get_pages(key, start, stop) if self.cache is not None else {}
+            if len(pages) == stop - start:
+                return [pages[number] for number in range(start, stop)]
+            if executor is not None:
+                return executor.submit(_extract_pages, (self.file_path, start, stop))
+            # 轮到该区间时再提取
+            return None
+
+        try:
+            for start, stop in itertools.islice(ranges, 2 * self.workers):
+                pending.append((start, stop, submit(start, stop)))
+            while pending:
+                start, stop, result = pending.popleft()
+                next_range = next(ranges, None)
+                if next_range is not None:
+                    pending.append((*next_range, submit(*next_range)))
+                if isinstance(result, list):
+                    texts = result
+                else:
+                    if isinstance(result, Future):
+                        texts = result.result()
+                    else:
+                        if document is None:
+                            import fitz
+                            document = fitz.open(self.file_path)
+                        texts = _page_texts(document, start, stop)
+                    if self.cache is not None:
+                        self.cache.put_pages(key, start, texts)
+                for offset, text in enumerate(texts):
+                    yield Document(
+                        page_content=text,
+                        metadata=dict(
+                            {
+                                "source": self.file_path,
+                                "file_path": self.file_path,
+                                "page": start + offset,
+                                "total_pages": total_pages
+                            },
+                            **doc_metadata
+                        )
+                    )
+        finally:
+            # 提前结束时取消尚未开始的区间
+            for _, _, result in pending:
+                if isinstance(result, Future):
+                    result.cancel()
+            if owned:
+                executor.shutdown(wait=True, cancel_futures=True)
+            if document is not None:
+                document.close()
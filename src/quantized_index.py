@@ -0,0 +1,252 @@
+import os
+import tempfile
+from abc import ABC, abstractmethod
+from typing import List, Dict, Any, Optional, Tuple
+import numpy as np
+
+try:
+    from .flat_index import VECTORS_FILE, _to_distance
+    from .ann_index import AnnIndex
+except ImportError:
+    from flat_index import VECTORS_FILE, _to_distance
+    from ann_index import AnnIndex
+
+# 估算相似度时每次处理的行数，限制临时矩阵的内存占用
+SCAN_CHUNK_ROWS = 65536
+
+def _int8_train(vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """按维度统计取值范围，返回 int8 量化的偏移和步长"""
+    low = vectors.min(axis=0)
+    scale = (vectors.max(axis=0) - low) / 255
+    return low.astype(np.float32), np.where(scale == 0, 1, scale).astype(np.float32)
+
+def _int8_encode(vectors: np.ndarray, offset: np.ndarray, scale: np.ndarray) -> np.ndarray:
+    """int8 标量量化"""
+    codes = np.rint((vectors - offset) / scale) - 128
+    # 训练后新增的向量可能超出范围，截断到 int8
+    return np.clip(codes, -128, 127).astype(np.int8)
+
+def _int8_similarities(
+    query_vectors: np.ndarray,
+    codes: np.ndarray,
+    offset: np.ndarray,
+    scale: np.ndarray
+) -> np.ndarray:
+    """在 int8 量化码上估算内积，返回 (查询数, 行数) 矩阵"""
+    # x ≈ offset + scale * (code + 128)，按查询展开后只需一次矩阵乘法
+    scaled = query_vectors * scale
+    bias = query_vectors @ offset + 128 * scaled.sum(axis=1)
+    return scaled @ codes.T.astype(np.float32) + bias[:, None]
+
+def _nearest(data: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """每行最近的聚类中心编号（||x||² 对 argmin 无影响，省去不算）"""
+    distances = data @ centroids.T
+    distances *= -2
+    distances += (centroids ** 2).sum(axis=1)
+    return distances.argmin(axis=1)
+
+def _kmeans(data: np.ndarray, clusters: int, iterations: int, rng: np.random.Generator) -> np.ndarray:
+    """简单的 k-means，返回聚类中心"""
+    data = np.ascontiguousarray(data)
+    centroids = data[rng.choice(len(data), clusters, replace=False)].copy()
+    for _ in range(iterations):
+        labels = _nearest(data, centroids)
+        counts = np.bincount(labels, minlength=clusters)
+        sums = np.stack([
+            np.bincount(labels, weights=data[:, d], minlength=clusters)
+            for d in range(data.shape[1])
+        ], axis=1)
+        # 空聚类保留原中心
+        filled = counts > 0
+        centroids[filled] = sums[filled] / counts[filled, None]
+    return centroids
+
+class QuantizedIndex(AnnIndex, ABC):
+    """量化存储检索后端的公共部分
+
+    常驻内存的只有量化码，查询时在量化码上估算相似度取出候选，
+    再用全精度向量对候选重新打分（rescore_factor 为 0 时直接返回估算结果）。
+    指定 persist_directory 时全精度向量始终保存在磁盘上：已持久化的部分映射 vectors.npy，
+    写入和压缩时放在该目录下的匿名临时文件中并以内存映射方式读写，只有被访问的页由系统缓存，可随时换出。
+    内存模式（persist_directory 为 None）没有可用的磁盘位置，全精度向量保留在内存中。
+    量化器与量化码随索引持久化；数据量翻倍或有覆盖、删除时重新训练。
+    """
+    search_params = ("rescore_factor",)
+
+    def persist(self):
+        """持久化后改用内存映射读取全精度向量，释放内存中的副本"""
+        super().persist()
+        with self._lock:
+            if self._size and not isinstance(self._vectors, np.memmap):
+                self._vectors = np.load(os.path.join(self.persist_directory, VECTORS_FILE), mmap_mode="r")
+
+    def _allocate(self, rows: int, dim: int) -> np.ndarray:
+        if not self.persist_directory or not rows:
+            return super()._allocate(rows, dim)
+        os.makedirs(self.persist_directory, exist_ok=True)
+        # 临时文件关闭后即被删除，映射一直有效到矩阵被释放为止，进程异常退出时也不会残留
+        with tempfile.TemporaryFile(dir=self.persist_directory, suffix=".vectors") as f:
+            return np.memmap(f, dtype=np.float32, mode="w+", shape=(rows, dim))
+
+    def _sync_ann(self):
+        # 训练样本过少时量化误差偏大，数据量翻倍后重新训练
+        if self._ann is not None and self._size >= 2 * int(self._ann["trained_rows"]):
+            self._ann_stale = True
+        super()._sync_ann()
+
+    def _apply_search_params(self):
+        # 查询参数在检索时读取
+        pass
+
+    def _add_to_ann(self, vectors: np.ndarray, start: int):
+        self._ann["codes"] = np.concatenate([self._ann["codes"], self._encode(vectors, self._ann)])
+
+    def _save_ann(self, path: str):
+        with open(path, "wb") as f:
+            np.savez(f, **self._ann)
+
+    def _load_ann(self, path: str):
+        with np.load(path) as data:
+            return {key: data[key] for key in data.files}
+
+    def memory_usage(self) -> Dict[str, int]:
+        """
+        各部分占用的字节数
+
+        Returns:
+            Dict: codes 为量化码，full_precision 为分配在进程内存中的全精度向量（含预留容量），
+            mapped 为以内存映射方式放在磁盘上的全精度向量（按需读入系统页缓存，不计入进程内存）
+        """
+        with self._lock:
+            self._sync_ann()
+            codes = 0 if self._ann is None else self._ann["codes"].nbytes
+            vectors = 0 if self._vectors is None else self._vectors.nbytes
+            mapped = isinstance(self._vectors, np.memmap)
+            return {"codes": codes, "full_precision": 0 if mapped else vectors, "mapped": vectors if mapped else 0}
+
+    def _search(self, query_vectors: np.ndarray, k: int, mask: np.ndarray) -> List[List[Tuple[int, float]]]:
+        allowed = int(mask.sum())
+        if allowed <= max(k, self.exact_threshold):
+            return self._exact_search(query_vectors, k, mask)
+        self._sync_ann()
+        # 只扫描满足过滤条件的行
+        rows, similarities = self._scan(query_vectors, k, None if allowed == self._size else np.flatnonzero(mask))
+        return [
+            [(int(row), _to_distance(similarity)) for row, similarity in zip(row_hits, similarity_hits)]
+            for row_hits, similarity_hits in zip(rows, similarities)
+        ]
+
+    def _query_ann(self, query_vectors: np.ndarray, fetch: int) -> Tuple[np.ndarray, np.ndarray]:
+        return self._scan(query_vectors, fetch, None)
+
+    def _scan(self, query_vectors: np.ndarray, k: int, rows: Optional[np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+        """在 rows（None 为全部行）的量化码上估算相似度取候选，按需用全精度向量重新打分，返回每个查询的前 k 个行号和相似度"""
+        count = self._size if rows is None else len(rows)
+        similarities = np.empty((len(query_vectors), count), dtype=np.float32)
+        for start in range(0, count, SCAN_CHUNK_ROWS):
+            end = min(start + SCAN_CHUNK_ROWS, count)
+            chunk = slice(start, end) if rows is None else rows[start:end]
+            similarities[:, start:end] = self._approximate_similarities(query_vectors, self._ann["codes"][chunk])
+        rescore_factor = self.params["rescore_factor"]
+        k = min(k, count)
+        fetch = min(k * max(rescore_factor, 1), count)
+        top = np.argpartition(-similarities, fetch - 1, axis=1)[:, :fetch]
+        hits = np.empty((len(query_vectors), k), dtype=np.int64)
+        scores = np.empty((len(query_vectors), k), dtype=np.float32)
+        for i, columns in enumerate(top):
+            candidates = columns if rows is None else rows[columns]
+            if rescore_factor:
+                # 用全精度向量对候选重新打分
+                candidate_scores = self._vectors[candidates] @ query_vectors[i]
+            else:
+                candidate_scores = similarities[i, columns]
+            order = np.argsort(-candidate_scores, kind="stable")[:k]
+            hits[i] = candidates[order]
+            scores[i] = candidate_scores[order]
+        return hits, scores
+
+    # ---------- 子类实现 ----------
+
+    @abstractmethod
+    def _encode(self, vectors: np.ndarray, ann: Dict[str, np.ndarray]) -> np.ndarray:
+        """用量化器 ann 编码向量"""
+
+    @abstractmethod
+    def _approximate_similarities(self, query_vectors: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        """返回 (查询数, 行数) 的估算内积"""
+
+class Int8Index(QuantizedIndex):
+    """按维度做 int8 标量量化的检索后端，每条向量 1 字节/维，内存约为 float32 的 1/4"""
+    backend_name = "int8"
+    index_file = "int8.npz"
+    default_params = {"rescore_factor": 4}
+
+    def _build_ann(self, vectors: np.ndarray):
+        offset, scale = _int8_train(vectors)
+        ann = {"offset": offset, "scale": scale, "trained_rows": np.array(len(vectors))}
+        ann["codes"] = self._encode(vectors, ann)
+        return ann
+
+    def _encode(self, vectors: np.ndarray, ann: Dict[str, np.ndarray]) -> np.ndarray:
+        return _int8_encode(vectors, ann["offset"], ann["scale"])
+
+    def _approximate_similarities(self, query_vectors: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        return _int8_similarities(query_vectors, codes, self._ann["offset"], self._ann["scale"])
+
+class PQIndex(QuantizedIndex):
+    """乘积量化检索后端
+
+    向量切成 pq_m 段，每段用 2^nbits 个中心之一的编号表示，查询时用非对称距离（查表）估算相似度。
+    1024 维、pq_m=128 时每条向量 128 字节，内存约为 float32 的 1/32。
+    """
+    backend_name = "pq"
+    index_file = "pq.npz"
+    default_params = {
+        "pq_m": 128,
+        "nbits": 8,
+        # 每个中心约 39 个训练样本即可，与 faiss 的建议一致
+        "train_size": 10000,
+        "kmeans_iterations": 10,
+        "rescore_factor": 16
+    }
+
+    def _build_ann(self, vectors: np.ndarray):
+        dim = vectors.shape[1]
+        pq_m = self.params["pq_m"]
+        if dim % pq_m:
+            raise ValueError(f"pq_m={pq_m} must divide embedding dimension {dim}")
+        if not 1 <= self.params["nbits"] <= 8:
+            raise ValueError("nbits must be between 1 and 8")
+        rng = np.random.default_rng(0)
+        train = vectors
+        if len(vectors) > self.params["train_size"]:
+            train = vectors[np.sort(rng.choice(len(vectors), self.params["train_size"], replace=False))]
+        clusters = min(2 ** self.params["nbits"], len(train))
+        subvectors = train.reshape(len(train), pq_m, dim // pq_m)
+        ann = {
+            "centroids": np.stack([
+                _kmeans(subvectors[:, m], clusters, self.params["kmeans_iterations"], rng)
+                for m in range(pq_m)
+            ]).astype(np.float32),
+            "trained_rows": np.array(len(vectors))
+        }
+        ann["codes"] = self._encode(vectors, ann)
+        return ann
+
+    def _encode(self, vectors: np.ndarray, ann: Dict[str, np.ndarray]) -> np.ndarray:
+        centroids = ann["centroids"]
+        pq_m, _, sub_dim = centroids.shape
+        codes = np.empty((len(vectors), pq_m), dtype=np.uint8)
+        for start in range(0, len(vectors), SCAN_CHUNK_ROWS):
+            chunk = vectors[start:start + SCAN_CHUNK_ROWS].reshape(-1, pq_m, sub_dim)
+            for m in range(pq_m):
+                codes[start:start + len(chunk), m] = _nearest(chunk[:, m], centroids[m])
+        return codes
+
+    def _approximate_similarities(self, query_vectors: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        centroids = self._ann["centroids"]
+        pq_m, _, sub_dim = centroids.shape
+        # 每个查询先算出各段到各中心的内积表，再按编号查表求和
+        tables = np.einsum("qmd,mcd->qmc", query_vectors.reshape(len(query_vectors), pq_m, sub_dim), centroids)
+        segments = np.arange(pq_m)
+        return np.stack([table[segments, codes].sum(axis=1) for table in tables])
@@ -0,0 +1,145 @@
+import hashlib
+import threading
+import weakref
+from typing import Any, Callable, Dict, Hashable, Optional
+
+def secret_key(secret: Optional[str]) -> str:
+    """用于资源键的密钥摘要，避免在键中保存明文"""
+    return hashlib.sha256((secret or "").encode("utf-8")).hexdigest()[:16]
+
+class _Entry:
+    """注册表中的一项资源"""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.resource: Any = None
+        self.created = False
+        self.refcount = 0
+        self.close: Optional[Callable[[Any], None]] = None
+
+class ResourceLease:
+    """一次对共享资源的引用，release 或被回收时归还"""
+    def __init__(self, registry: "ResourceRegistry", key: Hashable, resource: Any):
+        self.key = key
+        self.resource = resource
+        # 会话状态被丢弃时自动归还引用
+        self._finalizer = weakref.finalize(self, registry.release, key)
+
+    def release(self):
+        """归还引用（重复调用无效）"""
+        self._finalizer()
+
+    @property
+    def released(self) -> bool:
+        return not self._finalizer.alive
+
+class ResourceRegistry:
+    """进程内共享资源的注册表
+
+    同一个键的资源只创建一次，所有使用者共享同一个实例；
+    按引用计数管理生命周期，最后一个引用归还时调用 close 释放资源。
+    不同键的资源可以并发创建，同一个键的并发请求会等待第一次创建完成。
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries: Dict[Hashable, _Entry] = {}
+
+    def acquire(
+        self,
+        key: Hashable,
+        factory: Callable[[], Any],
+        close: Optional[Callable[[Any], None]] = None
+    ) -> Any:
+        """
+        获取共享资源，引用计数加一
+
+        Args:
+            key: 资源键，如 ("embedding", 模型, 密钥摘要)
+            factory: 资源不存在时调用的创建函数
+            close: 最后一个引用归还时的清理函数，默认调用资源的 close 方法（如果有）
+
+        Returns:
+            Any: 共享的资源实例
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = _Entry()
+                self._entries[key] = entry
+            entry.refcount += 1
+        # 在单个资源的锁内创建，不阻塞其他资源
+        with entry.lock:
+            if not entry.created:
+                try:
+                    entry.resource = factory()
+                except Exception:
+                    self._decref(key, entry)
+                    raise
+                entry.close = close
+                entry.created = True
+            return entry.resource
+
+    def lease(
+        self,
+        key: Hashable,
+        factory: Callable[[], Any],
+        close: Optional[Callable[[Any], None]] = None
+    ) -> ResourceLease:
+        """获取共享资源并返回租约，租约被回收时自动归还引用"""
+        return ResourceLease(self, key, self.acquire(key, factory, close))
+
+    def release(self, key: Hashable):
+        """归还一次引用，引用计数归零时释放资源"""
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None:
+            return
+        self._decref(key, entry)
+
+    def _decref(self, key: Hashable, entry: _Entry):
+        with self._lock:
+            entry.refcount -= 1
+            if entry.refcount > 0:
+                return
+            if self._entries.get(key) is entry:
+                del self._entries[key]
+        if entry.created:
+            self._close(key, entry)
+
+    def _close(self, key: Hashable, entry: _Entry):
+        closer = entry.close or getattr(entry.resource, "close", None)
+        if closer is None:
+            return
+        try:
+            if entry.close:
+                closer(entry.resource)
+            else:
+                closer()
+        except Exception as e:
+            print(f"释放共享资源 {key} 时出错: {str(e)}")
+
+    def refcount(self, key: Hashable) -> int:
+        """当前引用计数"""
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry.refcount if entry else 0
+
+    def keys(self):
+        """当前持有的资源键"""
+        with self._lock:
+            return list(self._entries)
+
+    def close_all(self):
+        """释放所有资源（进程退出时使用）"""
+        with self._lock:
+            entries = list(self._entries.items())
+            self._entries.clear()
+        for key, entry in entries:
+            if entry.created:
+                self._close(key, entry)
+
+# 进程内默认的注册表，Streamlit 的所有会话共享
+_registry = ResourceRegistry()
+
+def get_registry() -> ResourceRegistry:
+    """获取进程内共享的资源注册表"""
+    return _registry
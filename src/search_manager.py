@@ -1,8 +1,13 @@
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple, Union
 from datetime import datetime
 from langchain_core.documents import Document
 import numpy as np
 
+try:
+    from .vector_store import DATE_EPOCH_FIELD
+except ImportError:
+    from vector_store import DATE_EPOCH_FIELD
+
 class SearchManager:
     def __init__(self, vector_store):
         self.vector_store = vector_store
@@ -37,77 +42,135 @@ class SearchManager:
         try:
             print(f"执行搜索: '{query}'")
             # 获取基础搜索结果
+            # 过滤条件在索引内求值，返回的都是满足条件的结果
             results = self.vector_store.similarity_search_with_score(
                 query,
-                k=k
+                k=k,
+                filter=self._build_where(filters)
             )
             
             if not results:
                 print("搜索返回0条结果，返回默认文档")
-                return [Document(
-                    page_content="对不起，我无法找到与您问题相关的信息。请尝试其他问题或调整搜索条件。",
-                    metadata={"source": "default", "date": datetime.now().isoformat()}
-                )]
+                return [self._default_document()]
                 
             print(f"搜索返回 {len(results)} 条结果")
-            
-            # 应用相似度阈值过滤（距离越小越好）
-            filtered_results = [
-                doc for doc, score in results 
-                if score <= score_threshold
-            ]
-            
-            # 应用元数据过滤
-            if filters and "metadata" in filters:
-                metadata_filters = filters["metadata"]
-                filtered_results = [
-                    doc for doc in filtered_results
-                    if all(
-                        doc.metadata.get(key) == value
-                        for key, value in metadata_filters.items()
-                    )
-                ]
-                
-            # 应用日期范围过滤
-            if filters and "date_range" in filters:
-                date_range = filters["date_range"]
-                start_date = datetime.strptime(date_range["start"], "%Y-%m-%d")
-                end_date = datetime.strptime(date_range["end"], "%Y-%m-%d")
-                
-                filtered_results = [
-                    doc for doc in filtered_results
-                    if "date" in doc.metadata and
-                    start_date <= datetime.fromisoformat(doc.metadata.get("date", "")) <= end_date
-                ]
-            
-            # 如果没有结果，返回一个默认文档
-            if not filtered_results:
-                # 如果过滤过于严格，返回基础搜索的前两个结果
-                if results:
-                    filtered_results = [doc for doc, _ in results[:2]]
-                # 如果还是没有结果，创建一个默认文档
-                if not filtered_results:
-                    filtered_results = [Document(
-                        page_content="对不起，我无法找到与您问题相关的信息。请尝试其他问题或调整搜索条件。",
-                        metadata={"source": "default", "date": datetime.now().isoformat()}
-                    )]
+            filtered_results = self._filter_results(results, score_threshold)
         except Exception as e:
             print(f"搜索时出错: {str(e)}")
             # 发生错误时返回默认文档
-            filtered_results = [Document(
-                page_content=f"搜索时出错: {str(e)}。请检查您的API密钥是否有效，或者尝试其他问题。",
-                metadata={"source": "error", "date": datetime.now().isoformat()}
-            )]
+            filtered_results = [self._error_document(e)]
                 
         # 记录搜索历史
+        self._record_history(query, filters, filtered_results)
+        
+        return filtered_results
+
+    def similarity_search_batch(
+        self,
+        queries: List[str],
+        filters: Optional[Dict] = None,
+        k: int = 4,
+        score_threshold: float = 0.5
+    ) -> List[List[Document]]:
+        """
+        批量搜索：所有查询一次嵌入、一次检索，过滤规则与 advanced_search 相同
+        
+        Args:
+            queries: 搜索查询列表
+            filters: 过滤条件，格式同 advanced_search，作用于所有查询
+            k: 每个查询返回结果数量
+            score_threshold: 相似度阈值（距离阈值，越小越好）
+            
+        Returns:
+            List[List[Document]]: 与 queries 顺序一致的搜索结果列表
+        """
+        if not queries:
+            return []
+        try:
+            print(f"批量执行 {len(queries)} 个搜索")
+            batch_results = self.vector_store.similarity_search_batch(
+                queries,
+                k=k,
+                filter=self._build_where(filters)
+            )
+            outputs = [
+                self._filter_results(results, score_threshold)
+                if results else [self._default_document()]
+                for results in batch_results
+            ]
+        except Exception as e:
+            print(f"批量搜索时出错: {str(e)}")
+            outputs = [[self._error_document(e)] for _ in queries]
+        
+        for query, filtered_results in zip(queries, outputs):
+            self._record_history(query, filters, filtered_results)
+        
+        return outputs
+
+    def _build_where(self, filters: Optional[Dict]) -> Optional[Dict]:
+        """将过滤条件编译为向量库的 where 条件（日期范围比较数值时间戳）"""
+        if not filters:
+            return None
+        conditions = [
+            {key: value}
+            for key, value in filters.get("metadata", {}).items()
+        ]
+        if "date_range" in filters:
+            date_range = filters["date_range"]
+            start_date = datetime.strptime(date_range["start"], "%Y-%m-%d")
+            end_date = datetime.strptime(date_range["end"], "%Y-%m-%d")
+            conditions.append({DATE_EPOCH_FIELD: {"$gte": start_date.timestamp()}})
+            conditions.append({DATE_EPOCH_FIELD: {"$lte": end_date.timestamp()}})
+        if not conditions:
+            return None
+        if len(conditions) == 1:
+            return conditions[0]
+        return {"$and": conditions}
+
+    def _filter_results(
+        self,
+        results: List[Tuple[Document, float]],
+        score_threshold: float
+    ) -> List[Document]:
+        """对搜索结果应用相似度阈值，全部低于阈值时回退"""
+        # 应用相似度阈值过滤（距离越小越好）
+        filtered_results = [
+            doc for doc, score in results 
+            if score <= score_threshold
+        ]
+        
+        # 如果没有结果，返回一个默认文档
+        if not filtered_results:
+            # 阈值过于严格时，返回满足过滤条件的前两个结果
+            if results:
+                filtered_results = [doc for doc, _ in results[:2]]
+            # 如果还是没有结果，创建一个默认文档
+            if not filtered_results:
+                filtered_results = [self._default_document()]
+        return filtered_results
+
+    def _default_document(self) -> Document:
+        """没有相关结果时返回的默认文档"""
+        return Document(
+            page_content="对不起，我无法找到与您问题相关的信息。请尝试其他问题或调整搜索条件。",
+            metadata={"source": "default", "date": datetime.now().isoformat()}
+        )
+
+    def _error_document(self, error: Exception) -> Document:
+        """搜索出错时返回的文档"""
+        return Document(
+            page_content=f"搜索时出错: {str(error)}。请检查您的API密钥是否有效，或者尝试其他问题。",
+            metadata={"source": "error", "date": datetime.now().isoformat()}
+        )
+
+    def _record_history(self, query: str, filters: Optional[Dict], results: List[Document]):
+        """记录搜索历史"""
         self.search_history.append({
             "query": query,
             "filters": filters,
             "timestamp": datetime.now(),
-            "result_count": len(filtered_results)
+            "result_count": len(results)
         })
-        
-        return filtered_results
     
     def get_search_history(self, limit: int = 10) -> List[Dict]:
         """获取最近的搜索历史"""
@@ -125,27 +188,29 @@ class SearchManager:
         try:
             # 使用已有的向量数据库中的embedding实例，而不是创建新的
             embedding = self.vector_store.embedding
-            query_embedding = embedding.embed_query(query)
+            query_embedding = np.asarray(embedding.embed_query(query), dtype=np.float32)
             
-            # 计算历史查询的相似度
-            similarities = []
-            for history in self.search_history:
-                history_embedding = embedding.embed_query(history["query"])
-                similarity = self._cosine_similarity(query_embedding, history_embedding)
-                similarities.append((history["query"], similarity))
+            # 一次性嵌入所有历史查询，并批量计算相似度
+            history_queries = [history["query"] for history in self.search_history]
+            history_embeddings = np.asarray(
+                embedding.embed_documents(history_queries), dtype=np.float32
+            )
+            norms = np.linalg.norm(history_embeddings, axis=1) * np.linalg.norm(query_embedding)
+            similarities = history_embeddings @ query_embedding / np.where(norms == 0, 1, norms)
                 
-            # 返回最相似的k个查询
-            similarities.sort(key=lambda x: x[1], reverse=True)
-            return [query for query, _ in similarities[:k]]
+            # 返回最相似的k个查询（相似度相同时保持原有顺序）
+            order = np.argsort(-similarities, kind="stable")
+            return [history_queries[i] for i in order[:k]]
         except Exception as e:
             print(f"计算相似查询时出错: {str(e)}")
             return []
     
-    def _cosine_similarity(self, v1: List[float], v2: List[float]) -> float:
+    def _cosine_similarity(self, v1: Union[List[float], np.ndarray], v2: Union[List[float], np.ndarray]) -> float:
         """计算余弦相似度"""
         try:
-            v1_array = np.array(v1)
-            v2_array = np.array(v2)
+            # 已是 float32 ndarray 时不会复制
+            v1_array = np.asarray(v1, dtype=np.float32)
+            v2_array = np.asarray(v2, dtype=np.float32)
             return np.dot(v1_array, v2_array) / (np.linalg.norm(v1_array) * np.linalg.norm(v2_array))
         except Exception as e:
             print(f"计算余弦相似度时出错: {str(e)}")
@@ -0,0 +1,333 @@
+import os
+import uuid
+import heapq
+import hashlib
+import itertools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional, Tuple, Callable, Iterable, Set, Union
+import numpy as np
+from langchain_core.documents import Document
+from langchain.embeddings.base import Embeddings
+
+try:
+    from .vector_store import VectorStore
+    from .snapshot import write_snapshot, publish_snapshot, describe_embedding
+except ImportError:
+    from vector_store import VectorStore
+    from snapshot import write_snapshot, publish_snapshot, describe_embedding
+
+# 记录分块所属分片的元数据字段，过滤条件中按该字段跳过分片
+SHARD_FIELD = "shard"
+DEFAULT_SHARD = "default"
+
+def default_shard_key(document: Document) -> str:
+    """按来源文件所在的目录分片，如 data/knowledge_db/easy_rl/x.txt 属于 easy_rl"""
+    source = (document.metadata or {}).get("source")
+    if not source:
+        return DEFAULT_SHARD
+    return os.path.basename(os.path.dirname(str(source))) or DEFAULT_SHARD
+
+def _collection_name(shard: str) -> str:
+    """分片对应的 Chroma 集合名（集合名只允许 ASCII 字符）"""
+    return "shard_" + hashlib.sha256(shard.encode("utf-8")).hexdigest()[:16]
+
+def shards_for_filter(where: Optional[Dict[str, Any]], shards: Iterable[str]) -> Set[str]:
+    """
+    根据过滤条件中的分片字段推断需要查询的分片
+
+    无法判断的条件（如只涉及其他字段）保留全部分片
+    """
+    shards = set(shards)
+    if not where:
+        return shards
+    selected = set(shards)
+    for key, condition in where.items():
+        if key == "$and":
+            for clause in condition:
+                selected &= shards_for_filter(clause, shards)
+        elif key == "$or":
+            selected &= set().union(*(shards_for_filter(clause, shards) for clause in condition))
+        elif key == SHARD_FIELD:
+            if not isinstance(condition, dict):
+                condition = {"$eq": condition}
+            for operator, value in condition.items():
+                if operator == "$eq":
+                    selected &= {value}
+                elif operator == "$in":
+                    selected &= set(value)
+                elif operator == "$ne":
+                    selected -= {value}
+                elif operator == "$nin":
+                    selected -= set(value)
+    return selected
+
+class ShardedVectorStore:
+    """按领域分片的向量库
+
+    每个分片是一个独立的 VectorStore（持久化时各自一个子目录，Chroma 分片各自一个集合），
+    可以单独重建。写入按分片分组后并行执行；查询只嵌入一次，
+    用线程池并行检索各分片，再用堆合并出全局 top-k。
+    过滤条件中限定了分片字段时，被排除的分片不参与查询。
+    接口与 VectorStore 保持一致，SearchManager 可以直接使用。
+    """
+    def __init__(
+        self,
+        persist_directory: Optional[str],
+        embedding: Embeddings,
+        backend: str = "chroma",
+        index_params: Optional[Dict[str, Any]] = None,
+        shard_key: Callable[[Document], str] = default_shard_key,
+        max_workers: Optional[int] = None,
+        commit_size: int = 0,
+        commit_interval: Optional[float] = None
+    ):
+        self.embedding = embedding
+        self.persist_directory = persist_directory
+        self.backend = backend
+        self.index_params = index_params
+        self.shard_key = shard_key
+        # 各分片的写入缓冲参数，见 VectorStore
+        self.commit_size = commit_size
+        self.commit_interval = commit_interval
+        self.shards: Dict[str, VectorStore] = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers or min(32, (os.cpu_count() or 1) + 4),
+            thread_name_prefix="vector-shard"
+        )
+
+        if persist_directory:
+            os.makedirs(persist_directory, exist_ok=True)
+            # 打开已有的分片（每个子目录一个分片）
+            for name in sorted(os.listdir(persist_directory)):
+                if os.path.isdir(os.path.join(persist_directory, name)):
+                    self.shard(name)
+
+    def shard(self, name: str) -> VectorStore:
+        """获取分片，不存在时创建"""
+        with self._lock:
+            store = self.shards.get(name)
+            if store is None:
+                if not name or name.startswith(".") or os.sep in name or (os.altsep and os.altsep in name):
+                    raise ValueError(f"Invalid shard name: {name!r}")
+                store = VectorStore(
+                    persist_directory=os.path.join(self.persist_directory, name) if self.persist_directory else None,
+                    embedding=self.embedding,
+                    backend=self.backend,
+                    index_params=self.index_params,
+                    collection_name=_collection_name(name),
+                    commit_size=self.commit_size,
+                    commit_interval=self.commit_interval
+                )
+                self.shards[name] = store
+            return store
+
+    def shard_names(self) -> List[str]:
+        """当前的全部分片"""
+        with self._lock:
+            return sorted(self.shards)
+
+    # ---------- 写入 ----------
+
+    def _group(self, documents: List[Document]) -> Dict[str, List[Document]]:
+        """按分片分组，并把分片名写入元数据"""
+        groups: Dict[str, List[Document]] = {}
+        for doc in documents:
+            metadata = doc.metadata or {}
+            name = metadata.get(SHARD_FIELD) or self.shard_key(doc)
+            groups.setdefault(name, []).append(
+                Document(page_content=doc.page_content, metadata={**metadata, SHARD_FIELD: name})
+            )
+        return groups
+
+    def _map_shards(self, func: Callable[[VectorStore, Any], Any], items: Dict[str, Any]) -> Dict[str, Any]:
+        """在线程池中对各分片并行执行，返回 {分片: 结果}"""
+        stores = {name: self.shard(name) for name in items}
+        futures = {name: self._executor.submit(func, stores[name], item) for name, item in items.items()}
+        return {name: future.result() for name, future in futures.items()}
+
+    def add_documents(self, documents: List[Document]):
+        """按分片并行写入文档"""
+        self._map_shards(lambda store, docs: store.add_documents(docs), self._group(documents))
+
+    def upsert_documents(self, documents: List[Document]) -> Dict[str, int]:
+        """按分片并行增量写入，返回各分片统计之和"""
+        results = self._map_shards(lambda store, docs: store.upsert_documents(docs), self._group(documents))
+        stats = {"added": 0, "unchanged": 0, "removed": 0}
+        for shard_stats in results.values():
+            for key in stats:
+                stats[key] += shard_stats[key]
+        return stats
+
+    def add_embeddings(
+        self,
+        texts: List[str],
+        embeddings: Union[np.ndarray, List[List[float]]],
+        metadatas: Optional[List[Dict[str, Any]]] = None,
+        ids: Optional[List[str]] = None
+    ) -> List[str]:
+        """按元数据分片后并行写入已经计算好的向量"""
+        if len(texts) != len(embeddings):
+            raise ValueError("texts and embeddings must have the same length")
+        if ids is None:
+            ids = [str(uuid.uuid4()) for _ in texts]
+        metadatas = metadatas or [{} for _ in texts]
+        rows: Dict[str, List[int]] = {}
+        for row, (text, metadata) in enumerate(zip(texts, metadatas)):
+            metadata = metadata or {}
+            name = metadata.get(SHARD_FIELD) or self.shard_key(Document(page_content=text, metadata=metadata))
+            rows.setdefault(name, []).append(row)
+
+        def write(store: VectorStore, name: str):
+            shard_rows = rows[name]
+            store.add_embeddings(
+                [texts[row] for row in shard_rows],
+                embeddings[shard_rows] if isinstance(embeddings, np.ndarray) else [embeddings[row] for row in shard_rows],
+                [{**(metadatas[row] or {}), SHARD_FIELD: name} for row in shard_rows],
+                [ids[row] for row in shard_rows]
+            )
+        self._map_shards(write, {name: name for name in rows})
+        return ids
+
+    def existing_ids(self, ids: List[str]) -> Set[str]:
+        """已写入的分块ID"""
+        if not ids:
+            return set()
+        results = self._map_shards(lambda store, _: store.existing_ids(ids), dict.fromkeys(self.shard_names()))
+        return set().union(*results.values())
+
+    def prune_source(self, source: str, keep_ids: Iterable[str]) -> int:
+        """删除来源下不在 keep_ids 中的旧分块"""
+        keep_ids = set(keep_ids)
+        results = self._map_shards(lambda store, _: store.prune_source(source, keep_ids), dict.fromkeys(self.shard_names()))
+        return sum(results.values())
+
+    def rebuild_shard(self, name: str, documents: List[Document]) -> Dict[str, int]:
+        """清空并重建单个分片，其他分片不受影响"""
+        store = self.shard(name)
+        documents = [
+            Document(page_content=doc.page_content, metadata={**(doc.metadata or {}), SHARD_FIELD: name})
+            for doc in documents
+        ]
+        # 与其他写入路径一样使用稳定的分块ID，之后可以继续增量更新和按ID删除
+        return store.replace_documents(documents)
+
+    def update_sources(self, sources: Dict[str, List[str]]) -> int:
+        """写回近似重复合并后分块的来源列表，各分片只处理自己的分块，返回删除的数量"""
+        if not sources:
+            return 0
+        results = self._map_shards(lambda store, _: store.update_sources(sources), dict.fromkeys(self.shard_names()))
+        return sum(results.values())
+
+    def delete(self, ids: List[str]) -> int:
+        """按ID删除分块，返回删除的数量"""
+        if not ids:
+            return 0
+        results = self._map_shards(lambda store, _: store.delete(ids), dict.fromkeys(self.shard_names()))
+        return sum(results.values())
+
+    def delete_by_source(self, sources: Union[str, List[str]]) -> int:
+        """删除一个或多个来源文件的全部分块，返回删除的数量"""
+        results = self._map_shards(lambda store, _: store.delete_by_source(sources), dict.fromkeys(self.shard_names()))
+        return sum(results.values())
+
+    def clear(self) -> int:
+        """删除全部分块，返回删除的数量"""
+        results = self._map_shards(lambda store, _: store.clear(), dict.fromkeys(self.shard_names()))
+        return sum(results.values())
+
+    def compact(self) -> int:
+        """并行压缩各分片"""
+        results = self._map_shards(lambda store, _: store.compact(), dict.fromkeys(self.shard_names()))
+        return sum(results.values())
+
+    def flush(self) -> int:
+        """并行提交各分片的写入缓冲，返回写入的文档数量"""
+        results = self._map_shards(lambda store, _: store.flush(), dict.fromkeys(self.shard_names()))
+        return sum(results.values())
+
+    def persist(self):
+        """持久化全部分片"""
+        self._map_shards(lambda store, _: store.persist(), dict.fromkeys(self.shard_names()))
+
+    def export_snapshot(
+        self,
+        directory: str,
+        chunking: Optional[Dict[str, Any]] = None,
+        dtype: str = "float32",
+        publish: bool = False
+    ) -> Dict[str, Any]:
+        """把全部分片合并导出为一个快照，分片名保存在元数据中（publish 见 VectorStore.export_snapshot）"""
+        ids, texts, metadatas, vectors = [], [], [], []
+        for name in self.shard_names():
+            # 包含写入缓冲中的文档，导出时不遗漏
+            records = self.shards[name].get_records()
+            ids.extend(records["ids"])
+            texts.extend(records["documents"])
+            metadatas.extend(records["metadatas"])
+            if len(records["ids"]):
+                vectors.append(np.asarray(records["embeddings"], dtype=np.float32))
+        vectors = np.concatenate(vectors) if vectors else np.zeros((0, 0), dtype=np.float32)
+        write = publish_snapshot if publish else write_snapshot
+        manifest = write(
+            directory, ids, texts, metadatas, vectors,
+            dtype=dtype,
+            embedding=describe_embedding(self.embedding, vectors.shape[1] if len(vectors) else 0),
+            chunking=chunking
+        )
+        print(f"已导出 {manifest['count']} 个分块到快照 {directory}")
+        return manifest
+
+    def close(self):
+        """停止各分片的后台任务并关闭线程池"""
+        for name in self.shard_names():
+            self.shards[name].close()
+        self._executor.shutdown(wait=True)
+
+    # ---------- 查询 ----------
+
+    def similarity_search(self, query: str, k: int = 4, filter: Optional[Dict[str, Any]] = None) -> List[Document]:
+        """相似度搜索"""
+        return [doc for doc, _ in self.similarity_search_with_score(query, k=k, filter=filter)]
+
+    def similarity_search_with_score(
+        self,
+        query: str,
+        k: int = 4,
+        filter: Optional[Dict[str, Any]] = None
+    ) -> List[Tuple[Document, float]]:
+        """带分数的相似度搜索，各分片并行检索后合并"""
+        return self.similarity_search_batch([query], k=k, filter=filter)[0]
+
+    def similarity_search_batch(
+        self,
+        queries: List[str],
+        k: int = 4,
+        filter: Optional[Dict[str, Any]] = None
+    ) -> List[List[Tuple[Document, float]]]:
+        """批量相似度搜索：一次嵌入所有查询，各分片并行检索，再按距离合并出全局 top-k"""
+        if not queries:
+            return []
+        names = shards_for_filter(filter, self.shard_names())
+        # 空分片不参与查询
+        names = [name for name in sorted(names) if name in self.shards and self.shards[name].get_document_count()]
+        if not names:
+            return [[] for _ in queries]
+        embeddings = self.embedding.embed_documents(list(queries))
+        shard_results = self._map_shards(
+            lambda store, _: store.similarity_search_by_vectors_with_score(embeddings, k=k, filter=filter),
+            dict.fromkeys(names)
+        )
+        # 各分片的结果已按距离升序排列，用堆归并取前 k 个
+        return [
+            list(itertools.islice(
+                heapq.merge(*(shard_results[name][i] for name in names), key=lambda hit: hit[1]),
+                k
+            ))
+            for i in range(len(queries))
+        ]
+
+    def get_document_count(self) -> int:
+        """获取全部分片的文档数量"""
+        return sum(self.shards[name].get_document_count() for name in self.shard_names())
@@ -0,0 +1,502 @@
+import os
+import re
+import json
+import time
+import shutil
+from datetime import datetime
+from typing import List, Dict, Any, Optional, Sequence, Tuple, Union
+import numpy as np
+from langchain_core.documents import Document
+from langchain.embeddings.base import Embeddings
+
+try:
+    from .flat_index import FlatIndex, VECTORS_FILE, _normalize, _is_number
+    from .quantized_index import SCAN_CHUNK_ROWS, _int8_train, _int8_encode, _int8_similarities
+except ImportError:
+    from flat_index import FlatIndex, VECTORS_FILE, _normalize, _is_number
+    from quantized_index import SCAN_CHUNK_ROWS, _int8_train, _int8_encode, _int8_similarities
+
+SNAPSHOT_FORMAT = "kb-snapshot"
+SNAPSHOT_VERSION = 1
+SNAPSHOT_DTYPES = ("float32", "int8")
+MANIFEST_FILE = "manifest.json"
+RECORDS_FILE = "records.bin"
+QUANTIZATION_FILE = "quantization.npy"
+# 版本化快照：每个版本一个子目录，CURRENT 文件记录当前发布的版本
+CURRENT_FILE = "CURRENT"
+VERSION_PATTERN = re.compile(r"^v\d{6}$")
+
+def describe_embedding(embedding: Embeddings, dim: int) -> Dict[str, Any]:
+    """记录到清单中的嵌入模型信息"""
+    return {
+        "class": type(embedding).__name__,
+        "model": getattr(embedding, "model", None),
+        "dim": dim
+    }
+
+def current_version(directory: str) -> Optional[str]:
+    """版本化快照当前发布的版本，非版本化的目录返回 None"""
+    try:
+        with open(os.path.join(directory, CURRENT_FILE), "r", encoding="utf-8") as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+def resolve_snapshot(directory: str) -> str:
+    """快照文件实际所在的目录（版本化快照指向当前版本）"""
+    version = current_version(directory)
+    return os.path.join(directory, version) if version else directory
+
+def is_snapshot(directory: Optional[str]) -> bool:
+    """目录中是否有快照"""
+    return bool(directory) and os.path.exists(os.path.join(resolve_snapshot(directory), MANIFEST_FILE))
+
+def _list_versions(directory: str) -> List[str]:
+    """按版本号排序的全部版本目录"""
+    if not os.path.isdir(directory):
+        return []
+    return sorted(
+        name for name in os.listdir(directory)
+        if VERSION_PATTERN.match(name) and os.path.isdir(os.path.join(directory, name))
+    )
+
+def read_manifest(directory: str) -> Dict[str, Any]:
+    """读取并校验快照清单"""
+    with open(os.path.join(directory, MANIFEST_FILE), "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    if manifest.get("format") != SNAPSHOT_FORMAT or manifest.get("version") != SNAPSHOT_VERSION:
+        raise ValueError(f"Unsupported snapshot at {directory}: {manifest.get('format')} v{manifest.get('version')}")
+    return manifest
+
+# ---------- 列式记录文件 ----------
+
+def _column_kind(values: Sequence[Any]) -> str:
+    """根据非空值推断列类型"""
+    present = [value for value in values if value is not None]
+    if present and all(isinstance(value, bool) for value in present):
+        return "bool"
+    if present and all(isinstance(value, int) and not isinstance(value, bool) for value in present):
+        return "int"
+    if present and all(_is_number(value) for value in present):
+        return "float"
+    if all(isinstance(value, str) for value in present):
+        return "string"
+    # 类型混杂的列按 JSON 文本保存
+    return "json"
+
+def _write_segment(f, array: np.ndarray) -> List[int]:
+    """写入一段数组（按8字节对齐），返回 [偏移, 字节数]"""
+    padding = -f.tell() % 8
+    if padding:
+        f.write(b"\0" * padding)
+    position = f.tell()
+    array = np.ascontiguousarray(array)
+    f.write(array.data)
+    return [position, array.nbytes]
+
+def _write_column(f, values: Sequence[Any]) -> Dict[str, Any]:
+    """写入一列，返回该列在记录文件中的描述"""
+    kind = _column_kind(values)
+    valid = np.array([value is not None for value in values], dtype=bool)
+    column = {"kind": kind, "valid": _write_segment(f, valid)}
+    if kind in ("string", "json"):
+        encoded = [
+            b"" if value is None else (value if kind == "string" else json.dumps(value, ensure_ascii=False)).encode("utf-8")
+            for value in values
+        ]
+        offsets = np.zeros(len(values) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(item) for item in encoded])
+        column["offsets"] = _write_segment(f, offsets)
+        column["data"] = _write_segment(f, np.frombuffer(b"".join(encoded), dtype=np.uint8))
+    else:
+        dtype = {"bool": np.bool_, "int": np.int64, "float": np.float64}[kind]
+        default = {"bool": False, "int": 0, "float": np.nan}[kind]
+        column["values"] = _write_segment(
+            f, np.array([default if value is None else value for value in values], dtype=dtype)
+        )
+    return column
+
+def _segment(records: np.ndarray, segment: List[int], dtype) -> np.ndarray:
+    """记录文件中一段数据的零拷贝视图"""
+    offset, nbytes = segment
+    return records[offset:offset + nbytes].view(dtype)
+
+class _SnapshotColumn:
+    """映射在记录文件上的一列，按行读取时才解码"""
+    def __init__(self, records: np.ndarray, column: Dict[str, Any]):
+        self.kind = column["kind"]
+        self.valid = _segment(records, column["valid"], np.bool_)
+        if self.kind in ("string", "json"):
+            self.offsets = _segment(records, column["offsets"], np.int64)
+            self.data = _segment(records, column["data"], np.uint8)
+        else:
+            dtype = {"bool": np.bool_, "int": np.int64, "float": np.float64}[self.kind]
+            self.values = _segment(records, column["values"], dtype)
+
+    def __len__(self) -> int:
+        return len(self.valid)
+
+    def __getitem__(self, row: int) -> Any:
+        if not self.valid[row]:
+            return None
+        if self.kind in ("string", "json"):
+            text = bytes(self.data[self.offsets[row]:self.offsets[row + 1]]).decode("utf-8")
+            return text if self.kind == "string" else json.loads(text)
+        return self.values[row].item()
+
+    def __iter__(self):
+        for row in range(len(self)):
+            yield self[row]
+
+    def to_objects(self) -> np.ndarray:
+        """整列解码为 object 数组"""
+        array = np.empty(len(self), dtype=object)
+        for row, value in enumerate(self):
+            array[row] = value
+        return array
+
+    def to_floats(self) -> Optional[np.ndarray]:
+        """数值列转换为 float 数组（缺失记为 NaN），非数值列返回 None"""
+        if self.kind not in ("int", "float"):
+            return None
+        return np.where(self.valid, self.values.astype(np.float64), np.nan)
+
+def write_snapshot(
+    directory: str,
+    ids: Sequence[str],
+    texts: Sequence[str],
+    metadatas: Sequence[Optional[Dict[str, Any]]],
+    vectors: Union[np.ndarray, List[List[float]]],
+    dtype: str = "float32",
+    embedding: Optional[Dict[str, Any]] = None,
+    chunking: Optional[Dict[str, Any]] = None
+) -> Dict[str, Any]:
+    """
+    写出快照目录
+
+    Args:
+        directory: 快照目录
+        ids/texts/metadatas/vectors: 各条记录
+        dtype: 向量存储类型，float32 或 int8（按维度标量量化，体积为1/4）
+        embedding: 嵌入模型信息，导入时用于校验
+        chunking: 分块参数，如 {"chunk_size": 500, "chunk_overlap": 50}
+
+    Returns:
+        Dict: 快照清单
+    """
+    if dtype not in SNAPSHOT_DTYPES:
+        raise ValueError(f"Unsupported snapshot dtype: {dtype}")
+    count = len(ids)
+    if not len(texts) == len(metadatas) == len(vectors) == count:
+        raise ValueError("ids, texts, metadatas and vectors must have the same length")
+    os.makedirs(directory, exist_ok=True)
+
+    # 每个文件先写临时文件再替换，已映射旧文件的读者不受影响；清单最后替换
+    replacements = []
+    def temp_path(name: str) -> str:
+        path = os.path.join(directory, name)
+        replacements.append((path + ".tmp", path))
+        return path + ".tmp"
+
+    dim = 0
+    if count:
+        matrix = _normalize(np.asarray(vectors, dtype=np.float32).reshape(count, -1))
+        dim = matrix.shape[1]
+        if dtype == "int8":
+            offset, scale = _int8_train(matrix)
+            with open(temp_path(QUANTIZATION_FILE), "wb") as f:
+                np.save(f, np.stack([offset, scale]))
+            matrix = _int8_encode(matrix, offset, scale)
+        with open(temp_path(VECTORS_FILE), "wb") as f:
+            np.save(f, matrix)
+
+    metadatas = [metadata or {} for metadata in metadatas]
+    keys = sorted({key for metadata in metadatas for key in metadata})
+    with open(temp_path(RECORDS_FILE), "wb") as f:
+        records = {
+            "ids": _write_column(f, list(ids)),
+            "documents": _write_column(f, list(texts)),
+            "metadata": {key: _write_column(f, [metadata.get(key) for metadata in metadatas]) for key in keys}
+        }
+
+    manifest = {
+        "format": SNAPSHOT_FORMAT,
+        "version": SNAPSHOT_VERSION,
+        "created_at": datetime.now().isoformat(),
+        "count": count,
+        "dim": dim,
+        "dtype": dtype,
+        "embedding": embedding or {},
+        "chunking": chunking or {},
+        "records": records
+    }
+    with open(temp_path(MANIFEST_FILE), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    for source, target in replacements:
+        os.replace(source, target)
+    return manifest
+
+def publish_snapshot(
+    directory: str,
+    ids: Sequence[str],
+    texts: Sequence[str],
+    metadatas: Sequence[Optional[Dict[str, Any]]],
+    vectors: Union[np.ndarray, List[List[float]]],
+    dtype: str = "float32",
+    embedding: Optional[Dict[str, Any]] = None,
+    chunking: Optional[Dict[str, Any]] = None,
+    keep_versions: int = 2
+) -> Dict[str, Any]:
+    """
+    以新版本发布快照：先完整写出新的版本目录，再原子替换 CURRENT 指针
+
+    只允许一个写入进程发布。只读打开的进程继续使用已映射的旧版本，
+    刷新时切换到新版本；旧版本只保留最近 keep_versions 个
+    （POSIX 系统上删除已映射的文件不影响正在读取的进程）。
+
+    Returns:
+        Dict: 快照清单，snapshot_version 为发布的版本
+    """
+    if keep_versions < 1:
+        raise ValueError("keep_versions must be at least 1")
+    os.makedirs(directory, exist_ok=True)
+    versions = _list_versions(directory)
+    version = f"v{int(versions[-1][1:]) + 1 if versions else 1:06d}"
+    manifest = write_snapshot(
+        os.path.join(directory, version), ids, texts, metadatas, vectors,
+        dtype=dtype, embedding=embedding, chunking=chunking
+    )
+    pointer = os.path.join(directory, CURRENT_FILE)
+    with open(pointer + ".tmp", "w", encoding="utf-8") as f:
+        f.write(version)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(pointer + ".tmp", pointer)
+    for old in _list_versions(directory)[:-keep_versions]:
+        shutil.rmtree(os.path.join(directory, old), ignore_errors=True)
+    return {**manifest, "snapshot_version": version}
+
+class SnapshotIndex(FlatIndex):
+    """直接映射快照文件的检索后端
+
+    向量矩阵和列式记录都以只读内存映射方式打开，文本和元数据在返回结果时才按行解码，
+    打开快照不需要重新嵌入，也不需要把数据读入内存。
+    int8 快照直接在量化码上计算相似度。
+    删除只记墓碑；首次写入时把快照复制为可写的内存结构，persist 时重新写出快照
+    （版本化快照发布为新版本）。
+    只读模式下拒绝写入，并每隔 refresh_interval 秒检查是否发布了新版本，
+    多个进程可以通过系统页缓存共享同一份映射。
+    """
+    def __init__(
+        self,
+        embedding: Optional[Embeddings],
+        snapshot_directory: str,
+        read_only: bool = False,
+        refresh_interval: float = 1.0
+    ):
+        self.snapshot_directory = snapshot_directory
+        self.read_only = read_only
+        self.refresh_interval = refresh_interval
+        self._id_map: Optional[Dict[str, int]] = None
+        super().__init__(embedding)
+        self._open()
+
+    @property
+    def _id_to_row(self) -> Dict[str, int]:
+        # ID 到行号的映射在第一次按ID访问时才建立
+        if self._id_map is None:
+            self._id_map = {chunk_id: row for row, chunk_id in enumerate(self._ids)}
+        return self._id_map
+
+    @_id_to_row.setter
+    def _id_to_row(self, value: Dict[str, int]):
+        self._id_map = value
+
+    def _open(self):
+        """映射快照当前版本的文件"""
+        for attempt in range(3):
+            self.version = current_version(self.snapshot_directory)
+            try:
+                self._open_directory(resolve_snapshot(self.snapshot_directory))
+                break
+            except FileNotFoundError:
+                # 打开期间旧版本被清理，重新读取 CURRENT
+                if self.version is None or attempt == 2:
+                    raise
+        self._checked_at = time.monotonic()
+        model = getattr(self.embedding, "model", None)
+        expected = self.manifest["embedding"].get("model")
+        if model and expected and model != expected:
+            raise ValueError(f"Snapshot was built with embedding model {expected}, not {model}")
+
+    def _open_directory(self, directory: str):
+        self.manifest = read_manifest(directory)
+        self._reset()
+        self._id_map = None
+        self._quantization = None
+        self._materialized = False
+        # 有未写回快照的修改
+        self._dirty = False
+        self._size = self.manifest["count"]
+        if not self._size:
+            return
+        self._vectors = np.load(os.path.join(directory, VECTORS_FILE), mmap_mode="r")
+        if self.manifest["dtype"] == "int8":
+            self._quantization = np.load(os.path.join(directory, QUANTIZATION_FILE))
+        records = np.memmap(os.path.join(directory, RECORDS_FILE), dtype=np.uint8, mode="r")
+        layout = self.manifest["records"]
+        self._ids = _SnapshotColumn(records, layout["ids"])
+        self._documents = _SnapshotColumn(records, layout["documents"])
+        self._columns = {key: _SnapshotColumn(records, column) for key, column in layout["metadata"].items()}
+
+    def refresh(self) -> bool:
+        """切换到新发布的快照版本，返回是否发生了切换"""
+        with self._lock:
+            self._checked_at = time.monotonic()
+            version = current_version(self.snapshot_directory)
+            if version is None or version == self.version:
+                return False
+            if self._dirty:
+                raise ValueError("Cannot refresh a snapshot with unpersisted changes")
+            self._open()
+            return True
+
+    def _maybe_refresh(self):
+        """只读模式下定期检查新版本"""
+        if self.read_only and time.monotonic() - self._checked_at >= self.refresh_interval:
+            self.refresh()
+
+    def _check_writable(self):
+        if self.read_only:
+            raise ValueError("Snapshot is opened read-only")
+
+    def _dequantize(self, codes: np.ndarray) -> np.ndarray:
+        """int8 量化码还原为归一化的 float32 向量（与写入快照时的量化参数对应）"""
+        offset, scale = self._quantization
+        return _normalize(offset + scale * (np.asarray(codes).astype(np.float32) + 128))
+
+    def _materialize(self):
+        """首次写入前把映射的快照复制为可写的内存结构"""
+        if self._materialized:
+            return
+        self._ids = list(self._ids)
+        self._documents = list(self._documents)
+        self._columns = {key: list(column) for key, column in self._columns.items()}
+        if self._quantization is not None:
+            self._vectors = self._dequantize(self._vectors[:self._size])
+            self._quantization = None
+        self._column_arrays = {}
+        self._materialized = True
+        self._dirty = True
+
+    def add_embeddings(self, texts, embeddings, metadatas=None, ids=None) -> List[str]:
+        self._check_writable()
+        with self._lock:
+            self._materialize()
+            return super().add_embeddings(texts, embeddings, metadatas, ids)
+
+    def update_metadata(self, ids: Sequence[str], metadatas: List[Dict[str, Any]]) -> int:
+        self._check_writable()
+        with self._lock:
+            self._materialize()
+            return super().update_metadata(ids, metadatas)
+
+    def delete(self, ids: Optional[List[str]] = None) -> int:
+        # 删除只记墓碑，不需要复制快照
+        self._check_writable()
+        with self._lock:
+            removed = super().delete(ids)
+            self._dirty = self._dirty or bool(removed)
+            return removed
+
+    def clear(self) -> int:
+        self._check_writable()
+        with self._lock:
+            removed = super().clear()
+            self._quantization = None
+            self._materialized = True
+            self._dirty = True
+            return removed
+
+    def compact(self) -> int:
+        self._check_writable()
+        with self._lock:
+            removed = super().compact()
+            self._dirty = self._dirty or bool(removed)
+            return removed
+
+    def persist(self):
+        """有修改时回收已删除记录，重新写出快照（版本化快照发布新版本）并重新映射"""
+        self._check_writable()
+        with self._lock:
+            if not self._dirty:
+                return
+            self._materialize()
+            self.compact()
+            write = write_snapshot if self.version is None else publish_snapshot
+            write(
+                self.snapshot_directory,
+                self._ids,
+                self._documents,
+                [self._metadata(row) for row in range(self._size)],
+                self._vectors[:self._size] if self._size else [],
+                dtype=self.manifest["dtype"],
+                embedding=self.manifest["embedding"],
+                chunking=self.manifest["chunking"]
+            )
+            self._open()
+
+    def similarity_search_by_vectors_with_score(
+        self,
+        embeddings: Union[np.ndarray, List[List[float]]],
+        k: int = 4,
+        filter: Optional[Dict[str, Any]] = None
+    ) -> List[List[Tuple[Document, float]]]:
+        self._maybe_refresh()
+        return super().similarity_search_by_vectors_with_score(embeddings, k=k, filter=filter)
+
+    def get(
+        self,
+        ids: Optional[Sequence[str]] = None,
+        where: Optional[Dict[str, Any]] = None,
+        include: Optional[List[str]] = None
+    ) -> Dict[str, Any]:
+        self._maybe_refresh()
+        with self._lock:
+            result = super().get(ids=ids, where=where, include=include)
+            # int8 快照返回还原后的向量，而不是量化码
+            embeddings = result["embeddings"]
+            if self._quantization is not None and embeddings is not None and len(embeddings):
+                result["embeddings"] = self._dequantize(embeddings)
+            return result
+
+    def count(self) -> int:
+        self._maybe_refresh()
+        return super().count()
+
+    def _column(self, key: str) -> np.ndarray:
+        column = self._columns.get(key)
+        if isinstance(column, _SnapshotColumn) and key not in self._column_arrays:
+            self._column_arrays[key] = column.to_objects()
+        return super()._column(key)
+
+    def _numeric_column(self, key: str) -> np.ndarray:
+        column = self._columns.get(key)
+        if isinstance(column, _SnapshotColumn) and (key, float) not in self._column_arrays:
+            floats = column.to_floats()
+            if floats is not None:
+                self._column_arrays[(key, float)] = floats
+        return super()._numeric_column(key)
+
+    def _similarities(self, query_vectors: np.ndarray, rows: Optional[np.ndarray]) -> np.ndarray:
+        if self._quantization is None:
+            return super()._similarities(query_vectors, rows)
+        # int8 快照分块在量化码上计算，避免整体转换为 float32
+        offset, scale = self._quantization
+        count = self._size if rows is None else len(rows)
+        similarities = np.empty((len(query_vectors), count), dtype=np.float32)
+        for start in range(0, count, SCAN_CHUNK_ROWS):
+            end = min(start + SCAN_CHUNK_ROWS, count)
+            codes = self._vectors[start:end] if rows is None else self._vectors[rows[start:end]]
+            similarities[:, start:end] = _int8_similarities(query_vectors, codes, offset, scale)
+        return similarities
@@ -0,0 +1,130 @@
+import re
+import copy
+from typing import List, Dict, Any, Optional, Tuple
+from langchain_core.documents import Document
+from langchain_text_splitters import TextSplitter
+
+# 切分点按优先级排列：段落间、句末（中英文句末标点和分号）、换行、分句标点和空格；
+# 切分点位于分隔符之后，标点留在前一个分块末尾
+_LEVELS = (
+    ("\n\n",),
+    ("。", "！", "？", "；", "…", "!", "?", ";", ". "),
+    ("\n",),
+    ("，", "、", "：", ",", ":", " "),
+)
+# 句末标点之后的右引号、右括号也留在前一个分块
+_CLOSERS = "”’」』）)\"'"
+_HEADING = re.compile(r"#{1,6}\s")
+
+class CJKTextSplitter(TextSplitter):
+    """适合中文的文本分割器
+
+    在 chunk_size 以内优先选择 Markdown 标题之前的位置切分，其次依次是段落、句末标点、换行、分句标点，
+    同一级中选最靠后的切分点，只在找不到切分点时按长度硬切；重叠部分不跨越标题。
+    查找切分点只在当前分块的窗口内用 str.rfind 反向扫描，全文处理为线性时间。
+    分块的元数据中记录在原文中的起止偏移 start_index/end_index（end_index 不含）。
+    """
+    def __init__(self, chunk_size: int = 500, chunk_overlap: int = 50, **kwargs: Any):
+        super().__init__(chunk_size=chunk_size, chunk_overlap=chunk_overlap, add_start_index=True, **kwargs)
+
+    @staticmethod
+    def _heading_boundary(text: str, low: int, high: int) -> int:
+        """[low, high] 内最靠后的 Markdown 标题开头，没有时返回 -1"""
+        position = text.rfind("\n#", low - 1, high)
+        while position != -1:
+            if _HEADING.match(text, position + 1):
+                return position + 1
+            position = text.rfind("\n#", low - 1, position)
+        return -1
+
+    @staticmethod
+    def _next_heading(text: str, low: int, high: int) -> int:
+        """[low, high) 内最靠前的 Markdown 标题开头，没有时返回 -1"""
+        position = text.find("\n#", max(low - 1, 0), high)
+        while position != -1:
+            if _HEADING.match(text, position + 1):
+                return position + 1
+            position = text.find("\n#", position + 1, high)
+        return -1
+
+    @staticmethod
+    def _last_boundary(text: str, separators: Tuple[str, ...], low: int, high: int) -> int:
+        """(low, high] 内最靠后的切分点（分隔符之后的位置），没有时返回 -1"""
+        best = -1
+        for separator in separators:
+            position = text.rfind(separator, low, high)
+            if position != -1:
+                best = max(best, position + len(separator))
+        return best
+
+    @staticmethod
+    def _first_boundary(text: str, separators: Tuple[str, ...], low: int, high: int) -> int:
+        """[low, high) 内最靠前的切分点，没有时返回 -1"""
+        best = -1
+        for separator in separators:
+            position = text.find(separator, max(low - len(separator), 0), high)
+            if position != -1 and low <= position + len(separator) < high:
+                end = position + len(separator)
+                best = end if best == -1 else min(best, end)
+        return best
+
+    def split_spans(self, text: str) -> List[Tuple[int, int]]:
+        """返回各分块在原文中的 [起, 止) 偏移，已去掉首尾空白"""
+        size, overlap = self._chunk_size, self._chunk_overlap
+        # 切分点离分块开头太近时不采用，避免产生过碎的分块
+        min_length = size // 4
+        spans = []
+        start, length = 0, len(text)
+        while start < length:
+            limit = start + size
+            end = length
+            if limit < length:
+                low = start + min_length + 1
+                end = self._heading_boundary(text, low, limit)
+                for level, separators in enumerate(_LEVELS):
+                    if end != -1:
+                        break
+                    end = self._last_boundary(text, separators, low, limit)
+                    if end != -1 and level == 1:
+                        while end < limit and text[end] in _CLOSERS:
+                            end += 1
+                if end == -1:
+                    end = limit
+            chunk_start, chunk_end = start, end
+            while chunk_start < chunk_end and text[chunk_start].isspace():
+                chunk_start += 1
+            while chunk_end > chunk_start and text[chunk_end - 1].isspace():
+                chunk_end -= 1
+            if chunk_start < chunk_end:
+                spans.append((chunk_start, chunk_end))
+            if end >= length:
+                break
+            next_start = end
+            if overlap:
+                # 重叠部分尽量从句子、行或分句的开头开始
+                next_start = end - overlap
+                for separators in _LEVELS[1:]:
+                    boundary = self._first_boundary(text, separators, end - overlap, end)
+                    if boundary != -1:
+                        next_start = boundary
+                        break
+            # 重叠部分不跨越章节：重叠部分中有标题时，下一个分块从标题开始
+            heading = self._next_heading(text, next_start, end + 1)
+            if heading != -1:
+                next_start = heading
+            start = max(next_start, start + 1)
+        return spans
+
+    def split_text(self, text: str) -> List[str]:
+        return [text[start:end] for start, end in self.split_spans(text)]
+
+    def create_documents(self, texts: List[str], metadatas: Optional[List[Dict[str, Any]]] = None) -> List[Document]:
+        metadatas = metadatas or [{}] * len(texts)
+        documents = []
+        for text, metadata in zip(texts, metadatas):
+            for start, end in self.split_spans(text):
+                chunk_metadata = copy.deepcopy(metadata)
+                chunk_metadata["start_index"] = start
+                chunk_metadata["end_index"] = end
+                documents.append(Document(page_content=text[start:end], metadata=chunk_metadata))
+        return documents
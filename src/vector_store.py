@@ -6,87 +6,675 @@ try:
 except ImportError:
     pass  # 如果没有安装 pysqlite3-binary，则正常回退
 
-from typing import List, Dict, Any, Optional, Tuple
+from typing import List, Dict, Any, Callable, Iterable, Optional, Set, Tuple, Union
 from langchain_core.documents import Document
 from langchain_community.vectorstores import Chroma
 from langchain.embeddings.base import Embeddings
+import numpy as np
+from datetime import datetime
+import hashlib
+import threading
+import weakref
+import atexit
+import functools
+import uuid
 import os
 
+try:
+    from .flat_index import FlatIndex
+    from .ann_index import HnswIndex, FaissIndex
+    from .quantized_index import Int8Index, PQIndex
+    from .snapshot import SnapshotIndex, write_snapshot, publish_snapshot, describe_embedding
+    from .near_duplicates import with_sources
+except ImportError:
+    from flat_index import FlatIndex
+    from ann_index import HnswIndex, FaissIndex
+    from quantized_index import Int8Index, PQIndex
+    from snapshot import SnapshotIndex, write_snapshot, publish_snapshot, describe_embedding
+    from near_duplicates import with_sources
+
+# 可选的向量检索后端
+BACKENDS = ("chroma", "flat", "hnsw", "faiss", "int8", "pq", "snapshot")
+
+# 参与生成分块ID的位置类元数据（PDF页码、CSV行号、JSON序号、分块起始偏移）
+CHUNK_POSITION_FIELDS = ("source", "page", "row", "seq_num", "start_index")
+
+def make_chunk_id(document: Document) -> str:
+    """根据来源、位置和内容哈希生成稳定的分块ID"""
+    metadata = document.metadata or {}
+    position = "\0".join(str(metadata.get(field, "")) for field in CHUNK_POSITION_FIELDS)
+    content_hash = hashlib.sha256(document.page_content.encode("utf-8")).hexdigest()
+    return hashlib.sha256(f"{position}\0{content_hash}".encode("utf-8")).hexdigest()[:32]
+
+# 日期元数据另存一份数值时间戳，日期范围过滤可以直接在索引内求值
+DATE_FIELD = "date"
+DATE_EPOCH_FIELD = "date_epoch"
+
+def to_epoch(value: Any) -> Optional[float]:
+    """将 ISO 格式的日期转换为时间戳，无法解析时返回 None"""
+    if isinstance(value, datetime):
+        return value.timestamp()
+    try:
+        return datetime.fromisoformat(str(value)).timestamp()
+    except ValueError:
+        return None
+
+def _with_date_epoch(metadata: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """为带日期的元数据补充数值时间戳字段"""
+    if not metadata or DATE_FIELD not in metadata or DATE_EPOCH_FIELD in metadata:
+        return metadata
+    epoch = to_epoch(metadata[DATE_FIELD])
+    if epoch is None:
+        return metadata
+    return {**metadata, DATE_EPOCH_FIELD: epoch}
+
+def _with_date_epochs(documents: List[Document]) -> List[Document]:
+    """返回补充了时间戳元数据的文档副本"""
+    return [
+        Document(page_content=doc.page_content, metadata=_with_date_epoch(doc.metadata) or {})
+        for doc in documents
+    ]
+
+def _to_list(embeddings: Union[np.ndarray, List]) -> List:
+    """将 ndarray 向量转换为 list（Chroma 只接受 list 形式的向量）"""
+    if isinstance(embeddings, np.ndarray):
+        return embeddings.tolist()
+    return embeddings
+
+class _ListEmbeddings(Embeddings):
+    """包装返回 ndarray 的嵌入模型，只在写入 Chroma 的边界处转换一次"""
+    def __init__(self, embedding: Embeddings):
+        self.embedding = embedding
+    
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return _to_list(self.embedding.embed_documents(texts))
+    
+    def embed_query(self, text: str) -> List[float]:
+        return _to_list(self.embedding.embed_query(text))
+
+def _flush_at_exit(store_ref: "weakref.ref[VectorStore]"):
+    """进程退出时提交仍在缓冲中的写入"""
+    store = store_ref()
+    if store is not None:
+        try:
+            store.close()
+        except Exception as e:
+            print(f"退出时提交写入缓冲出错: {str(e)}")
+
 class VectorStore:
-    def __init__(self, persist_directory: Optional[str], embedding: Embeddings):
+    def __init__(
+        self,
+        persist_directory: Optional[str],
+        embedding: Embeddings,
+        backend: str = "chroma",
+        index_params: Optional[Dict[str, Any]] = None,
+        collection_name: Optional[str] = None,
+        commit_size: int = 0,
+        commit_interval: Optional[float] = None,
+        read_only: bool = False
+    ):
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown vector store backend: {backend}")
+        if read_only and backend != "snapshot":
+            raise ValueError("Read-only mode requires the snapshot backend")
         self.embedding = embedding
         self.persist_directory = persist_directory
+        self.backend = backend
+        # 只读打开快照，多个进程共享同一份内存映射，由单独的写入进程发布新版本
+        self.read_only = read_only
+        # 多个会话共享同一个向量库时串行化写入
+        self._write_lock = threading.RLock()
+        # 后台压缩任务
+        self._compaction_thread: Optional[threading.Thread] = None
+        self._compaction_stop: Optional[threading.Event] = None
+        # 写入缓冲（组提交）：新增文档先缓存在内存中，累计 commit_size 个
+        # 或每隔 commit_interval 秒统一嵌入、写入并持久化一次，两者都未设置时每次写入立即持久化；
+        # chromadb 0.4 起每次写入自动落盘、persist() 不做任何事，Chroma 后端只能省去逐批嵌入和写入的开销
+        self.commit_size = commit_size
+        self.commit_interval = commit_interval
+        self._pending: List[Document] = []
+        self._dirty = False
+        self._flush_thread: Optional[threading.Thread] = None
+        self._flush_stop: Optional[threading.Event] = None
+        # 进程退出时提交写入缓冲的钩子，close 时注销
+        self._exit_hook: Optional[Callable[[], None]] = None
+        # ANN 或量化后端的索引参数，如 {"M": 32, "ef_construction": 200, "ef_search": 64} 或 {"pq_m": 128}
+        self.index_params = index_params
+        # Chroma 集合名，同一进程或同一目录中的多个向量库用不同的集合区分
+        self.collection_name = collection_name or Chroma._LANGCHAIN_DEFAULT_COLLECTION_NAME
+        # 嵌入模型可能返回 float32 ndarray，Chroma 使用转换后的接口
+        self._chroma_embedding = _ListEmbeddings(embedding)
         
-        if persist_directory:
+        if persist_directory and not read_only:
             # 确保目录存在并设置权限
             os.makedirs(self.persist_directory, exist_ok=True)
             os.chmod(self.persist_directory, 0o777)
-            
-            # 初始化向量数据库
-            self.vectordb = Chroma(
+        
+        # 初始化向量数据库
+        self.vectordb = self._open_backend()
+        
+        if self.buffered:
+            self._start_flush_thread()
+            # 进程退出前写入缓冲中剩余的文档
+            # 每个实例注册各自的钩子对象，注销时不影响其他实例
+            self._exit_hook = functools.partial(_flush_at_exit, weakref.ref(self))
+            atexit.register(self._exit_hook)
+    
+    @property
+    def buffered(self) -> bool:
+        """是否启用了写入缓冲"""
+        return self.commit_size > 0 or self.commit_interval is not None
+    
+    def _open_backend(self):
+        """按配置打开向量检索后端"""
+        if self.backend == "flat":
+            # 进程内的 NumPy 精确检索，直接使用 float32 向量
+            return FlatIndex(self.embedding, self.persist_directory)
+        if self.backend == "hnsw":
+            return HnswIndex(self.embedding, self.persist_directory, self.index_params)
+        if self.backend == "faiss":
+            return FaissIndex(self.embedding, self.persist_directory, self.index_params)
+        if self.backend == "int8":
+            # 量化存储，全精度向量只用于对候选重新打分
+            return Int8Index(self.embedding, self.persist_directory, self.index_params)
+        if self.backend == "pq":
+            return PQIndex(self.embedding, self.persist_directory, self.index_params)
+        if self.backend == "snapshot":
+            # 直接映射 export_snapshot 导出的快照，无需重新嵌入
+            if not self.persist_directory:
+                raise ValueError("Snapshot backend requires a snapshot directory")
+            return SnapshotIndex(self.embedding, self.persist_directory, read_only=self.read_only)
+        if self.persist_directory:
+            return Chroma(
+                collection_name=self.collection_name,
                 persist_directory=self.persist_directory,
-                embedding_function=self.embedding
-            )
-        else:
-            # 使用内存模式
-            self.vectordb = Chroma(
-                embedding_function=self.embedding
+                embedding_function=self._chroma_embedding
             )
+        # 使用内存模式
+        return Chroma(
+            collection_name=self.collection_name,
+            embedding_function=self._chroma_embedding
+        )
     
     def create_from_documents(self, documents: List[Document]):
         """从文档创建向量数据库"""
-        if self.persist_directory:
+        documents = _with_date_epochs(documents)
+        if self.backend != "chroma" or self.buffered:
+            self.add_documents(documents)
+        elif self.persist_directory:
             self.vectordb = Chroma.from_documents(
                 documents=documents,
-                embedding=self.embedding,
+                embedding=self._chroma_embedding,
+                collection_name=self.collection_name,
                 persist_directory=self.persist_directory
             )
             self.vectordb.persist()
         else:
             self.vectordb = Chroma.from_documents(
                 documents=documents,
-                embedding=self.embedding
+                embedding=self._chroma_embedding,
+                collection_name=self.collection_name
             )
     
     def add_documents(self, documents: List[Document]):
-        """添加文档到向量数据库"""
-        if not self.vectordb:
-            self.create_from_documents(documents)
+        """添加文档到向量数据库，启用写入缓冲时先缓存，达到阈值后统一提交"""
+        with self._write_lock:
+            if not self.vectordb:
+                self.create_from_documents(documents)
+            elif self.buffered:
+                self._pending.extend(documents)
+                if self.commit_size and len(self._pending) >= self.commit_size:
+                    self.flush()
+            else:
+                self.vectordb.add_documents(_with_date_epochs(documents))
+                self._commit()
+    
+    def _commit(self):
+        """一次写入完成后持久化；启用写入缓冲时推迟到 flush 统一持久化"""
+        if not self.persist_directory:
+            return
+        if self.buffered:
+            self._dirty = True
         else:
-            self.vectordb.add_documents(documents)
-            if self.persist_directory:
+            self.vectordb.persist()
+    
+    def _drain(self):
+        """把缓冲中的文档写入索引（不持久化），使后续的读写能看到这些文档"""
+        if not self._pending:
+            return
+        with self._write_lock:
+            if not self._pending:
+                return
+            documents, self._pending = self._pending, []
+            # 所有缓冲的文档合并为一次嵌入和一次写入
+            self.vectordb.add_documents(_with_date_epochs(documents))
+            self._commit()
+    
+    def flush(self) -> int:
+        """
+        提交写入缓冲：写入缓存的文档并持久化
+        
+        Returns:
+            int: 本次写入的文档数量
+        """
+        with self._write_lock:
+            count = len(self._pending)
+            self._drain()
+            if self._dirty:
                 self.vectordb.persist()
+                self._dirty = False
+        return count
+    
+    def _start_flush_thread(self):
+        """按 commit_interval 定时提交写入缓冲"""
+        if self.commit_interval is None:
+            return
+        stop_event = threading.Event()
+        store_ref = weakref.ref(self)
+        interval = self.commit_interval
+        
+        def run():
+            while not stop_event.wait(interval):
+                store = store_ref()
+                if store is None:
+                    return
+                try:
+                    store.flush()
+                except Exception as e:
+                    print(f"提交写入缓冲出错: {str(e)}")
+                del store
+        
+        self._flush_stop = stop_event
+        self._flush_thread = threading.Thread(target=run, name="vector-store-flush", daemon=True)
+        self._flush_thread.start()
+    
+    def add_embeddings(
+        self,
+        texts: List[str],
+        embeddings: Union[np.ndarray, List[List[float]]],
+        metadatas: Optional[List[Dict[str, Any]]] = None,
+        ids: Optional[List[str]] = None
+    ) -> List[str]:
+        """添加已经计算好的向量，接受 float32 ndarray 或 list"""
+        if len(texts) != len(embeddings):
+            raise ValueError("texts and embeddings must have the same length")
+        if ids is None:
+            ids = [str(uuid.uuid4()) for _ in texts]
+        with self._write_lock:
+            # 保持写入顺序，先写入缓冲中的文档
+            self._drain()
+            metadatas = [_with_date_epoch(metadata) for metadata in metadatas or [None] * len(texts)]
+            if self.backend != "chroma":
+                # 非 Chroma 后端直接保存 float32 向量，无需转换为 list
+                self.vectordb.add_embeddings(texts, embeddings, metadatas, ids)
+            else:
+                self.vectordb._collection.upsert(
+                    ids=ids,
+                    embeddings=_to_list(embeddings),
+                    # Chroma 不接受空字典形式的元数据
+                    metadatas=[metadata or None for metadata in metadatas],
+                    documents=texts
+                )
+            self._commit()
+        return ids
+    
+    def upsert_documents(self, documents: List[Document]) -> Dict[str, int]:
+        """增量写入文档
+
+        每个分块使用稳定ID：已存在且未变化的分块直接跳过，
+        同一来源中不再出现的旧分块（内容已变化或被删除）会被移除，
+        只有新的文本才会调用嵌入模型。因此每次调用应包含一个来源的全部分块。
+        """
+        # 输入内重复的分块只保留一份
+        chunks: Dict[str, Document] = {}
+        for doc in documents:
+            chunks.setdefault(make_chunk_id(doc), doc)
+        ids = list(chunks)
+        
+        # 查询已有分块到写入完成需要原子执行，避免多个会话同时写入时互相覆盖
+        with self._write_lock:
+            self._drain()
+            existing_ids = set(self.vectordb.get(ids=ids, include=[])["ids"]) if ids else set()
+        
+            # 找出本次涉及的来源下已不存在的旧分块
+            sources = list({doc.metadata.get("source") for doc in chunks.values()} - {None})
+            stale_ids = self._stale_ids(sources, chunks)
+            if stale_ids:
+                self.vectordb.delete(ids=stale_ids)
+        
+            new_ids = [chunk_id for chunk_id in ids if chunk_id not in existing_ids]
+            if new_ids:
+                self.vectordb.add_texts(
+                    texts=[chunks[chunk_id].page_content for chunk_id in new_ids],
+                    metadatas=[_with_date_epoch(chunks[chunk_id].metadata) for chunk_id in new_ids],
+                    ids=new_ids
+                )
+            if new_ids or stale_ids:
+                self._commit()
+        
+        return {
+            "added": len(new_ids),
+            "unchanged": len(ids) - len(new_ids),
+            "removed": len(stale_ids)
+        }
+    
+    def _stale_ids(self, sources: List[str], keep_ids) -> List[str]:
+        """来源下不在 keep_ids 中的旧分块"""
+        if not sources:
+            return []
+        source_ids = self.vectordb.get(where={"source": {"$in": sources}}, include=[])["ids"]
+        return [chunk_id for chunk_id in source_ids if chunk_id not in keep_ids]
+    
+    def existing_ids(self, ids: List[str]) -> Set[str]:
+        """已写入的分块ID"""
+        if not ids:
+            return set()
+        self._drain()
+        return set(self.vectordb.get(ids=list(ids), include=[])["ids"])
+    
+    def prune_source(self, source: str, keep_ids: Iterable[str]) -> int:
+        """
+        删除来源下不在 keep_ids 中的旧分块，用于分批写入一个来源之后清理旧版本
+        
+        Returns:
+            int: 删除的分块数量
+        """
+        keep_ids = set(keep_ids)
+        with self._write_lock:
+            self._drain()
+            return self.delete(self._stale_ids([source], keep_ids))
+    
+    def update_sources(self, sources: Dict[str, List[str]]) -> int:
+        """
+        写回近似重复合并后分块的来源列表（见 DuplicateRegistry）
+        
+        来源列表为空的分块被删除，其余分块的 source 字段改为第一个来源，sources 字段记录全部来源；
+        不在本库中的分块ID被忽略
+        
+        Returns:
+            int: 删除的分块数量
+        """
+        if not sources:
+            return 0
+        with self._write_lock:
+            self._drain()
+            removed = self.delete([chunk_id for chunk_id, chunk_sources in sources.items() if not chunk_sources])
+            ids = [chunk_id for chunk_id, chunk_sources in sources.items() if chunk_sources]
+            records = self.vectordb.get(ids=ids, include=["metadatas"]) if ids else {"ids": []}
+            if records["ids"]:
+                metadatas = [
+                    with_sources(metadata, sources[chunk_id])
+                    for chunk_id, metadata in zip(records["ids"], records["metadatas"])
+                ]
+                if self.backend == "chroma":
+                    # Chroma 的 update 只合并给出的字段，sources 字段因此总是完整写入
+                    self.vectordb._collection.update(ids=records["ids"], metadatas=metadatas)
+                else:
+                    self.vectordb.update_metadata(records["ids"], metadatas)
+                self._commit()
+        return removed
+    
+    def delete(self, ids: List[str]) -> int:
+        """
+        按ID删除分块，删除后立即从检索结果中排除
+        
+        非 Chroma 后端只记录墓碑，空间由 compact 回收
+        
+        Returns:
+            int: 实际删除的分块数量
+        """
+        if not self.vectordb:
+            raise ValueError("Vector database not initialized")
+        if not ids:
+            return 0
+        with self._write_lock:
+            self._drain()
+            if self.backend == "chroma":
+                ids = self.vectordb.get(ids=list(ids), include=[])["ids"]
+                if ids:
+                    self.vectordb.delete(ids=ids)
+                removed = len(ids)
+            else:
+                removed = self.vectordb.delete(ids=list(ids))
+            if removed:
+                self._commit()
+        return removed
+    
+    def delete_by_source(self, sources: Union[str, List[str]]) -> int:
+        """删除一个或多个来源文件的全部分块，返回删除的分块数量"""
+        if not self.vectordb:
+            raise ValueError("Vector database not initialized")
+        if isinstance(sources, str):
+            sources = [sources]
+        if not sources:
+            return 0
+        with self._write_lock:
+            self._drain()
+            ids = self.vectordb.get(where={"source": {"$in": list(sources)}}, include=[])["ids"]
+            return self.delete(ids)
+    
+    def clear(self) -> int:
+        """删除全部分块，返回删除的分块数量"""
+        if not self.vectordb:
+            raise ValueError("Vector database not initialized")
+        with self._write_lock:
+            # 缓冲中尚未写入的文档直接丢弃
+            removed = len(self._pending)
+            self._pending = []
+            if self.backend == "chroma":
+                return removed + self.delete(self.vectordb.get(include=[])["ids"])
+            removed += self.vectordb.clear()
+            self._commit()
+        return removed
+    
+    def compact(self) -> int:
+        """
+        回收已删除分块占用的空间，ANN 与量化后端同时重建索引
+        
+        Chroma 自行管理删除后的空间，直接返回 0
+        
+        Returns:
+            int: 回收的分块数量
+        """
+        if not self.vectordb:
+            raise ValueError("Vector database not initialized")
+        if self.backend == "chroma":
+            return 0
+        # 索引在锁外重建，压缩期间查询和写入不受阻塞
+        removed = self.vectordb.compact()
+        if removed:
+            with self._write_lock:
+                self._commit()
+        if removed:
+            print(f"已回收 {removed} 个已删除分块")
+        return removed
+    
+    def start_compaction(self, interval: float = 60.0, min_tombstone_ratio: float = 0.1):
+        """
+        启动后台压缩任务
+        
+        Args:
+            interval: 检查间隔（秒）
+            min_tombstone_ratio: 墓碑占全部行的比例达到该值时才压缩，避免频繁重建索引
+        """
+        if self.backend == "chroma" or self._compaction_thread is not None:
+            return
+        stop_event = threading.Event()
+        
+        def run():
+            while not stop_event.wait(interval):
+                try:
+                    tombstones = self.vectordb.tombstone_count()
+                    total = self.vectordb.count() + tombstones
+                    if tombstones and tombstones >= min_tombstone_ratio * total:
+                        self.compact()
+                except Exception as e:
+                    print(f"后台压缩出错: {str(e)}")
+        
+        self._compaction_stop = stop_event
+        self._compaction_thread = threading.Thread(target=run, name="vector-store-compaction", daemon=True)
+        self._compaction_thread.start()
+    
+    def stop_compaction(self):
+        """停止后台压缩任务"""
+        thread = self._compaction_thread
+        if thread is None:
+            return
+        self._compaction_stop.set()
+        thread.join()
+        self._compaction_thread = None
+        self._compaction_stop = None
+    
+    def close(self):
+        """提交写入缓冲并释放后台任务（共享资源注册表在最后一个引用归还时调用）"""
+        self.stop_compaction()
+        if self._flush_thread is not None:
+            self._flush_stop.set()
+            self._flush_thread.join()
+            self._flush_thread = None
+        self.flush()
+        if self._exit_hook is not None:
+            atexit.unregister(self._exit_hook)
+            self._exit_hook = None
+    
+    def get_records(self, include: Iterable[str] = ("documents", "metadatas", "embeddings")) -> Dict[str, Any]:
+        """先写入缓冲中的文档，再在写锁内读取全部分块（格式同 Chroma 的 get）"""
+        if not self.vectordb:
+            raise ValueError("Vector database not initialized")
+        with self._write_lock:
+            self._drain()
+            return self.vectordb.get(include=list(include))
+    
+    def replace_documents(self, documents: List[Document]) -> Dict[str, int]:
+        """清空后以稳定ID写入新文档，整个过程持有写锁，返回新增和删除的分块数量"""
+        with self._write_lock:
+            removed = self.clear()
+            self.compact()
+            stats = self.upsert_documents(documents)
+        return {"added": stats["added"], "removed": removed}
+    
+    def export_snapshot(
+        self,
+        directory: str,
+        chunking: Optional[Dict[str, Any]] = None,
+        dtype: str = "float32",
+        publish: bool = False
+    ) -> Dict[str, Any]:
+        """
+        导出紧凑的二进制快照，可用 VectorStore(directory, embedding, backend="snapshot") 直接打开
+        
+        Args:
+            directory: 快照目录
+            chunking: 分块参数，如 {"chunk_size": 500, "chunk_overlap": 50}，记录在清单中
+            dtype: 向量存储类型，float32 或 int8
+            publish: 以新版本发布并原子切换，已只读打开该目录的进程会刷新到新版本
+            
+        Returns:
+            Dict: 快照清单
+        """
+        if not self.vectordb:
+            raise ValueError("Vector database not initialized")
+        records = self.get_records()
+        vectors = np.asarray(records["embeddings"], dtype=np.float32)
+        write = publish_snapshot if publish else write_snapshot
+        manifest = write(
+            directory,
+            records["ids"],
+            records["documents"],
+            records["metadatas"],
+            vectors,
+            dtype=dtype,
+            embedding=describe_embedding(self.embedding, vectors.shape[1] if len(vectors) else 0),
+            chunking=chunking
+        )
+        print(f"已导出 {manifest['count']} 个分块到快照 {directory}")
+        return manifest
     
     def load_existing(self):
         """加载已存在的向量数据库"""
         if not self.persist_directory:
             raise ValueError("Cannot load database in memory mode")
-        self.vectordb = Chroma(
-            persist_directory=self.persist_directory,
-            embedding_function=self.embedding
-        )
+        self.vectordb = self._open_backend()
     
     def similarity_search(self, query: str, k: int = 4, filter: Optional[Dict[str, Any]] = None) -> List[Document]:
         """相似度搜索"""
         if not self.vectordb:
             raise ValueError("Vector database not initialized")
+        self._drain()
         if filter:
             return self.vectordb.similarity_search(query, k=k, filter=filter)
         return self.vectordb.similarity_search(query, k=k)
     
-    def similarity_search_with_score(self, query: str, k: int = 4) -> List[Tuple[Document, float]]:
-        """带分数的相似度搜索"""
+    def similarity_search_with_score(
+        self,
+        query: str,
+        k: int = 4,
+        filter: Optional[Dict[str, Any]] = None
+    ) -> List[Tuple[Document, float]]:
+        """带分数的相似度搜索，filter 为 Chroma 风格的 where 条件，在索引内求值"""
         if not self.vectordb:
             raise ValueError("Vector database not initialized")
+        self._drain()
+        if filter:
+            return self.vectordb.similarity_search_with_score(query, k=k, filter=filter)
         return self.vectordb.similarity_search_with_score(query, k=k)
-    
+
+    def similarity_search_batch(
+        self,
+        queries: List[str],
+        k: int = 4,
+        filter: Optional[Dict[str, Any]] = None
+    ) -> List[List[Tuple[Document, float]]]:
+        """批量相似度搜索：一次嵌入所有查询、一次批量检索，按查询顺序返回带分数的结果"""
+        if not self.vectordb:
+            raise ValueError("Vector database not initialized")
+        if not queries:
+            return []
+        # 所有查询合并为一次嵌入请求
+        embeddings = self.embedding.embed_documents(list(queries))
+        return self.similarity_search_by_vectors_with_score(embeddings, k=k, filter=filter)
+
+    def similarity_search_by_vectors_with_score(
+        self,
+        embeddings: Union[np.ndarray, List[List[float]]],
+        k: int = 4,
+        filter: Optional[Dict[str, Any]] = None
+    ) -> List[List[Tuple[Document, float]]]:
+        """用已嵌入的查询向量批量检索，按查询顺序返回带分数的结果"""
+        if not self.vectordb:
+            raise ValueError("Vector database not initialized")
+        if len(embeddings) == 0:
+            return []
+        self._drain()
+        if self.backend != "chroma":
+            return self.vectordb.similarity_search_by_vectors_with_score(embeddings, k=k, filter=filter)
+        results = self.vectordb._collection.query(
+            query_embeddings=_to_list(embeddings),
+            n_results=k,
+            where=filter or None,
+            include=["documents", "metadatas", "distances"]
+        )
+        return [
+            [
+                (Document(page_content=text, metadata=metadata or {}), distance)
+                for text, metadata, distance in zip(texts, metadatas, distances)
+            ]
+            for texts, metadatas, distances in zip(
+                results["documents"], results["metadatas"], results["distances"]
+            )
+        ]
+
     def get_document_count(self) -> int:
         """获取文档数量"""
         if not self.vectordb:
             raise ValueError("Vector database not initialized")
+        self._drain()
+        if self.backend != "chroma":
+            return self.vectordb.count()
         return self.vectordb._collection.count()
         
     def persist(self):
-        """持久化向量数据库"""
+        """持久化向量数据库（包括写入缓冲中的文档）"""
         if self.vectordb and self.persist_directory:
+            self.flush()
             self.vectordb.persist() 
\ No newline at end of file
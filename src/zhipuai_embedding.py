@@ -1,23 +1,149 @@
 import os
-from typing import List
+import time
+import random
+import asyncio
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import List, Iterator, Optional, Tuple, Union
+import httpx
 import zhipuai
 from langchain.embeddings.base import Embeddings
 import numpy as np
 import hashlib
 
+# embedding-2 的向量维度，演示模式生成相同维度的模拟向量
+EMBEDDING_DIM = 1024
+
+# 智谱AI接口的默认地址，可通过环境变量 ZHIPUAI_BASE_URL 覆盖（与 SDK 一致）
+DEFAULT_BASE_URL = "https://open.bigmodel.cn/api/paas/v4"
+
+class RateLimiter:
+    """线程安全的令牌桶限流器，可在多个嵌入实例之间共享"""
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+    
+    def reserve(self, tokens: float = 1.0) -> float:
+        """预占令牌，返回需要等待的秒数（允许令牌数暂时为负）"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            self._tokens -= tokens
+            return max(0.0, -self._tokens / self.rate)
+    
+    def acquire(self, tokens: float = 1.0):
+        """获取令牌，不足时阻塞等待"""
+        wait = self.reserve(tokens)
+        if wait > 0:
+            time.sleep(wait)
+    
+    async def aacquire(self, tokens: float = 1.0):
+        """异步获取令牌，等待期间不占用线程"""
+        wait = self.reserve(tokens)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+# 与批内某条输入有关的错误状态码（如输入过长、内容审核不通过），拆分批次后可以定位到出错的文本
+ITEM_ERROR_STATUS_CODES = (400, 413, 422)
+
+def _status_code(error: Exception) -> Optional[int]:
+    """接口错误的 HTTP 状态码，非接口错误返回 None"""
+    status_code = getattr(error, "status_code", None)
+    if status_code is None:
+        status_code = getattr(getattr(error, "response", None), "status_code", None)
+    return status_code
+
+def _is_retryable_error(error: Exception) -> bool:
+    """判断是否为可重试的错误（限流、服务端错误或网络错误）"""
+    if isinstance(error, (zhipuai.APIConnectionError, httpx.TransportError)):
+        return True
+    status_code = _status_code(error)
+    return status_code is not None and (status_code == 429 or status_code >= 500)
+
+async def _close_on_shutdown(client: httpx.AsyncClient):
+    """事件循环关闭前 shutdown_asyncgens 会结束该生成器，从而在创建连接池的循环上将其关闭"""
+    try:
+        yield
+    finally:
+        await client.aclose()
+
+def _is_item_error(error: Exception) -> bool:
+    """判断是否为与批内某条输入有关的错误；认证失败、限流重试用尽等错误与输入无关，拆分只会放大请求数"""
+    # 响应中的向量条数与输入不符
+    if isinstance(error, ValueError):
+        return True
+    return _status_code(error) in ITEM_ERROR_STATUS_CODES
+
 class ZhipuAIEmbeddings(Embeddings):
-    def __init__(self, api_key=None):
+    def __init__(
+        self,
+        api_key=None,
+        model: str = "embedding-2",
+        batch_size: int = 64,
+        max_batch_chars: int = 32000,
+        cache=None,
+        max_workers: int = 1,
+        requests_per_second: Optional[float] = None,
+        rate_limiter: Optional[RateLimiter] = None,
+        max_retries: int = 5,
+        backoff_base: float = 0.5,
+        backoff_max: float = 30.0,
+        max_concurrency: int = 8,
+        async_client: Optional[httpx.AsyncClient] = None,
+        return_numpy: bool = False
+    ):
         # 优先使用传入的API密钥，其次从环境变量获取
         self.api_key = api_key or os.getenv("ZHIPUAI_API_KEY")
         if not self.api_key:
             raise ValueError("ZHIPUAI_API_KEY not found in environment variables or parameters")
         
+        self.model = model
+        # 每个请求最多包含的文本条数和总字符数
+        self.batch_size = max(1, batch_size)
+        self.max_batch_chars = max(1, max_batch_chars)
+        # 可选的嵌入缓存（如 EmbeddingCache），命中时不再调用接口
+        self.cache = cache
+        # 为 True 时以连续的 float32 ndarray 返回向量，避免构造 Python 浮点列表
+        self.return_numpy = return_numpy
+        # 并发请求数、限流与重试配置
+        self.max_workers = max(1, max_workers)
+        if rate_limiter is None and requests_per_second:
+            rate_limiter = RateLimiter(requests_per_second)
+        self.rate_limiter = rate_limiter
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        # 异步接口的连接池与并发上限，连接池在首次使用时按事件循环创建
+        self.max_concurrency = max(1, max_concurrency)
+        self._async_client = async_client
+        self._owns_async_client = async_client is None
+        # 每个事件循环各自的连接池、信号量和进行中的请求，事件循环被回收时随之释放
+        self._loop_states = weakref.WeakKeyDictionary()
+        # 正在进行中的嵌入请求，相同文本的并发请求共享同一次调用
+        self._inflight = {}
+        self._inflight_lock = threading.Lock()
+        # 因批内重复或并发合并而省去的嵌入次数
+        self.coalesced_count = 0
+        
         # 检查是否为测试模式
         self.demo_mode = self.api_key.startswith("test_key_")
+        # 异步接口直接请求的地址和认证头，与同步客户端保持一致
+        self.base_url = (os.getenv("ZHIPUAI_BASE_URL") or DEFAULT_BASE_URL).rstrip("/")
+        self._auth_headers = {}
         if not self.demo_mode:
             # 适配新版本 API (zhipuai 2.1.5)
             try:
-                self.client = zhipuai.ZhipuAI(api_key=self.api_key)
+                # 重试由本类统一处理（带退避和限流），关闭SDK自带的重试
+                self.client = zhipuai.ZhipuAI(api_key=self.api_key, base_url=self.base_url, max_retries=0)
+                # SDK 默认关闭令牌缓存，认证头即固定的 Bearer API 密钥，只需计算一次
+                self._auth_headers = dict(self.client.auth_headers)
                 print(f"ZhipuAI初始化成功，API密钥长度: {len(self.api_key)}")
             except Exception as e:
                 print(f"ZhipuAI初始化错误: {str(e)}")
@@ -25,67 +151,385 @@ class ZhipuAIEmbeddings(Embeddings):
         else:
             print("使用演示模式，将返回模拟的嵌入向量")
     
-    def _get_demo_embedding(self, text: str) -> List[float]:
-        """为演示模式生成确定性的模拟嵌入向量"""
-        # 使用文本的哈希值生成伪随机但确定性的向量
-        hash_object = hashlib.md5(text.encode())
-        seed = int(hash_object.hexdigest(), 16) % (2**32)
-        np.random.seed(seed)
-        # 生成1024维的随机单位向量
-        vector = np.random.randn(1024)
+    @staticmethod
+    def _get_demo_embeddings(texts: List[str]) -> np.ndarray:
+        """为演示模式批量生成确定性的模拟嵌入向量
+
+        每条文本使用由其哈希派生的独立随机数生成器，不修改全局随机状态，
+        结果直接写入预先分配的 float32 矩阵。
+        """
+        matrix = np.empty((len(texts), EMBEDDING_DIM), dtype=np.float32)
+        for i, text in enumerate(texts):
+            # 使用文本的哈希值生成伪随机但确定性的向量
+            seed = int.from_bytes(hashlib.md5(text.encode()).digest()[:8], "little")
+            np.random.default_rng(seed).standard_normal(dtype=np.float32, out=matrix[i])
         # 归一化为单位向量
-        vector = vector / np.linalg.norm(vector)
-        return vector.tolist()
+        matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+        return matrix
     
-    def embed_documents(self, texts: List[str]) -> List[List[float]]:
-        """将文档转换为向量"""
-        # 演示模式
-        if self.demo_mode:
-            return [self._get_demo_embedding(text) for text in texts]
-            
-        # 正常API模式
-        embeddings = []
+    def _iter_batches(self, texts: List[str]) -> Iterator[List[str]]:
+        """按条数和总字符数自适应地划分批次"""
+        batch = []
+        batch_chars = 0
         for text in texts:
+            if batch and (
+                len(batch) >= self.batch_size
+                or batch_chars + len(text) > self.max_batch_chars
+            ):
+                yield batch
+                batch = []
+                batch_chars = 0
+            batch.append(text)
+            batch_chars += len(text)
+        if batch:
+            yield batch
+    
+    def _backoff_delay(self, attempt: int, error: Exception) -> float:
+        """指数退避加随机抖动，优先遵循服务端的 Retry-After"""
+        response = getattr(error, "response", None)
+        retry_after = response.headers.get("retry-after") if response is not None else None
+        if retry_after:
+            try:
+                return min(self.backoff_max, float(retry_after))
+            except ValueError:
+                pass
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+    
+    def _create_embeddings(self, batch: List[str]):
+        """调用嵌入接口，对限流和服务端错误进行退避重试"""
+        attempt = 0
+        while True:
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire()
             try:
                 # 适配新版本 API
-                response = self.client.embeddings.create(
-                    model="embedding-2",
-                    input=text
+                return self.client.embeddings.create(
+                    model=self.model,
+                    input=batch
                 )
-                
-                # 检查响应格式并处理
-                if hasattr(response, 'data') and len(response.data) > 0:
-                    embeddings.append(response.data[0].embedding)
-                else:
-                    raise ValueError(f"Error from ZhipuAI API: {response}")
             except Exception as e:
+                if attempt >= self.max_retries or not _is_retryable_error(e):
+                    raise
+                delay = self._backoff_delay(attempt, e)
+                print(f"嵌入请求暂时失败，{delay:.2f}秒后第{attempt + 1}次重试: {str(e)}")
+                time.sleep(delay)
+                attempt += 1
+    
+    def _request_embeddings(self, batch: List[str]) -> List[List[float]]:
+        """发送一次嵌入请求，按输入顺序返回向量"""
+        response = self._create_embeddings(batch)
+        
+        # 检查响应格式并处理
+        data = getattr(response, 'data', None)
+        if not data or len(data) != len(batch):
+            raise ValueError(f"Error from ZhipuAI API: {response}")
+        return self._ordered_embeddings([(item.index, item.embedding) for item in data])
+    
+    @staticmethod
+    def _ordered_embeddings(items: List[Tuple[Optional[int], List[float]]]) -> List[List[float]]:
+        """接口返回的顺序不一定与输入一致，按 index 还原"""
+        ordered = sorted(
+            enumerate(items),
+            key=lambda item: item[1][0] if item[1][0] is not None else item[0]
+        )
+        return [embedding for _, (_, embedding) in ordered]
+    
+    def _embed_batch(self, batch: List[str]) -> List[List[float]]:
+        """嵌入一个批次，因某条输入出错时二分拆分，只重试出错的子批次；其他错误直接抛出"""
+        try:
+            return self._request_embeddings(batch)
+        except Exception as e:
+            if not _is_item_error(e):
+                raise
+            if len(batch) == 1:
                 # 提供更详细的错误信息
                 print(f"在处理文本嵌入时出错: {str(e)}")
-                print(f"问题文本: {text[:100]}...")
+                print(f"问题文本: {batch[0][:100]}...")
                 raise
+            print(f"批量嵌入 {len(batch)} 条文本时出错，拆分后重试: {str(e)}")
+            mid = len(batch) // 2
+            return self._embed_batch(batch[:mid]) + self._embed_batch(batch[mid:])
+    
+    def _embed_batch_array(self, batch: List[str]) -> np.ndarray:
+        """嵌入一个批次并立即转换为 float32 矩阵"""
+        return np.asarray(self._embed_batch(batch), dtype=np.float32)
+    
+    def _join_batches(self, results: list) -> Union[List[List[float]], np.ndarray]:
+        """按顺序拼接各批次的结果"""
+        if self.return_numpy:
+            return np.concatenate(results) if results else np.empty((0, EMBEDDING_DIM), dtype=np.float32)
+        embeddings = []
+        for batch_embeddings in results:
+            embeddings.extend(batch_embeddings)
         return embeddings
     
-    def embed_query(self, text: str) -> List[float]:
-        """将查询转换为向量"""
+    def _format_output(self, embeddings) -> Union[List[List[float]], np.ndarray]:
+        """按 return_numpy 设置统一输出格式"""
+        if self.return_numpy:
+            if not len(embeddings):
+                return np.empty((0, EMBEDDING_DIM), dtype=np.float32)
+            return np.ascontiguousarray(embeddings, dtype=np.float32)
+        if isinstance(embeddings, np.ndarray):
+            return embeddings.tolist()
+        return [
+            vector.tolist() if isinstance(vector, np.ndarray) else vector
+            for vector in embeddings
+        ]
+    
+    def _embed_uncached(self, texts: List[str]) -> Union[List[List[float]], np.ndarray]:
+        """不经过缓存直接生成向量"""
         # 演示模式
         if self.demo_mode:
-            return self._get_demo_embedding(text)
+            return self._get_demo_embeddings(texts)
             
-        # 正常API模式
+        # 正常API模式：批量请求，结果保持输入顺序
+        batches = list(self._iter_batches(texts))
+        embed_batch = self._embed_batch_array if self.return_numpy else self._embed_batch
+        if self.max_workers > 1 and len(batches) > 1:
+            # 多个批次并发请求，限流器控制总体QPS
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(batches))) as executor:
+                results = list(executor.map(embed_batch, batches))
+        else:
+            results = [embed_batch(batch) for batch in batches]
+        return self._join_batches(results)
+    
+    def _lookup_cache(self, texts: List[str]) -> Tuple[List[str], List[Optional[List[float]]], List[int]]:
+        """查询缓存，返回缓存键、已命中的向量和未命中的下标"""
+        # 演示模式的模拟向量使用单独的键，不会在换用真实密钥后被当作模型的向量返回
+        model = f"demo:{self.model}" if self.demo_mode else self.model
+        keys = [self.cache.make_key(model, text) for text in texts]
+        embeddings = self.cache.get_many(keys, as_numpy=self.return_numpy)
+        missing = [i for i, vector in enumerate(embeddings) if vector is None]
+        return keys, embeddings, missing
+    
+    def _fill_cache(self, keys, embeddings, missing, new_embeddings) -> List[List[float]]:
+        """写回新生成的向量，并填入结果列表"""
+        self.cache.put_many([keys[i] for i in missing], new_embeddings)
+        for i, vector in zip(missing, new_embeddings):
+            embeddings[i] = vector
+        return embeddings
+    
+    def _embed_coalesced(self, texts: List[str]) -> list:
+        """批内去重并合并并发请求，每个不同的文本只嵌入一次"""
+        unique_texts = list(dict.fromkeys(texts))
+        futures = {}
+        owned = []
+        with self._inflight_lock:
+            for text in unique_texts:
+                future = self._inflight.get(text)
+                if future is None:
+                    future = Future()
+                    self._inflight[text] = future
+                    owned.append(text)
+                futures[text] = future
+            self.coalesced_count += len(texts) - len(owned)
+        
         try:
-            # 适配新版本 API
-            response = self.client.embeddings.create(
-                model="embedding-2",
-                input=text
-            )
-            
-            # 检查响应格式并处理
-            if hasattr(response, 'data') and len(response.data) > 0:
-                return response.data[0].embedding
-            else:
-                raise ValueError(f"Error from ZhipuAI API: {response}")
+            if owned:
+                for text, vector in zip(owned, self._embed_uncached(owned)):
+                    futures[text].set_result(vector)
+        except Exception as e:
+            for text in owned:
+                if not futures[text].done():
+                    futures[text].set_exception(e)
+            raise
+        finally:
+            with self._inflight_lock:
+                for text in owned:
+                    self._inflight.pop(text, None)
+        
+        # 由其他线程负责的文本在这里等待其结果
+        vectors = {text: futures[text].result() for text in unique_texts}
+        return [vectors[text] for text in texts]
+    
+    def embed_documents(self, texts: List[str]) -> Union[List[List[float]], np.ndarray]:
+        """将文档转换为向量"""
+        if not texts:
+            return self._format_output([])
+        if self.cache is None:
+            return self._format_output(self._embed_coalesced(texts))
+        
+        # 先查缓存，只为未命中的文本请求向量
+        keys, embeddings, missing = self._lookup_cache(texts)
+        if missing:
+            new_embeddings = self._embed_coalesced([texts[i] for i in missing])
+            self._fill_cache(keys, embeddings, missing, new_embeddings)
+        return self._format_output(embeddings)
+    
+    def embed_query(self, text: str) -> Union[List[float], np.ndarray]:
+        """将查询转换为向量"""
+        # 复用批量路径，与并发的相同查询共享同一次调用
+        try:
+            return self.embed_documents([text])[0]
         except Exception as e:
             # 提供更详细的错误信息
             print(f"在处理查询嵌入时出错: {str(e)}")
             print(f"查询文本: {text}")
-            raise 
\ No newline at end of file
+            raise
+    
+    def _loop_state(self) -> dict:
+        """当前事件循环的信号量和进行中的请求（连接池在需要时才创建）"""
+        loop = asyncio.get_running_loop()
+        with self._inflight_lock:
+            state = self._loop_states.get(loop)
+            if state is None:
+                state = {
+                    "client": None,
+                    "closer": None,
+                    "semaphore": asyncio.Semaphore(self.max_concurrency),
+                    "inflight": {}
+                }
+                self._loop_states[loop] = state
+        return state
+    
+    async def _get_async_client(self) -> httpx.AsyncClient:
+        """获取当前事件循环下的异步连接池，调用方传入的连接池直接使用"""
+        if not self._owns_async_client:
+            return self._async_client
+        state = self._loop_state()
+        if state["client"] is None:
+            # 连接池绑定事件循环：每个循环各建一个，循环结束（如 asyncio.run 返回）前自动关闭
+            client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=self.max_concurrency,
+                    max_keepalive_connections=self.max_concurrency
+                ),
+                timeout=httpx.Timeout(60.0)
+            )
+            closer = _close_on_shutdown(client)
+            await closer.__anext__()
+            state["client"], state["closer"] = client, closer
+        return state["client"]
+    
+    async def _acreate_embeddings(self, batch: List[str]) -> dict:
+        """异步调用嵌入接口，对限流和服务端错误进行退避重试"""
+        client = await self._get_async_client()
+        semaphore = self._loop_state()["semaphore"]
+        url = f"{self.base_url}/embeddings"
+        attempt = 0
+        while True:
+            if self.rate_limiter is not None:
+                await self.rate_limiter.aacquire()
+            try:
+                async with semaphore:
+                    response = await client.post(
+                        url,
+                        headers=self._auth_headers,
+                        json={"model": self.model, "input": batch}
+                    )
+                response.raise_for_status()
+                return response.json()
+            except Exception as e:
+                if attempt >= self.max_retries or not _is_retryable_error(e):
+                    raise
+                delay = self._backoff_delay(attempt, e)
+                print(f"嵌入请求暂时失败，{delay:.2f}秒后第{attempt + 1}次重试: {str(e)}")
+                await asyncio.sleep(delay)
+                attempt += 1
+    
+    async def _arequest_embeddings(self, batch: List[str]) -> List[List[float]]:
+        """异步发送一次嵌入请求，按输入顺序返回向量"""
+        result = await self._acreate_embeddings(batch)
+        data = result.get("data") if isinstance(result, dict) else None
+        if not data or len(data) != len(batch):
+            raise ValueError(f"Error from ZhipuAI API: {result}")
+        return self._ordered_embeddings([(item.get("index"), item["embedding"]) for item in data])
+    
+    async def _aembed_batch(self, batch: List[str]) -> List[List[float]]:
+        """异步嵌入一个批次，因某条输入出错时二分拆分，只重试出错的子批次；其他错误直接抛出"""
+        try:
+            return await self._arequest_embeddings(batch)
+        except Exception as e:
+            if not _is_item_error(e):
+                raise
+            if len(batch) == 1:
+                print(f"在处理文本嵌入时出错: {str(e)}")
+                print(f"问题文本: {batch[0][:100]}...")
+                raise
+            print(f"批量嵌入 {len(batch)} 条文本时出错，拆分后重试: {str(e)}")
+            mid = len(batch) // 2
+            first, second = await asyncio.gather(
+                self._aembed_batch(batch[:mid]),
+                self._aembed_batch(batch[mid:])
+            )
+            return first + second
+    
+    async def _aembed_batch_array(self, batch: List[str]) -> np.ndarray:
+        """异步嵌入一个批次并立即转换为 float32 矩阵"""
+        return np.asarray(await self._aembed_batch(batch), dtype=np.float32)
+    
+    async def _aembed_uncached(self, texts: List[str]) -> Union[List[List[float]], np.ndarray]:
+        """异步生成向量，各批次并发请求，并发数受 max_concurrency 限制"""
+        if self.demo_mode:
+            return self._get_demo_embeddings(texts)
+        
+        embed_batch = self._aembed_batch_array if self.return_numpy else self._aembed_batch
+        results = await asyncio.gather(
+            *(embed_batch(batch) for batch in self._iter_batches(texts))
+        )
+        return self._join_batches(list(results))
+    
+    async def _aembed_coalesced(self, texts: List[str]) -> list:
+        """异步版本的批内去重与并发请求合并"""
+        inflight = self._loop_state()["inflight"]
+        loop = asyncio.get_running_loop()
+        unique_texts = list(dict.fromkeys(texts))
+        futures = {}
+        owned = []
+        for text in unique_texts:
+            future = inflight.get(text)
+            if future is None:
+                future = loop.create_future()
+                inflight[text] = future
+                owned.append(text)
+            futures[text] = future
+        self.coalesced_count += len(texts) - len(owned)
+        
+        try:
+            if owned:
+                for text, vector in zip(owned, await self._aembed_uncached(owned)):
+                    futures[text].set_result(vector)
+        except BaseException as e:
+            for text in owned:
+                if not futures[text].done():
+                    futures[text].set_exception(e)
+                    # 没有其他协程等待时避免 "exception was never retrieved" 警告
+                    futures[text].exception()
+            raise
+        finally:
+            for text in owned:
+                inflight.pop(text, None)
+        
+        vectors = {}
+        for text in unique_texts:
+            vectors[text] = await futures[text]
+        return [vectors[text] for text in texts]
+    
+    async def aembed_documents(self, texts: List[str]) -> Union[List[List[float]], np.ndarray]:
+        """异步将文档转换为向量"""
+        if not texts:
+            return self._format_output([])
+        if self.cache is None:
+            return self._format_output(await self._aembed_coalesced(texts))
+        
+        keys, embeddings, missing = self._lookup_cache(texts)
+        if missing:
+            new_embeddings = await self._aembed_coalesced([texts[i] for i in missing])
+            self._fill_cache(keys, embeddings, missing, new_embeddings)
+        return self._format_output(embeddings)
+    
+    async def aembed_query(self, text: str) -> Union[List[float], np.ndarray]:
+        """异步将查询转换为向量"""
+        try:
+            return (await self.aembed_documents([text]))[0]
+        except Exception as e:
+            print(f"在处理查询嵌入时出错: {str(e)}")
+            print(f"查询文本: {text}")
+            raise
+    
+    async def aclose(self):
+        """关闭当前事件循环下自行创建的异步连接池"""
+        with self._inflight_lock:
+            state = self._loop_states.pop(asyncio.get_running_loop(), None)
+        if state is not None and state["closer"] is not None:
+            await state["closer"].aclose()
@@ -3,6 +3,7 @@ import os
 import sys
 from dotenv import load_dotenv
 import uuid
+import hashlib
 
 # 设置页面配置 - 必须是第一个Streamlit命令
 st.set_page_config(
@@ -27,13 +28,18 @@ def initialize_session_state():
         "show_key": False,
         "deepseek_api_key": "",
         "documents": [],
+        "processed_files": {},
+        "document_chunks": {},
         "embedding": None,
         "doc_processor": None,
         "vector_store": None,
         "search_manager": None,
         "llm": None,
         "condense_question_prompt": None,
-        "qa_prompt": None
+        "qa_prompt": None,
+        "resource_leases": {},
+        # 会话标识，用于区分共享向量库中各会话写入的来源
+        "session_id": str(uuid.uuid4())
     }
     
     for key, default_value in session_state_keys.items():
@@ -78,9 +84,18 @@ uploaded_files = st.sidebar.file_uploader(
     accept_multiple_files=True
 )
 
-# 处理文档上传
+# 处理文档上传（只处理新增或内容有变化的文件，已加载文档后仍可继续上传）
 if uploaded_files:
-    if not st.session_state.documents_loaded:
+    # 按内容哈希判断文件是否变化，大小不变的修改也会重新处理
+    file_hashes = {
+        uploaded_file.name: hashlib.sha256(uploaded_file.getvalue()).hexdigest()
+        for uploaded_file in uploaded_files
+    }
+    pending_files = [
+        uploaded_file for uploaded_file in uploaded_files
+        if st.session_state.processed_files.get(uploaded_file.name) != file_hashes[uploaded_file.name]
+    ]
+    if pending_files:
         with st.sidebar:
             with st.spinner("处理上传文件..."):
                 try:
@@ -88,9 +103,9 @@ if uploaded_files:
                     if not st.session_state.app_initialized:
                         st.error("请先输入API密钥并等待应用初始化完成")
                     else:
-                        # 处理所有上传的文件
-                        all_documents = []
-                        for uploaded_file in uploaded_files:
+                        added_count = 0
+                        unchanged_count = 0
+                        for uploaded_file in pending_files:
                             # 为上传文件生成一个安全的文件名，保留原始扩展名
                             file_extension = os.path.splitext(uploaded_file.name)[1]
                             safe_filename = f"{uuid.uuid4()}{file_extension}"
@@ -110,23 +125,32 @@ if uploaded_files:
                             for doc in documents:
                                 if not hasattr(doc, 'metadata'):
                                     doc.metadata = {}
+                                # 来源为会话标识加原始文件名：向量库由多个会话共享，按来源清理旧分块时
+                                # 不会删除其他会话上传的同名文件；同一会话重复上传时分块ID保持不变
+                                doc.metadata['source'] = f"{st.session_state.session_id}/{uploaded_file.name}"
                                 doc.metadata['source_file'] = uploaded_file.name
                                 doc.metadata['file_size'] = len(uploaded_file.getbuffer())
                                 doc.metadata['file_type'] = file_extension.lstrip('.')
                             
-                            all_documents.extend(documents)
+                            if documents:
+                                # 增量写入向量库，只嵌入新的或有变化的片段
+                                stats = st.session_state.vector_store.upsert_documents(documents)
+                                added_count += stats["added"]
+                                unchanged_count += stats["unchanged"]
+                                st.session_state.document_chunks[uploaded_file.name] = documents
+                            st.session_state.processed_files[uploaded_file.name] = file_hashes[uploaded_file.name]
                     
-                        if all_documents:
-                            # 添加到向量库
-                            st.session_state.vector_store.create_from_documents(all_documents)
-                            st.session_state.documents = all_documents
+                        st.session_state.documents = [
+                            doc for chunks in st.session_state.document_chunks.values() for doc in chunks
+                        ]
+                        if st.session_state.documents:
                             st.session_state.documents_loaded = True
-                            st.success(f"✅ 成功处理文件，加载了 {len(all_documents)} 个文档片段")
+                            st.success(f"✅ 成功处理文件，新增 {added_count} 个文档片段，{unchanged_count} 个片段未变化")
                         else:
                             st.warning("⚠️ 未能从文件中提取文档")
                 except Exception as e:
                     st.error(f"❌ 处理上传文件时出错: {str(e)}")
-    else:
+    elif st.session_state.documents_loaded:
         st.sidebar.success(f"✅ 已加载 {len(st.session_state.documents)} 个文档片段")
 
 # 示例数据按钮
@@ -164,11 +188,17 @@ if st.sidebar.button("加载示例数据"):
                 # 处理文件
                 documents = st.session_state.doc_processor.load_document(temp_file_path)
                 documents = st.session_state.doc_processor.split_documents(documents)
+                for doc in documents:
+                    # 示例文件的路径对所有会话相同，来源同样按会话区分
+                    doc.metadata['source'] = f"{st.session_state.session_id}/example.md"
                 
                 if documents:
-                    # 添加到向量库
-                    st.session_state.vector_store.create_from_documents(documents)
-                    st.session_state.documents = documents
+                    # 增量写入向量库
+                    st.session_state.vector_store.upsert_documents(documents)
+                    st.session_state.document_chunks["example.md"] = documents
+                    st.session_state.documents = [
+                        doc for chunks in st.session_state.document_chunks.values() for doc in chunks
+                    ]
                     st.session_state.documents_loaded = True
                     st.sidebar.success(f"✅ 成功加载示例数据，得到 {len(documents)} 个文档片段")
                 else:
@@ -185,12 +215,22 @@ if st.sidebar.button("重置聊天历史"):
 # 重置文档按钮
 if st.session_state.documents_loaded:
     if st.sidebar.button("清除已加载文档"):
+        # 向量库由多个会话共享，只删除本会话加载的来源（以会话标识为前缀）
+        prefix = f"{st.session_state.session_id}/"
+        sources = {
+            doc.metadata.get("source")
+            for chunks in st.session_state.document_chunks.values() for doc in chunks
+            if str(doc.metadata.get("source", "")).startswith(prefix)
+        }
+        removed = 0
+        if sources and st.session_state.vector_store is not None:
+            removed = st.session_state.vector_store.delete_by_source(list(sources))
         st.session_state.documents_loaded = False
         if "documents" in st.session_state:
             del st.session_state.documents
-        if "vector_store" in st.session_state and hasattr(st.session_state.vector_store, "clear"):
-            st.session_state.vector_store.clear()
-        st.sidebar.success("✅ 已清除所有文档")
+        st.session_state.processed_files = {}
+        st.session_state.document_chunks = {}
+        st.sidebar.success(f"✅ 已清除所有文档（删除 {removed} 个文档片段）")
         st.experimental_rerun()
 
 # 主区：Logo+标题
@@ -239,45 +279,74 @@ try:
     if not st.session_state.app_initialized:
         with st.spinner("正在初始化应用组件..."):
             try:
-                # 初始化 embedding
                 from src.zhipuai_embedding import ZhipuAIEmbeddings
-                embedding = ZhipuAIEmbeddings(api_key=st.session_state.get("zhipu_api_key", ""))
-                st.session_state.embedding = embedding
-                
-                # 初始化文档处理器
                 from src.document_processor import DocumentProcessor
-                doc_processor = DocumentProcessor()
-                st.session_state.doc_processor = doc_processor
-                
-                # 初始化向量存储
                 from src.vector_store import VectorStore
+                from src.search_manager import SearchManager
+                from src.deepseek_llm import DeepSeekChat
+                from src.resource_registry import get_registry, secret_key
+                
+                # 客户端和向量库在进程内所有会话间共享，按引用计数管理；
+                # 租约保存在会话状态中，会话结束被回收时自动归还
+                registry = get_registry()
+                zhipu_key = st.session_state.get("zhipu_api_key", "")
+                deepseek_key = st.session_state.get("deepseek_api_key", "")
+                leases = st.session_state.resource_leases
                 
-                # 创建临时目录用于测试
-                temp_dir = os.path.join(os.getcwd(), "temp_vector_db")
+                # 初始化 embedding（同一个密钥共用一个客户端）
+                leases["embedding"] = registry.lease(
+                    ("embedding", secret_key(zhipu_key)),
+                    lambda: ZhipuAIEmbeddings(api_key=zhipu_key)
+                )
+                st.session_state.embedding = leases["embedding"].resource
+                
+                # 初始化文档处理器（每个会话一个：last_report 等状态不能在会话间共享）；
+                # 逐页文本缓存在同一个文件中，重复上传的 PDF 直接读取缓存
+                st.session_state.doc_processor = DocumentProcessor(
+                    pdf_cache_dir=os.path.join(os.getcwd(), "temp_data", "pdf_page_cache")
+                )
+                
+                # 初始化向量存储
+                # 创建临时目录用于测试；向量库绑定创建它的嵌入客户端，因此按嵌入身份（模型和密钥摘要）
+                # 各用一个目录：不同密钥的会话不会共用别人的额度，演示向量也不会混入真实向量
+                embedding_identity = f"{st.session_state.embedding.model}-{secret_key(zhipu_key)}"
+                temp_dir = os.path.join(os.getcwd(), "temp_vector_db", embedding_identity)
                 os.makedirs(temp_dir, exist_ok=True)
                 
-                vector_store = VectorStore(
-                    embedding=st.session_state.embedding,
-                    persist_directory=temp_dir
+                # 同一个目录只能有一个向量库实例，否则多个实例的写入互相竞争；
+                # 目录与嵌入身份一一对应，同一身份的会话共享一个实例
+                def create_vector_store():
+                    store = VectorStore(
+                        embedding=st.session_state.embedding,
+                        persist_directory=temp_dir
+                    )
+                    # 清除文档只记墓碑，由后台任务定期回收空间（Chroma 后端自行管理，不启动）
+                    store.start_compaction()
+                    return store
+                
+                leases["vector_store"] = registry.lease(
+                    ("vector_store", embedding_identity, temp_dir),
+                    create_vector_store
                 )
-                st.session_state.vector_store = vector_store
+                st.session_state.vector_store = leases["vector_store"].resource
                 
-                # 初始化搜索管理器
-                from src.search_manager import SearchManager
+                # 初始化搜索管理器（搜索历史属于每个用户，不共享）
                 search_manager = SearchManager(st.session_state.vector_store)
                 st.session_state.search_manager = search_manager
                 
                 # 初始化语言模型
-                from src.deepseek_llm import DeepSeekChat
-                use_demo_mode = not st.session_state.get("deepseek_api_key", "")
-                llm = DeepSeekChat(
-                    model="deepseek-chat",
-                    temperature=0.7,
-                    max_tokens=2000,
-                    api_key=st.session_state.get("deepseek_api_key", ""),
-                    demo_mode=use_demo_mode  # 如果没有API密钥就自动使用演示模式
+                use_demo_mode = not deepseek_key
+                leases["llm"] = registry.lease(
+                    ("llm", secret_key(deepseek_key)),
+                    lambda: DeepSeekChat(
+                        model="deepseek-chat",
+                        temperature=0.7,
+                        max_tokens=2000,
+                        api_key=deepseek_key,
+                        demo_mode=use_demo_mode  # 如果没有API密钥就自动使用演示模式
+                    )
                 )
-                st.session_state.llm = llm
+                st.session_state.llm = leases["llm"].resource
                 
                 # 初始化聊天模板
                 from langchain_core.prompts import ChatPromptTemplate
@@ -0,0 +1,201 @@
+import unittest
+import os
+import shutil
+import threading
+import importlib.util
+import numpy as np
+from src.ann_index import AnnIndex, HnswIndex, FaissIndex
+from src.flat_index import FlatIndex
+from src.vector_store import VectorStore
+from src.zhipuai_embedding import ZhipuAIEmbeddings
+
+HAS_HNSWLIB = importlib.util.find_spec("hnswlib") is not None
+HAS_FAISS = importlib.util.find_spec("faiss") is not None
+
+class AnnIndexTestMixin:
+    """各 ANN 后端共用的测试"""
+    index_class = None
+    params = {}
+
+    def setUp(self):
+        """测试前的准备工作"""
+        self.embedding = ZhipuAIEmbeddings(api_key="test_key_ann", return_numpy=True)
+        self.test_dir = os.path.join(os.path.dirname(__file__), f"test_{self.index_class.backend_name}_index")
+        rng = np.random.default_rng(0)
+        self.vectors = rng.standard_normal((500, 32), dtype=np.float32)
+        self.texts = [f"文档{i}" for i in range(500)]
+        self.metadatas = [{"group": i % 5} for i in range(500)]
+
+    def tearDown(self):
+        """测试后的清理工作"""
+        if os.path.exists(self.test_dir):
+            shutil.rmtree(self.test_dir)
+
+    def make_index(self, persist_directory=None):
+        # exact_threshold=0 强制走 ANN 检索
+        index = self.index_class(self.embedding, persist_directory, dict(self.params), exact_threshold=0)
+        index.add_embeddings(self.texts, self.vectors, self.metadatas)
+        return index
+
+    def test_recall(self):
+        """测试 ANN 结果与精确检索基本一致"""
+        index = self.make_index()
+        exact = FlatIndex(self.embedding)
+        exact.add_embeddings(self.texts, self.vectors, self.metadatas)
+
+        hits = 0
+        for query in self.vectors[:20]:
+            ann_docs = [doc.page_content for doc, _ in index.similarity_search_by_vector_with_score(query, k=5)]
+            exact_docs = [doc.page_content for doc, _ in exact.similarity_search_by_vector_with_score(query, k=5)]
+            hits += len(set(ann_docs) & set(exact_docs))
+        self.assertGreaterEqual(hits / 100, 0.9)
+
+    def test_filter(self):
+        """测试过滤条件下仍返回k个满足条件的结果"""
+        index = self.make_index()
+        results = index.similarity_search_by_vector_with_score(self.vectors[3], k=4, filter={"group": 3})
+        self.assertEqual(len(results), 4)
+        self.assertTrue(all(doc.metadata["group"] == 3 for doc, _ in results))
+        self.assertEqual(results[0][0].page_content, "文档3")
+
+    def test_persist_params(self):
+        """测试索引参数随索引持久化"""
+        index = self.make_index(self.test_dir)
+        index.persist()
+
+        loaded = self.index_class(self.embedding, self.test_dir, exact_threshold=0)
+        self.assertEqual(loaded.params, index.params)
+        self.assertIsNotNone(loaded._ann)
+        results = loaded.similarity_search_by_vector_with_score(self.vectors[7], k=1)
+        self.assertEqual(results[0][0].page_content, "文档7")
+
+        # 查询参数可随时调整，构建参数不可
+        loaded.set_search_params(ef_search=128)
+        self.assertEqual(loaded.params["ef_search"], 128)
+        with self.assertRaises(ValueError):
+            loaded.set_search_params(M=8)
+
+    def test_incremental_and_delete(self):
+        """测试增量写入和删除后的检索"""
+        index = self.make_index()
+        index.similarity_search_by_vector_with_score(self.vectors[0], k=1)
+        new_vector = np.ones(32, dtype=np.float32)
+        index.add_embeddings(["新增文档"], new_vector[None, :], ids=["new"])
+        results = index.similarity_search_by_vector_with_score(new_vector, k=1)
+        self.assertEqual(results[0][0].page_content, "新增文档")
+
+        index.delete(ids=["new"])
+        results = index.similarity_search_by_vector_with_score(new_vector, k=1)
+        self.assertNotEqual(results[0][0].page_content, "新增文档")
+
+    def test_compact_rebuilds(self):
+        """测试压缩后重建索引，检索结果不含已删除的记录"""
+        index = self.make_index()
+        index.similarity_search_by_vector_with_score(self.vectors[0], k=1)
+        index.delete(ids=index.get(where={"group": 0})["ids"])
+        results = index.similarity_search_by_vector_with_score(self.vectors[0], k=10)
+        self.assertTrue(all(doc.metadata["group"] != 0 for doc, _ in results))
+
+        self.assertEqual(index.compact(), 100)
+        self.assertEqual(index._ann_rows, 400)
+        results = index.similarity_search_by_vector_with_score(self.vectors[1], k=1)
+        self.assertEqual(results[0][0].page_content, "文档1")
+
+    def test_compact_outside_lock(self):
+        """测试压缩在锁外重建索引：构建期间查询不被阻塞，期间写入的记录不会丢失"""
+        index = self.make_index()
+        index.similarity_search_by_vector_with_score(self.vectors[0], k=1)
+        index.delete(ids=index.get(where={"group": 0})["ids"])
+        build_ann = index._build_ann
+        calls = []
+        def build_during_compaction(vectors):
+            calls.append(len(vectors))
+            if len(calls) == 1:
+                query = threading.Thread(target=index.similarity_search_by_vector_with_score, args=(self.vectors[1], 1))
+                query.start()
+                query.join(timeout=10)
+                self.assertFalse(query.is_alive())
+                index.add_embeddings(["压缩期间写入"], self.vectors[:1], [{"group": 9}])
+            return build_ann(vectors)
+        index._build_ann = build_during_compaction
+
+        self.assertEqual(index.compact(), 100)
+        # 构建期间有写入，重新构建一次
+        self.assertEqual(calls, [400, 401])
+        self.assertEqual(index.get(where={"group": 9})["documents"], ["压缩期间写入"])
+        self.assertEqual((index.count(), index.tombstone_count(), index._ann_rows), (401, 0, 401))
+
+class TestAnnIndex(unittest.TestCase):
+    def test_incomplete_backend(self):
+        """测试缺少 ANN 钩子的子类在构造时报错，而不是在首次检索或保存时"""
+        class NoPersistence(AnnIndex):
+            backend_name = "partial"
+
+            def _build_ann(self, vectors):
+                return vectors
+
+            def _add_to_ann(self, vectors, start):
+                pass
+
+            def _apply_search_params(self):
+                pass
+
+            def _query_ann(self, query_vectors, fetch):
+                raise AssertionError("not reached")
+
+        with self.assertRaises(TypeError):
+            NoPersistence(None)
+
+@unittest.skipUnless(HAS_HNSWLIB, "hnswlib is not installed")
+class TestHnswIndex(AnnIndexTestMixin, unittest.TestCase):
+    index_class = HnswIndex
+    params = {"M": 16, "ef_construction": 100, "ef_search": 50}
+
+    def test_vector_store_backend(self):
+        """测试 VectorStore 使用 hnsw 后端"""
+        store = VectorStore(
+            persist_directory=None,
+            embedding=self.embedding,
+            backend="hnsw",
+            index_params={"M": 8}
+        )
+        store.add_embeddings(self.texts, self.vectors, self.metadatas)
+        self.assertEqual(store.get_document_count(), 500)
+        self.assertEqual(store.vectordb.params["M"], 8)
+
+@unittest.skipUnless(HAS_FAISS, "faiss is not installed")
+class TestFaissHnswIndex(AnnIndexTestMixin, unittest.TestCase):
+    index_class = FaissIndex
+    params = {"index_type": "hnsw", "M": 16, "ef_search": 50}
+
+@unittest.skipUnless(HAS_FAISS, "faiss is not installed")
+class TestFaissIvfIndex(AnnIndexTestMixin, unittest.TestCase):
+    index_class = FaissIndex
+    params = {"index_type": "ivf", "nlist": 8, "nprobe": 8}
+
+    def test_persist_params(self):
+        """测试 IVF 参数随索引持久化"""
+        index = self.make_index(self.test_dir)
+        index.persist()
+        loaded = FaissIndex(self.embedding, self.test_dir, {"nprobe": 2})
+        self.assertEqual(loaded.params["index_type"], "ivf")
+        self.assertEqual(loaded.params["nprobe"], 2)
+        self.assertEqual(loaded._ann.nprobe, 2)
+
+    def test_retrain_when_grown(self):
+        """测试数据量增长到可训练更多聚类中心时重新训练"""
+        index = FaissIndex(self.embedding, None, {"index_type": "ivf", "nlist": 64}, exact_threshold=0)
+        index.add_embeddings(self.texts[:100], self.vectors[:100])
+        index.similarity_search_by_vector_with_score(self.vectors[0], k=1)
+        self.assertEqual(index._ann.nlist, 2)
+        # 可用的聚类中心数未翻倍时只追加
+        index.add_embeddings(self.texts[100:150], self.vectors[100:150])
+        index.similarity_search_by_vector_with_score(self.vectors[0], k=1)
+        self.assertEqual((index._ann.nlist, index._ann.ntotal), (2, 150))
+        index.add_embeddings(self.texts[150:], self.vectors[150:])
+        results = index.similarity_search_by_vector_with_score(self.vectors[400], k=1)
+        self.assertEqual((index._ann.nlist, index._ann.ntotal), (12, 500))
+        self.assertEqual(results[0][0].page_content, "文档400")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,147 @@
+import unittest
+import os
+import shutil
+import time
+from unittest import mock
+from src.document_processor import DocumentProcessor
+from src.directory_sync import DirectorySync
+from src.vector_store import VectorStore
+from src.near_duplicates import chunk_sources
+from src.zhipuai_embedding import ZhipuAIEmbeddings
+
+class TestDirectorySync(unittest.TestCase):
+    def setUp(self):
+        """测试前的准备工作"""
+        self.test_dir = os.path.join(os.path.dirname(__file__), "test_sync_data")
+        self.manifest_path = os.path.join(os.path.dirname(__file__), "test_sync_manifest.json")
+        os.makedirs(self.test_dir, exist_ok=True)
+        for i in range(3):
+            self.write_file(f"doc{i}.txt", f"第{i}个文件的内容。")
+        self.embedding = ZhipuAIEmbeddings(api_key="test_key_sync", return_numpy=True)
+        self.store = VectorStore(persist_directory=None, embedding=self.embedding, backend="flat")
+        self.processor = DocumentProcessor(chunk_size=100, chunk_overlap=0)
+
+        self.embedded = []
+        embed_documents = self.embedding.embed_documents
+        def counting_embed(texts):
+            self.embedded.extend(texts)
+            return embed_documents(texts)
+        self.embedding.embed_documents = counting_embed
+
+    def tearDown(self):
+        """测试后的清理工作"""
+        if os.path.exists(self.test_dir):
+            shutil.rmtree(self.test_dir)
+        for path in (self.manifest_path, os.path.splitext(self.manifest_path)[0] + ".duplicates.json"):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def write_file(self, name, text):
+        with open(os.path.join(self.test_dir, name), "w", encoding="utf-8") as f:
+            f.write(text)
+
+    def make_sync(self):
+        return DirectorySync(self.processor, self.store, self.manifest_path)
+
+    def test_unchanged_skips_work(self):
+        """测试未变化的目录不读取文件内容、不调用嵌入"""
+        stats = self.make_sync().sync(self.test_dir)
+        self.assertEqual(stats["added_files"], 3)
+        self.assertEqual(stats["added"], 3)
+        self.embedded.clear()
+
+        with mock.patch("src.directory_sync.file_hash") as file_hash:
+            stats = self.make_sync().sync(self.test_dir)
+        file_hash.assert_not_called()
+        self.assertEqual(stats["unchanged_files"], 3)
+        self.assertEqual(self.embedded, [])
+
+        # 只改修改时间、内容不变时只比较哈希
+        path = os.path.join(self.test_dir, "doc0.txt")
+        os.utime(path, (time.time() + 10, time.time() + 10))
+        stats = self.make_sync().sync(self.test_dir)
+        self.assertEqual(stats["unchanged_files"], 3)
+        self.assertEqual(self.embedded, [])
+
+    def test_added_changed_deleted(self):
+        """测试只处理新增和变化的文件，并移除已删除文件的分块"""
+        sync = self.make_sync()
+        sync.sync(self.test_dir)
+        self.embedded.clear()
+
+        self.write_file("doc0.txt", "第0个文件修改后的内容，长度也不同了。")
+        os.remove(os.path.join(self.test_dir, "doc1.txt"))
+        self.write_file("doc3.txt", "新增的第3个文件。")
+        stats = sync.sync(self.test_dir)
+        self.assertEqual(
+            {key: stats[key] for key in ("added_files", "changed_files", "deleted_files", "unchanged_files")},
+            {"added_files": 1, "changed_files": 1, "deleted_files": 1, "unchanged_files": 1}
+        )
+        self.assertEqual(sorted(self.embedded), sorted(["第0个文件修改后的内容，长度也不同了。", "新增的第3个文件。"]))
+        self.assertEqual(stats["removed"], 2)
+        self.assertEqual(
+            sorted(self.store.vectordb.get()["documents"]),
+            sorted(["第0个文件修改后的内容，长度也不同了。", "第2个文件的内容。", "新增的第3个文件。"])
+        )
+        self.assertEqual(sorted(os.path.basename(path) for path in sync.load_manifest()), ["doc0.txt", "doc2.txt", "doc3.txt"])
+
+    def test_cross_file_duplicates(self):
+        """测试跨文件的近似重复分块只存一份并列出全部来源，删除其中一个文件时保留分块"""
+        self.processor = DocumentProcessor(chunk_size=1000, chunk_overlap=0)
+        lecture = (
+            "强化学习讨论的问题是智能体怎么在复杂、不确定的环境里面去最大化它能获得的奖励。"
+            "智能体在环境里面获取到状态，利用这个状态输出一个动作，这个动作也称为决策。"
+            "然后这个决策会放到环境之中去，环境会根据智能体采取的决策，输出下一个状态以及当前的这个决策得到的奖励。"
+        ) * 2
+        self.write_file("lecture.txt", lecture)
+        self.write_file("lecture_copy.txt", lecture.replace("奖励", "回报", 1))
+        first = os.path.join(self.test_dir, "lecture.txt")
+        copy = os.path.join(self.test_dir, "lecture_copy.txt")
+        stats = self.make_sync().sync(self.test_dir)
+        self.assertEqual((stats["added"], stats["duplicates"]), (4, 1))
+        records = self.store.vectordb.get(where={"source": first})
+        self.assertEqual(len(records["ids"]), 1)
+        self.assertEqual(chunk_sources(records["metadatas"][0]), [first, copy])
+
+        # 删除保留分块所在的文件后，分块改记到另一个副本
+        os.remove(first)
+        stats = self.make_sync().sync(self.test_dir)
+        self.assertEqual(stats["removed"], 0)
+        self.assertEqual(self.store.vectordb.get(ids=records["ids"])["metadatas"][0]["source"], copy)
+        # 副本只有格式变化时重新处理，仍匹配到保留分块，不重新嵌入也不删除
+        self.write_file("lecture_copy.txt", lecture.replace("奖励", "回报", 1) + "\n")
+        self.embedded.clear()
+        stats = self.make_sync().sync(self.test_dir)
+        self.assertEqual((stats["changed_files"], stats["duplicates"], stats["removed"]), (1, 1, 0))
+        self.assertEqual(self.embedded, [])
+        self.assertEqual(self.store.vectordb.get(ids=records["ids"])["ids"], records["ids"])
+
+        # 最后一个副本删除后分块随之删除
+        os.remove(copy)
+        stats = self.make_sync().sync(self.test_dir)
+        self.assertEqual(stats["removed"], 1)
+        self.assertEqual(self.store.vectordb.get(ids=records["ids"])["ids"], [])
+        self.assertEqual(self.store.get_document_count(), 3)
+
+    def test_failed_file_retried(self):
+        """测试加载失败的文件不写入清单，下次同步时重试"""
+        self.write_file("broken.json", "{不是合法的JSON")
+        stats = self.make_sync().sync(self.test_dir)
+        self.assertEqual(stats["failed_files"], 1)
+        self.assertNotIn(os.path.join(self.test_dir, "broken.json"), self.make_sync().load_manifest())
+
+    def test_unsupported_files_ignored(self):
+        """测试不支持类型的文件不计为失败，再次同步时不做任何处理"""
+        self.write_file("subtitles.srt", "1\n00:00:01,000 --> 00:00:02,000\n字幕")
+        self.write_file("table.tsv", "a\tb")
+        stats = self.make_sync().sync(self.test_dir)
+        self.assertEqual((stats["added_files"], stats["failed_files"]), (3, 0))
+        self.assertNotIn(os.path.join(self.test_dir, "subtitles.srt"), self.make_sync().load_manifest())
+
+        with mock.patch("src.directory_sync.file_hash") as file_hash:
+            stats = self.make_sync().sync(self.test_dir)
+        file_hash.assert_not_called()
+        self.assertEqual((stats["unchanged_files"], stats["added_files"], stats["failed_files"]), (3, 0, 0))
+
+if __name__ == "__main__":
+    unittest.main()
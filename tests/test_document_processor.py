@@ -66,5 +66,69 @@ class TestDocumentProcessor(unittest.TestCase):
             overlap = len(set(current_chunk.split()) & set(next_chunk.split()))
             self.assertGreaterEqual(overlap, 5)  # 至少应该有5个重叠的词
 
+    def test_parallel_load(self):
+        """测试多进程加载与逐个加载结果顺序一致，并记录每个文件的结果"""
+        for i in range(4):
+            sub_dir = os.path.join(self.test_dir, f"domain{i % 2}")
+            os.makedirs(sub_dir, exist_ok=True)
+            with open(os.path.join(sub_dir, f"doc{i}.txt"), "w", encoding="utf-8") as f:
+                f.write(f"第{i}个文件的内容。" * (i + 1) * 20)
+        with open(os.path.join(self.test_dir, "broken.json"), "w", encoding="utf-8") as f:
+            f.write("{不是合法的JSON")
+        # 不支持类型的文件跳过，不计为错误
+        with open(os.path.join(self.test_dir, "subtitles.vtt"), "w", encoding="utf-8") as f:
+            f.write("WEBVTT")
+        
+        serial = self.processor.process_documents(self.test_dir)
+        parallel_processor = DocumentProcessor(chunk_size=100, chunk_overlap=20, workers=2)
+        parallel = parallel_processor.process_documents(self.test_dir)
+        self.assertEqual(
+            [(doc.page_content, doc.metadata["source"]) for doc in parallel],
+            [(doc.page_content, doc.metadata["source"]) for doc in serial]
+        )
+        
+        report = parallel_processor.last_report
+        self.assertEqual([item["path"] for item in report], sorted(item["path"] for item in report))
+        self.assertNotIn(os.path.join(self.test_dir, "subtitles.vtt"), [item["path"] for item in report])
+        errors = [item for item in report if item["error"]]
+        self.assertEqual([os.path.basename(item["path"]) for item in errors], ["broken.json"])
+        self.assertEqual(sum(item["documents"] for item in report), len(parallel))
+        self.assertTrue(all(item["seconds"] >= 0 for item in report))
+
+    def test_near_duplicate_chunks(self):
+        """测试跨文件合并近似重复的分块"""
+        content = (
+            "强化学习讨论的问题是智能体怎么在复杂、不确定的环境里面去最大化它能获得的奖励。"
+            "智能体在环境里面获取到状态，利用这个状态输出一个动作，这个动作也称为决策。"
+            "然后这个决策会放到环境之中去，环境会根据智能体采取的决策，输出下一个状态以及当前的这个决策得到的奖励。"
+        ) * 2
+        for name, text in (("a.txt", content), ("b.txt", content.replace("奖励", "回报", 1))):
+            with open(os.path.join(self.test_dir, name), "w", encoding="utf-8") as f:
+                f.write(text)
+        # 连同 setUp 中的测试文件，每个文件一个分块
+        self.processor.chunk_size = 500
+        self.assertEqual(len(self.processor.process_documents(self.test_dir)), 3)
+        
+        processor = DocumentProcessor(chunk_size=500, chunk_overlap=20, dedup_distance=3)
+        chunks = processor.process_documents(self.test_dir)
+        self.assertEqual(len(chunks), 2)
+        self.assertEqual(
+            [chunk.metadata["source"] for chunk in chunks],
+            [os.path.join(self.test_dir, "a.txt"), self.test_file]
+        )
+
+    def test_chunk_start_index(self):
+        """测试分块记录在原文中的起始偏移"""
+        self.processor.chunk_overlap = 0
+        self.processor.chunk_size = 10
+        
+        docs = self.processor.load_document(self.test_file)
+        chunks = self.processor.split_documents(docs)
+        
+        text = docs[0].page_content
+        for chunk in chunks:
+            start = chunk.metadata["start_index"]
+            self.assertEqual(text[start:start + len(chunk.page_content)], chunk.page_content)
+
 if __name__ == "__main__":
     unittest.main() 
\ No newline at end of file
@@ -0,0 +1,79 @@
+import unittest
+import os
+import shutil
+from src.embedding_cache import EmbeddingCache
+from src.zhipuai_embedding import ZhipuAIEmbeddings
+
+class TestEmbeddingCache(unittest.TestCase):
+    def setUp(self):
+        """测试前的准备工作"""
+        self.test_dir = os.path.join(os.path.dirname(__file__), "test_embedding_cache")
+        self.cache = EmbeddingCache(cache_dir=self.test_dir, max_entries=3)
+
+    def tearDown(self):
+        """测试后的清理工作"""
+        self.cache.close()
+        if os.path.exists(self.test_dir):
+            shutil.rmtree(self.test_dir)
+
+    def test_hit_and_miss(self):
+        """测试命中与未命中计数"""
+        key = EmbeddingCache.make_key("embedding-2", "测试文本")
+        self.assertEqual(self.cache.get_many([key]), [None])
+        self.cache.put_many([key], [[0.5, 0.25]])
+        self.assertEqual(self.cache.get_many([key]), [[0.5, 0.25]])
+        self.assertEqual(self.cache.hits, 1)
+        self.assertEqual(self.cache.misses, 1)
+
+    def test_key_includes_model(self):
+        """测试缓存键区分模型"""
+        self.assertNotEqual(
+            EmbeddingCache.make_key("embedding-2", "文本"),
+            EmbeddingCache.make_key("embedding-3", "文本")
+        )
+
+    def test_lru_eviction(self):
+        """测试超出容量时淘汰最久未使用的条目"""
+        keys = [EmbeddingCache.make_key("m", str(i)) for i in range(4)]
+        for i, key in enumerate(keys[:3]):
+            self.cache.put_many([key], [[float(i)]])
+        # 访问第一个条目，使第二个成为最久未使用
+        self.cache.get_many([keys[0]])
+        self.cache.put_many([keys[3]], [[3.0]])
+
+        self.assertEqual(len(self.cache), 3)
+        self.assertIsNone(self.cache.get_many([keys[1]])[0])
+        self.assertIsNotNone(self.cache.get_many([keys[0]])[0])
+
+    def test_persistence(self):
+        """测试缓存持久化到磁盘"""
+        key = EmbeddingCache.make_key("embedding-2", "持久化")
+        self.cache.put_many([key], [[1.0, 2.0]])
+        reopened = EmbeddingCache(cache_dir=self.test_dir)
+        try:
+            self.assertEqual(reopened.get_many([key]), [[1.0, 2.0]])
+        finally:
+            reopened.close()
+
+    def test_embeddings_use_cache(self):
+        """测试重复嵌入相同文本时全部命中缓存"""
+        embedding = ZhipuAIEmbeddings(api_key="test_key_cache", cache=self.cache)
+        texts = ["文档一", "文档二"]
+        first = embedding.embed_documents(texts)
+        second = embedding.embed_documents(texts)
+
+        self.assertEqual(self.cache.misses, 2)
+        self.assertEqual(self.cache.hits, 2)
+        self.assertEqual(len(second[0]), 1024)
+        for a, b in zip(first[0], second[0]):
+            self.assertAlmostEqual(a, b, places=6)
+
+    def test_demo_vectors_not_cached_as_model(self):
+        """测试演示模式的模拟向量不会以真实模型的键写入缓存"""
+        embedding = ZhipuAIEmbeddings(api_key="test_key_cache", cache=self.cache)
+        embedding.embed_documents(["文档一"])
+        self.assertEqual(self.cache.get_many([EmbeddingCache.make_key("embedding-2", "文档一")]), [None])
+        self.assertIsNotNone(self.cache.get_many([EmbeddingCache.make_key("demo:embedding-2", "文档一")])[0])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,141 @@
+import unittest
+import os
+import shutil
+import numpy as np
+from langchain_core.documents import Document
+from src.flat_index import FlatIndex
+from src.vector_store import VectorStore
+from src.zhipuai_embedding import ZhipuAIEmbeddings
+
+class TestFlatIndex(unittest.TestCase):
+    def setUp(self):
+        """测试前的准备工作"""
+        self.embedding = ZhipuAIEmbeddings(api_key="test_key_flat")
+        self.index = FlatIndex(self.embedding)
+        self.test_docs = [
+            Document(page_content="强化学习的基本概念", metadata={"source": "rl.txt", "page": 1}),
+            Document(page_content="提示工程的基本原则", metadata={"source": "prompt.md", "page": 2}),
+            Document(page_content="机器学习中的线性模型", metadata={"source": "book.pdf", "page": 3})
+        ]
+        self.index.add_documents(self.test_docs, ids=["a", "b", "c"])
+        self.test_dir = os.path.join(os.path.dirname(__file__), "test_flat_index")
+
+    def tearDown(self):
+        """测试后的清理工作"""
+        if os.path.exists(self.test_dir):
+            shutil.rmtree(self.test_dir)
+
+    def test_exact_search(self):
+        """测试精确检索返回自身且距离为0"""
+        results = self.index.similarity_search_with_score("提示工程的基本原则", k=2)
+        self.assertEqual(len(results), 2)
+        self.assertEqual(results[0][0].page_content, "提示工程的基本原则")
+        self.assertAlmostEqual(results[0][1], 0.0, places=5)
+        self.assertLessEqual(results[0][1], results[1][1])
+
+    def test_batch_search(self):
+        """测试批量检索与逐条检索结果一致"""
+        queries = ["提示工程的基本原则", "机器学习中的线性模型"]
+        vectors = self.embedding.embed_documents(queries)
+        batch_results = self.index.similarity_search_by_vectors_with_score(vectors, k=2, filter={"page": {"$gte": 2}})
+        self.assertEqual(len(batch_results), 2)
+        for query, results in zip(queries, batch_results):
+            expected = self.index.similarity_search_with_score(query, k=2, filter={"page": {"$gte": 2}})
+            self.assertEqual([doc for doc, _ in results], [doc for doc, _ in expected])
+            for (_, score), (_, expected_score) in zip(results, expected):
+                self.assertAlmostEqual(score, expected_score, places=5)
+            self.assertEqual(results[0][0].page_content, query)
+        self.assertEqual(self.index.similarity_search_by_vectors_with_score([], k=2), [])
+
+    def test_metadata_filter(self):
+        """测试 where 条件过滤"""
+        results = self.index.similarity_search("提示工程的基本原则", k=3, filter={"source": "rl.txt"})
+        self.assertEqual([doc.metadata["source"] for doc in results], ["rl.txt"])
+
+        results = self.index.similarity_search(
+            "提示工程的基本原则",
+            k=3,
+            filter={"$and": [{"page": {"$gte": 2}}, {"source": {"$ne": "prompt.md"}}]}
+        )
+        self.assertEqual([doc.metadata["source"] for doc in results], ["book.pdf"])
+
+    def test_numeric_range_filter(self):
+        """测试数值范围条件，缺失值和非数值不满足条件"""
+        self.index.add_texts(["没有页码的内容", "页码不是数值的内容"], [{"source": "x"}, {"page": "四"}])
+        results = self.index.similarity_search("强化学习的基本概念", k=5, filter={"page": {"$gt": 1, "$lte": 3}})
+        self.assertEqual(sorted(doc.metadata["page"] for doc in results), [2, 3])
+        results = self.index.similarity_search("强化学习的基本概念", k=5, filter={"page": {"$lt": 2}})
+        self.assertEqual([doc.metadata["page"] for doc in results], [1])
+
+    def test_upsert_and_delete(self):
+        """测试相同ID覆盖以及删除"""
+        self.index.add_texts(["新的内容"], [{"source": "rl.txt"}], ids=["a"])
+        self.assertEqual(self.index.count(), 3)
+        self.assertEqual(self.index.get(ids=["a"])["documents"], ["新的内容"])
+
+        self.index.delete(ids=["b"])
+        self.assertEqual(self.index.count(), 2)
+        self.assertEqual(self.index.get()["ids"], ["a", "c"])
+        self.assertEqual(self.index.get(where={"page": 3})["ids"], ["c"])
+
+    def test_tombstone_and_compact(self):
+        """测试删除只记墓碑、立即不可检索，压缩后回收空间"""
+        self.assertEqual(self.index.delete(ids=["a", "missing"]), 1)
+        self.assertEqual(self.index.count(), 2)
+        self.assertEqual(self.index.tombstone_count(), 1)
+        self.assertEqual(len(self.index._ids), 3)
+        results = self.index.similarity_search("强化学习的基本概念", k=3)
+        self.assertNotIn("rl.txt", [doc.metadata["source"] for doc in results])
+        self.assertEqual(self.index.get(ids=["a"])["ids"], [])
+
+        self.assertEqual(self.index.compact(), 1)
+        self.assertEqual(self.index.tombstone_count(), 0)
+        self.assertEqual(self.index._ids, ["b", "c"])
+        self.assertEqual(self.index.similarity_search("机器学习中的线性模型", k=1)[0].metadata["page"], 3)
+
+        self.assertEqual(self.index.clear(), 2)
+        self.assertEqual(self.index.get()["ids"], [])
+
+    def test_persist_tombstones(self):
+        """测试墓碑随索引持久化"""
+        index = FlatIndex(self.embedding, self.test_dir)
+        index.add_documents(self.test_docs, ids=["a", "b", "c"])
+        index.delete(ids=["b"])
+        index.persist()
+
+        loaded = FlatIndex(self.embedding, self.test_dir)
+        self.assertEqual(loaded.count(), 2)
+        self.assertEqual(loaded.get()["ids"], ["a", "c"])
+        # 已删除的ID可以重新写入
+        loaded.add_texts(["重新写入"], ids=["b"])
+        self.assertEqual(loaded.get(ids=["b"])["documents"], ["重新写入"])
+
+    def test_persist_and_mmap(self):
+        """测试持久化后以内存映射方式加载"""
+        index = FlatIndex(self.embedding, self.test_dir)
+        index.add_documents(self.test_docs)
+        index.persist()
+
+        loaded = FlatIndex(self.embedding, self.test_dir)
+        self.assertIsInstance(loaded._vectors, np.memmap)
+        self.assertEqual(loaded.count(), 3)
+        results = loaded.similarity_search("机器学习中的线性模型", k=1)
+        self.assertEqual(results[0].metadata, {"source": "book.pdf", "page": 3})
+
+        # 写入时从只读映射复制到内存
+        loaded.add_texts(["追加的内容"])
+        self.assertEqual(loaded.count(), 4)
+
+    def test_vector_store_backend(self):
+        """测试 VectorStore 使用 flat 后端"""
+        store = VectorStore(persist_directory=None, embedding=self.embedding, backend="flat")
+        store.add_documents(self.test_docs)
+        stats = store.upsert_documents(self.test_docs)
+
+        self.assertEqual(stats["removed"], 3)
+        self.assertEqual(store.get_document_count(), 3)
+        results = store.similarity_search("强化学习的基本概念", k=1, filter={"source": "rl.txt"})
+        self.assertEqual(results[0].page_content, "强化学习的基本概念")
+
+if __name__ == "__main__":
+    unittest.main()
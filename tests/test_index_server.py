@@ -0,0 +1,43 @@
+import unittest
+import os
+import shutil
+from langchain_core.documents import Document
+from src.index_server import ReadOnlyIndexPool
+from src.vector_store import VectorStore
+from src.zhipuai_embedding import ZhipuAIEmbeddings
+
+class TestReadOnlyIndexPool(unittest.TestCase):
+    def setUp(self):
+        """测试前的准备工作"""
+        self.embedding = ZhipuAIEmbeddings(api_key="test_key_server", return_numpy=True)
+        self.test_dir = os.path.join(os.path.dirname(__file__), "test_index_server")
+        self.store = VectorStore(persist_directory=None, embedding=self.embedding, backend="flat")
+        self.store.add_documents([
+            Document(page_content=f"第{i}篇文档", metadata={"source": f"doc{i % 3}.txt"}) for i in range(30)
+        ])
+        self.store.export_snapshot(self.test_dir, publish=True)
+
+    def tearDown(self):
+        """测试后的清理工作"""
+        if os.path.exists(self.test_dir):
+            shutil.rmtree(self.test_dir)
+
+    def test_pool_matches_store(self):
+        """测试多进程检索结果与单进程一致，并能切换到新发布的版本"""
+        pool = ReadOnlyIndexPool(self.test_dir, self.embedding, processes=2, refresh_interval=0)
+        self.addCleanup(pool.close)
+        self.assertEqual(pool.get_document_count(), 30)
+        queries = [f"第{i}篇文档" for i in range(5)]
+        batch_results = pool.similarity_search_batch(queries, k=3, filter={"source": "doc1.txt"})
+        expected = self.store.similarity_search_batch(queries, k=3, filter={"source": "doc1.txt"})
+        for results, expected_results in zip(batch_results, expected):
+            self.assertEqual([doc for doc, _ in results], [doc for doc, _ in expected_results])
+        self.assertEqual(pool.similarity_search("第7篇文档", k=1)[0].page_content, "第7篇文档")
+
+        self.store.add_documents([Document(page_content="新发布的文档", metadata={"source": "new.txt"})])
+        self.store.export_snapshot(self.test_dir, publish=True)
+        self.assertEqual(pool.get_document_count(), 31)
+        self.assertEqual(pool.similarity_search("新发布的文档", k=1)[0].page_content, "新发布的文档")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,108 @@
+import unittest
+import os
+import shutil
+import time
+from src.document_processor import DocumentProcessor
+from src.ingest_pipeline import IngestionPipeline, prefetch
+from src.vector_store import VectorStore, make_chunk_id
+from src.zhipuai_embedding import ZhipuAIEmbeddings
+
+class TestIngestionPipeline(unittest.TestCase):
+    def setUp(self):
+        """测试前的准备工作"""
+        self.test_dir = os.path.join(os.path.dirname(__file__), "test_ingest_data")
+        os.makedirs(self.test_dir, exist_ok=True)
+        for i in range(3):
+            with open(os.path.join(self.test_dir, f"doc{i}.txt"), "w", encoding="utf-8") as f:
+                f.write("\n\n".join(f"第{i}个文件的第{j}段。" * 5 for j in range(6)))
+        self.processor = DocumentProcessor(chunk_size=60, chunk_overlap=0)
+        self.embedding = ZhipuAIEmbeddings(api_key="test_key_ingest", return_numpy=True)
+        self.store = VectorStore(persist_directory=None, embedding=self.embedding, backend="flat")
+
+    def tearDown(self):
+        """测试后的清理工作"""
+        if os.path.exists(self.test_dir):
+            shutil.rmtree(self.test_dir)
+
+    def test_same_as_batch_processing(self):
+        """测试流式入库的分块与整批处理一致，重复运行时不再嵌入"""
+        expected = self.processor.process_documents(self.test_dir)
+        pipeline = IngestionPipeline(self.processor, self.store, batch_size=4, queue_size=2)
+        stats = pipeline.run(self.test_dir)
+        self.assertEqual(stats, {"files": 3, "added": len(expected), "unchanged": 0, "duplicates": 0, "removed": 0})
+        self.assertEqual(set(self.store.vectordb.get()["ids"]), {make_chunk_id(doc) for doc in expected})
+        self.assertEqual([item["chunks"] for item in pipeline.last_report], [len(expected) // 3] * 3)
+
+        calls = []
+        embed_documents = self.embedding.embed_documents
+        self.embedding.embed_documents = lambda texts: calls.append(texts) or embed_documents(texts)
+        stats = pipeline.run(self.test_dir)
+        self.assertEqual(stats, {"files": 3, "added": 0, "unchanged": len(expected), "duplicates": 0, "removed": 0})
+        self.assertEqual(calls, [])
+
+    def test_prune_after_file_written(self):
+        """测试清理一个文件的旧分块时，该文件的新分块已全部写入"""
+        prune_source = self.store.prune_source
+        def checked_prune(source, keep_ids):
+            keep_ids = set(keep_ids)
+            self.assertEqual(set(self.store.vectordb.get(ids=list(keep_ids))["ids"]), keep_ids)
+            return prune_source(source, keep_ids)
+        self.store.prune_source = checked_prune
+        # 每个文件的分块数不是批大小的整数倍
+        pipeline = IngestionPipeline(self.processor, self.store, batch_size=5)
+        pipeline.run(self.test_dir)
+        self.assertNotEqual(pipeline.last_report[0]["chunks"] % 5, 0)
+
+    def test_changed_file(self):
+        """测试文件内容变化后替换旧分块，文件变为空时清理全部分块"""
+        pipeline = IngestionPipeline(self.processor, self.store, batch_size=4)
+        pipeline.run(self.test_dir)
+        count = self.store.get_document_count()
+        path = os.path.join(self.test_dir, "doc0.txt")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("只剩一段新的内容。")
+        stats = pipeline.run([path])
+        self.assertEqual(stats["added"], 1)
+        self.assertEqual(self.store.get_document_count(), count - stats["removed"] + 1)
+        self.assertEqual(self.store.similarity_search("只剩一段新的内容。", k=1)[0].page_content, "只剩一段新的内容。")
+
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("")
+        stats = pipeline.run([path])
+        self.assertEqual(stats["removed"], 1)
+        self.assertEqual(self.store.vectordb.get(where={"source": path})["ids"], [])
+
+    def test_batches_land_before_failure(self):
+        """测试每批写入后即可检索，后续阶段出错时异常传给调用方"""
+        calls = []
+        embed_documents = self.embedding.embed_documents
+        def failing_embed(texts):
+            calls.append(len(texts))
+            if len(calls) > 1:
+                raise RuntimeError("embedding failed")
+            return embed_documents(texts)
+        self.embedding.embed_documents = failing_embed
+        pipeline = IngestionPipeline(self.processor, self.store, batch_size=4, queue_size=1)
+        with self.assertRaises(RuntimeError):
+            pipeline.run(self.test_dir)
+        self.assertEqual(self.store.get_document_count(), 4)
+
+    def test_prefetch_backpressure(self):
+        """测试有界队列限制生产者领先消费者的数量"""
+        produced = []
+        def producer():
+            for i in range(100):
+                produced.append(i)
+                yield i
+        consumed = 0
+        for item in prefetch(producer(), maxsize=3):
+            consumed += 1
+            time.sleep(0.01)
+            # 队列中最多3个，生产者手中最多再有1个
+            self.assertLessEqual(len(produced) - consumed, 4)
+            if consumed == 10:
+                break
+        self.assertLess(len(produced), 100)
+
+if __name__ == "__main__":
+    unittest.main()
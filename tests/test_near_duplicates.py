@@ -0,0 +1,114 @@
+import unittest
+import random
+from langchain_core.documents import Document
+import os
+import tempfile
+from src.near_duplicates import (
+    simhash, hamming_distance, NearDuplicateIndex, collapse_near_duplicates,
+    chunk_sources, DuplicateRegistry, SOURCES_FIELD
+)
+
+class TestNearDuplicates(unittest.TestCase):
+    def setUp(self):
+        """测试前的准备工作"""
+        self.text = (
+            "强化学习讨论的问题是智能体怎么在复杂、不确定的环境里面去最大化它能获得的奖励。"
+            "智能体在环境里面获取到状态，利用这个状态输出一个动作，这个动作也称为决策。"
+            "然后这个决策会放到环境之中去，环境会根据智能体采取的决策，输出下一个状态以及当前的这个决策得到的奖励。"
+        ) * 2
+        self.other = (
+            "提示工程是指设计和优化输入给大语言模型的提示，使模型给出更准确、更有用的回答。"
+            "编写清晰、具体的指令，并给模型留出思考的时间，是两条最基本的原则。"
+        ) * 2
+
+    def test_simhash(self):
+        """测试指纹稳定，近似文本距离小，无关文本距离大"""
+        self.assertEqual(simhash(self.text), simhash(self.text))
+        # 空白和标点不影响指纹
+        self.assertEqual(simhash(self.text), simhash(self.text.replace("，", " , ")))
+        edited = self.text.replace("奖励", "回报", 1)
+        self.assertLessEqual(hamming_distance(simhash(self.text), simhash(edited)), 3)
+        self.assertGreater(hamming_distance(simhash(self.text), simhash(self.other)), 15)
+
+    def test_index_query(self):
+        """测试 LSH 索引找出阈值内的全部近似指纹"""
+        rng = random.Random(0)
+        index = NearDuplicateIndex(max_distance=4)
+        fingerprints = [rng.getrandbits(64) for _ in range(200)]
+        for fingerprint in fingerprints:
+            index.add(fingerprint)
+        for position, fingerprint in enumerate(fingerprints[:50]):
+            flipped = fingerprint
+            for bit in rng.sample(range(64), 4):
+                flipped ^= 1 << bit
+            self.assertEqual(index.query(flipped), position)
+        # 与两两比较的结果一致
+        for _ in range(50):
+            query = rng.getrandbits(64)
+            expected = next(
+                (position for position, fingerprint in enumerate(fingerprints) if hamming_distance(query, fingerprint) <= 4),
+                None
+            )
+            self.assertEqual(index.query(query), expected)
+        self.assertIsNone(index.query(~fingerprints[0] & ((1 << 64) - 1)))
+        with self.assertRaises(ValueError):
+            NearDuplicateIndex(max_distance=16)
+
+    def test_collapse(self):
+        """测试近似重复的分块合并为一个，并列出全部来源"""
+        other = self.other * 2
+        documents = [
+            Document(page_content=self.text, metadata={"source": "a.txt", "start_index": 0}),
+            Document(page_content=other, metadata={"source": "a.txt", "start_index": 300}),
+            Document(page_content=self.text.replace("奖励", "回报", 1), metadata={"source": "b.srt"}),
+            Document(page_content=self.text, metadata={"source": "c.vtt"}),
+            Document(page_content=other, metadata={"source": "a.txt", "start_index": 600}),
+        ]
+        result = collapse_near_duplicates(documents)
+        self.assertEqual([doc.page_content for doc in result], [self.text, other])
+        self.assertEqual(chunk_sources(result[0].metadata), ["a.txt", "b.srt", "c.vtt"])
+        self.assertEqual(result[0].metadata["source"], "a.txt")
+        self.assertEqual(result[0].metadata["start_index"], 0)
+        # 只在同一来源内重复的分块不加 sources 字段
+        self.assertIs(result[1], documents[1])
+        self.assertEqual(chunk_sources(result[1].metadata), ["a.txt"])
+        # 输入的文档不被修改
+        self.assertNotIn(SOURCES_FIELD, documents[0].metadata)
+
+    def test_short_chunks_not_merged(self):
+        """测试只差一个数值的短分块不会被合并"""
+        documents = [
+            Document(page_content="Q-learning 的学习率设置为 0.1", metadata={"source": "a.txt"}),
+            Document(page_content="Q-learning 的学习率设置为 0.9", metadata={"source": "b.txt"}),
+            Document(page_content="Q-learning 的学习率设置为 0.1", metadata={"source": "c.txt"}),
+        ]
+        self.assertEqual(collapse_near_duplicates(documents, max_distance=6), documents)
+
+    def test_registry(self):
+        """测试登记表跨文件合并、按来源释放并可保存后重新加载"""
+        path = os.path.join(tempfile.mkdtemp(), "duplicates.json")
+        registry = DuplicateRegistry(path)
+        first = Document(page_content=self.text, metadata={"source": "a.txt"})
+        copy = Document(page_content=self.text.replace("奖励", "回报", 1), metadata={"source": "b.json"})
+        self.assertEqual(registry.register(first, "id-a"), "id-a")
+        self.assertEqual(registry.register(copy, "id-b"), "id-a")
+        # 短分块不登记
+        self.assertEqual(registry.register(Document(page_content="短", metadata={"source": "b.json"}), "id-s"), "id-s")
+        self.assertEqual(registry.pop_changes(), {"id-a": ["a.txt", "b.json"]})
+        registry.save()
+
+        registry = DuplicateRegistry(path)
+        self.assertEqual(len(registry), 1)
+        # 重新处理 b.json 时仍匹配到保留分块，不算变化
+        self.assertEqual(registry.register(copy, "id-b"), "id-a")
+        registry.release("b.json", {"id-a"})
+        self.assertEqual(registry.pop_changes(), {})
+        # 删除保留分块的来源后改记到其余来源，来源全部删除后不再登记
+        registry.release("a.txt")
+        self.assertEqual(registry.pop_changes(), {"id-a": ["b.json"]})
+        registry.release("b.json")
+        self.assertEqual(registry.pop_changes(), {"id-a": []})
+        self.assertEqual(registry.register(copy, "id-b"), "id-b")
+
+if __name__ == "__main__":
+    unittest.main()
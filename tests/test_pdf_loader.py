@@ -0,0 +1,98 @@
+import unittest
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+import fitz
+from langchain_community.document_loaders import PyMuPDFLoader
+from src.pdf_loader import PdfLoader, PageTextCache
+from src.document_processor import DocumentProcessor
+
+class TestPdfLoader(unittest.TestCase):
+    def setUp(self):
+        """测试前的准备工作"""
+        self.test_dir = os.path.join(os.path.dirname(__file__), "test_pdf_data")
+        os.makedirs(self.test_dir, exist_ok=True)
+        self.pdf_path = os.path.join(self.test_dir, "book.pdf")
+        doc = fitz.open()
+        for number in range(10):
+            page = doc.new_page()
+            page.insert_text((72, 72), f"Chapter {number}. Reinforcement learning page {number}.")
+            page.insert_text((72, 100), "An agent interacts with the environment to maximize reward.")
+        doc.set_metadata({"title": "Test Book", "author": "Tester"})
+        doc.save(self.pdf_path)
+        doc.close()
+        self.cache_dir = os.path.join(os.path.dirname(__file__), "test_pdf_cache")
+
+    def tearDown(self):
+        """测试后的清理工作"""
+        for path in (self.test_dir, self.cache_dir):
+            if os.path.exists(path):
+                shutil.rmtree(path)
+
+    @staticmethod
+    def _pages(documents):
+        return [(doc.page_content, doc.metadata) for doc in documents]
+
+    def test_same_as_pymupdf_loader(self):
+        """测试逐页加载的文本和元数据与 PyMuPDFLoader 一致"""
+        expected = self._pages(PyMuPDFLoader(self.pdf_path).load())
+        self.assertEqual(len(expected), 10)
+        self.assertEqual(self._pages(PdfLoader(self.pdf_path, pages_per_task=3).lazy_load()), expected)
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            loader = PdfLoader(self.pdf_path, workers=2, executor=executor, pages_per_task=3)
+            self.assertEqual(self._pages(loader.lazy_load()), expected)
+
+    def test_page_cache(self):
+        """测试重复加载同一内容的 PDF 时读取缓存的逐页文本"""
+        cache = PageTextCache(self.cache_dir)
+        first = list(PdfLoader(self.pdf_path, pages_per_task=4, cache=cache).lazy_load())
+        self.assertEqual(cache.stats(), {"hits": 0, "misses": 10, "documents": 1})
+
+        # 重新上传（不同文件名、相同内容）
+        copy_path = os.path.join(self.test_dir, "upload.pdf")
+        shutil.copy(self.pdf_path, copy_path)
+        cache = PageTextCache(self.cache_dir)
+        second = list(PdfLoader(copy_path, pages_per_task=4, cache=cache).lazy_load())
+        self.assertEqual(cache.stats(), {"hits": 10, "misses": 0, "documents": 1})
+        self.assertEqual([doc.page_content for doc in second], [doc.page_content for doc in first])
+        self.assertEqual({doc.metadata["source"] for doc in second}, {copy_path})
+        self.assertEqual(second[0].metadata["title"], "Test Book")
+
+    def test_cache_eviction(self):
+        """测试超过文件数上限时淘汰最久未使用的文件"""
+        cache = PageTextCache(max_documents=1)
+        cache.put_document("a", 1, {})
+        cache.put_pages("a", 0, ["page a"])
+        cache.put_document("b", 1, {})
+        self.assertIsNone(cache.get_document("a"))
+        self.assertEqual(cache.get_pages("a", 0, 1), {})
+        self.assertEqual(cache.get_document("b"), (1, {}))
+
+    def test_early_stop(self):
+        """测试提前结束迭代时取消剩余的页区间"""
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            pages = PdfLoader(self.pdf_path, workers=1, executor=executor, pages_per_task=2).lazy_load()
+            self.assertEqual(next(pages).metadata["page"], 0)
+            pages.close()
+
+    def test_processor_page_parallel(self):
+        """测试文档处理器多进程时按页区间并行加载 PDF，结果与逐个加载一致"""
+        with open(os.path.join(self.test_dir, "notes.txt"), "w", encoding="utf-8") as f:
+            f.write("强化学习笔记。" * 20)
+        serial = DocumentProcessor(chunk_size=100, chunk_overlap=20)
+        parallel = DocumentProcessor(chunk_size=100, chunk_overlap=20, workers=2, pdf_cache_dir=self.cache_dir)
+        expected = serial.process_documents(self.test_dir)
+        self.assertEqual(self._pages(parallel.process_documents(self.test_dir)), self._pages(expected))
+        self.assertEqual(parallel.last_report[0]["path"], self.pdf_path)
+        self.assertEqual(parallel.last_report[0]["documents"], len([doc for doc in expected if "page" in doc.metadata]))
+
+        chunks = []
+        for documents, report in parallel.iter_files(parallel.list_files(self.test_dir), split=True):
+            documents = list(documents)
+            self.assertEqual((len(documents), report["error"]), (report["documents"], None))
+            chunks.extend(documents)
+        self.assertEqual(self._pages(chunks), self._pages(expected))
+        self.assertEqual(parallel.page_cache.count_pages(PageTextCache.make_key(self.pdf_path)), 10)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,154 @@
+import unittest
+import os
+import shutil
+import numpy as np
+from src.quantized_index import QuantizedIndex, Int8Index, PQIndex
+from src.flat_index import FlatIndex
+from src.vector_store import VectorStore
+from src.zhipuai_embedding import ZhipuAIEmbeddings
+
+class QuantizedIndexTestMixin:
+    """各量化后端共用的测试"""
+    index_class = None
+    params = {}
+    compression = 1
+
+    def setUp(self):
+        """测试前的准备工作"""
+        self.embedding = ZhipuAIEmbeddings(api_key="test_key_quantized", return_numpy=True)
+        self.test_dir = os.path.join(os.path.dirname(__file__), f"test_{self.index_class.backend_name}_index")
+        rng = np.random.default_rng(0)
+        self.vectors = rng.standard_normal((600, 64), dtype=np.float32)
+        self.texts = [f"文档{i}" for i in range(600)]
+        self.metadatas = [{"group": i % 5} for i in range(600)]
+
+    def tearDown(self):
+        """测试后的清理工作"""
+        if os.path.exists(self.test_dir):
+            shutil.rmtree(self.test_dir)
+
+    def make_index(self, persist_directory=None, **params):
+        # exact_threshold=0 强制走量化检索
+        index = self.index_class(self.embedding, persist_directory, {**self.params, **params}, exact_threshold=0)
+        index.add_embeddings(self.texts, self.vectors, self.metadatas)
+        return index
+
+    def test_rescored_search(self):
+        """测试重排后的结果与精确检索一致，距离为全精度距离"""
+        index = self.make_index()
+        exact = FlatIndex(self.embedding)
+        exact.add_embeddings(self.texts, self.vectors, self.metadatas)
+
+        queries = self.vectors[:20] + 0.3 * np.random.default_rng(1).standard_normal((20, 64), dtype=np.float32)
+        results = index.similarity_search_by_vectors_with_score(queries, k=5)
+        expected = exact.similarity_search_by_vectors_with_score(queries, k=5)
+        hits = sum(
+            len({doc.page_content for doc, _ in got} & {doc.page_content for doc, _ in want})
+            for got, want in zip(results, expected)
+        )
+        self.assertGreaterEqual(hits / 100, 0.9)
+        self.assertAlmostEqual(results[0][0][1], expected[0][0][1], places=4)
+        # 无过滤条件时 ANN 接口返回同样的候选
+        rows, _ = index._query_ann(queries / np.linalg.norm(queries, axis=1, keepdims=True), 5)
+        self.assertEqual(
+            [[index._documents[row] for row in hits] for hits in rows],
+            [[doc.page_content for doc, _ in got] for got in results]
+        )
+
+    def test_memory_usage(self):
+        """测试量化码的内存占用"""
+        usage = self.make_index().memory_usage()
+        self.assertEqual(usage["full_precision"], 600 * 64 * 4)
+        self.assertEqual(usage["codes"] * self.compression, usage["full_precision"])
+
+    def test_full_precision_on_disk(self):
+        """测试指定目录时全精度向量在写入、重新打开后写入和压缩时都不占用进程内存"""
+        index = self.make_index(self.test_dir)
+        usage = index.memory_usage()
+        self.assertEqual(usage["full_precision"], 0)
+        self.assertGreaterEqual(usage["mapped"], 600 * 64 * 4)
+        index.persist()
+
+        loaded = self.index_class(self.embedding, self.test_dir, exact_threshold=0)
+        loaded.add_embeddings(["新增文档"], np.ones((1, 64), dtype=np.float32), ids=["new"])
+        self.assertEqual(loaded.memory_usage()["full_precision"], 0)
+        loaded.delete(ids=loaded.get(where={"group": 0})["ids"])
+        self.assertEqual(loaded.compact(), 120)
+        self.assertEqual(loaded.memory_usage()["full_precision"], 0)
+        results = loaded.similarity_search_by_vector_with_score(self.vectors[7], k=1)
+        self.assertEqual(results[0][0].page_content, "文档7")
+        results = loaded.similarity_search_by_vector_with_score(np.ones(64, dtype=np.float32), k=1)
+        self.assertEqual(results[0][0].page_content, "新增文档")
+        # 临时文件不会残留在目录中
+        self.assertEqual(sorted(f for f in os.listdir(self.test_dir) if f.endswith(".vectors")), [])
+
+    def test_filter(self):
+        """测试过滤条件下返回k个满足条件的结果"""
+        index = self.make_index()
+        results = index.similarity_search_by_vector_with_score(self.vectors[3], k=4, filter={"group": 3})
+        self.assertEqual(len(results), 4)
+        self.assertTrue(all(doc.metadata["group"] == 3 for doc, _ in results))
+        self.assertEqual(results[0][0].page_content, "文档3")
+
+    def test_persist_and_reload(self):
+        """测试量化码持久化，全精度向量以内存映射方式打开"""
+        index = self.make_index(self.test_dir)
+        index.persist()
+        self.assertIsInstance(index._vectors, np.memmap)
+
+        loaded = self.index_class(self.embedding, self.test_dir, exact_threshold=0)
+        self.assertIsNotNone(loaded._ann)
+        np.testing.assert_array_equal(loaded._ann["codes"], index._ann["codes"])
+        results = loaded.similarity_search_by_vector_with_score(self.vectors[7], k=1)
+        self.assertEqual(results[0][0].page_content, "文档7")
+
+        # 写入后增量编码
+        loaded.add_embeddings(["新增文档"], np.ones((1, 64), dtype=np.float32), ids=["new"])
+        results = loaded.similarity_search_by_vector_with_score(np.ones(64, dtype=np.float32), k=1)
+        self.assertEqual(results[0][0].page_content, "新增文档")
+        self.assertEqual(len(loaded._ann["codes"]), 601)
+
+    def test_without_rescore(self):
+        """测试不重排时直接返回估算结果"""
+        index = self.make_index(rescore_factor=0)
+        results = index.similarity_search_by_vector_with_score(self.vectors[11], k=3)
+        self.assertEqual(len(results), 3)
+        self.assertEqual(results[0][0].page_content, "文档11")
+
+class TestQuantizedIndex(unittest.TestCase):
+    def test_incomplete_backend(self):
+        """测试未实现编码或相似度估算的子类在构造时报错"""
+        class EncodeOnly(QuantizedIndex):
+            def _build_ann(self, vectors):
+                return {"codes": vectors, "trained_rows": np.array(len(vectors))}
+
+            def _encode(self, vectors, ann):
+                return vectors
+
+        with self.assertRaises(TypeError):
+            EncodeOnly(None)
+
+class TestInt8Index(QuantizedIndexTestMixin, unittest.TestCase):
+    index_class = Int8Index
+    compression = 4
+
+    def test_vector_store_backend(self):
+        """测试 VectorStore 使用 int8 后端"""
+        store = VectorStore(persist_directory=None, embedding=self.embedding, backend="int8")
+        store.add_embeddings(self.texts, self.vectors, self.metadatas)
+        self.assertEqual(store.get_document_count(), 600)
+
+class TestPQIndex(QuantizedIndexTestMixin, unittest.TestCase):
+    index_class = PQIndex
+    params = {"pq_m": 16, "nbits": 8}
+    compression = 16
+
+    def test_invalid_params(self):
+        """测试段数不能整除维度时报错"""
+        index = self.index_class(self.embedding, params={"pq_m": 5}, exact_threshold=0)
+        index.add_embeddings(self.texts, self.vectors)
+        with self.assertRaises(ValueError):
+            index.similarity_search_by_vector_with_score(self.vectors[0], k=1)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,109 @@
+import unittest
+import gc
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from langchain_core.documents import Document
+from src.resource_registry import ResourceRegistry, get_registry, secret_key
+from src.vector_store import VectorStore
+from src.zhipuai_embedding import ZhipuAIEmbeddings
+
+class FakeResource:
+    """记录是否被关闭的测试资源"""
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+class TestResourceRegistry(unittest.TestCase):
+    def setUp(self):
+        """测试前的准备工作"""
+        self.registry = ResourceRegistry()
+        self.created = 0
+
+    def factory(self):
+        # 模拟较慢的初始化，放大并发创建的竞争
+        time.sleep(0.05)
+        self.created += 1
+        return FakeResource()
+
+    def test_shared_once(self):
+        """测试并发获取同一资源只创建一次"""
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            resources = list(executor.map(lambda _: self.registry.acquire("key", self.factory), range(8)))
+        self.assertEqual(self.created, 1)
+        self.assertTrue(all(resource is resources[0] for resource in resources))
+        self.assertEqual(self.registry.refcount("key"), 8)
+
+    def test_release_closes_last(self):
+        """测试最后一个引用归还时才释放资源"""
+        resource = self.registry.acquire("key", self.factory)
+        self.registry.acquire("key", self.factory)
+        self.registry.release("key")
+        self.assertFalse(resource.closed)
+        self.registry.release("key")
+        self.assertTrue(resource.closed)
+        self.assertEqual(self.registry.keys(), [])
+
+        # 释放后再次获取会重新创建
+        self.assertIsNot(self.registry.acquire("key", self.factory), resource)
+        self.assertEqual(self.created, 2)
+
+    def test_lease_released_on_gc(self):
+        """测试租约被回收时自动归还引用"""
+        lease = self.registry.lease("key", self.factory)
+        resource = lease.resource
+        session_state = {"lease": lease}
+        del lease
+        self.assertEqual(self.registry.refcount("key"), 1)
+        session_state.clear()
+        gc.collect()
+        self.assertEqual(self.registry.refcount("key"), 0)
+        self.assertTrue(resource.closed)
+
+    def test_lease_release_once(self):
+        """测试重复归还租约只减少一次引用"""
+        self.registry.acquire("key", self.factory)
+        lease = self.registry.lease("key", self.factory)
+        lease.release()
+        lease.release()
+        self.assertTrue(lease.released)
+        self.assertEqual(self.registry.refcount("key"), 1)
+
+    def test_factory_error(self):
+        """测试创建失败时不留下空的资源项"""
+        def failing_factory():
+            raise RuntimeError("init failed")
+        with self.assertRaises(RuntimeError):
+            self.registry.acquire("key", failing_factory)
+        self.assertEqual(self.registry.refcount("key"), 0)
+        self.assertIsInstance(self.registry.acquire("key", self.factory), FakeResource)
+
+    def test_default_registry(self):
+        """测试默认注册表在进程内唯一，密钥摘要不含明文"""
+        self.assertIs(get_registry(), get_registry())
+        self.assertNotIn("secret", secret_key("secret"))
+        self.assertEqual(secret_key("secret"), secret_key("secret"))
+
+    def test_shared_vector_store_concurrent_upsert(self):
+        """测试多个会话并发写入共享的向量库"""
+        embedding = ZhipuAIEmbeddings(api_key="test_key_registry")
+        store = self.registry.acquire(
+            "vector_store",
+            lambda: VectorStore(persist_directory=None, embedding=embedding, backend="flat")
+        )
+        docs = [Document(page_content=f"共享文档{i}", metadata={"source": "shared.txt", "start_index": i}) for i in range(20)]
+        barrier = threading.Barrier(4)
+
+        def upsert(_):
+            barrier.wait()
+            return self.registry.acquire("vector_store", lambda: None).upsert_documents(docs)
+
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            stats = list(executor.map(upsert, range(4)))
+        self.assertEqual(sum(item["added"] for item in stats), 20)
+        self.assertEqual(store.get_document_count(), 20)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -117,5 +117,48 @@ class TestSearchManager(unittest.TestCase):
         results = self.search_manager.advanced_search("测试文档", k=2)
         self.assertEqual(len(results), 2)
 
+    def test_date_range_filter(self):
+        """测试日期范围过滤在索引内求值，返回k个满足条件的结果"""
+        source = f"dated_{datetime.now().timestamp()}.txt"
+        docs = [
+            Document(
+                page_content=f"按日期过滤的测试文档{i}",
+                metadata={"source": source, "date": f"{2023 + i % 2}-06-0{i + 1}"}
+            )
+            for i in range(6)
+        ]
+        self.vector_store.add_documents(docs)
+        
+        results = self.search_manager.advanced_search(
+            "按日期过滤的测试文档",
+            filters={
+                "metadata": {"source": source},
+                "date_range": {"start": "2024-01-01", "end": "2024-12-31"}
+            },
+            k=3,
+            score_threshold=4.0
+        )
+        self.assertEqual(len(results), 3)
+        self.assertTrue(all(doc.metadata["date"].startswith("2024") for doc in results))
+
+    def test_similarity_search_batch(self):
+        """测试批量搜索"""
+        # 添加测试文档
+        # 内存模式的 Chroma 在进程内共享集合，用稳定ID写入避免重复
+        self.vector_store.upsert_documents(self.test_docs)
+        
+        # 测试批量搜索，结果与查询顺序一致并记录每个查询
+        queries = ["测试文档", "另一个文档", "测试文档"]
+        results = self.search_manager.similarity_search_batch(queries, k=2)
+        self.assertEqual(len(results), 3)
+        self.assertEqual(len(results[0]), 2)
+        self.assertEqual(
+            [doc.page_content for doc in results[0]],
+            [doc.page_content for doc in results[2]]
+        )
+        history = self.search_manager.get_search_history()
+        self.assertEqual([item["query"] for item in history], queries)
+        self.assertEqual(self.search_manager.similarity_search_batch([]), [])
+
 if __name__ == "__main__":
     unittest.main() 
\ No newline at end of file
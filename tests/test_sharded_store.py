@@ -0,0 +1,132 @@
+import unittest
+import os
+import shutil
+import uuid
+from langchain_core.documents import Document
+from src.sharded_store import ShardedVectorStore, shards_for_filter, default_shard_key, SHARD_FIELD
+from src.vector_store import VectorStore, make_chunk_id
+from src.zhipuai_embedding import ZhipuAIEmbeddings
+
+class TestShardedVectorStore(unittest.TestCase):
+    def setUp(self):
+        """测试前的准备工作"""
+        self.embedding = ZhipuAIEmbeddings(api_key="test_key_sharded", return_numpy=True)
+        self.test_dir = os.path.join(os.path.dirname(__file__), "test_sharded_store")
+        self.test_docs = [
+            Document(
+                page_content=f"{domain}的第{i}段内容",
+                metadata={"source": f"data/knowledge_db/{domain}/doc.txt", "start_index": i}
+            )
+            for domain in ("easy_rl", "prompt_engineering", "pumkin_book")
+            for i in range(10)
+        ]
+        self.store = ShardedVectorStore(persist_directory=None, embedding=self.embedding, backend="flat")
+        self.addCleanup(self.store.close)
+        self.store.add_documents(self.test_docs)
+
+    def tearDown(self):
+        """测试后的清理工作"""
+        if os.path.exists(self.test_dir):
+            shutil.rmtree(self.test_dir)
+
+    def test_shard_by_directory(self):
+        """测试按来源目录分片"""
+        self.assertEqual(self.store.shard_names(), ["easy_rl", "prompt_engineering", "pumkin_book"])
+        self.assertEqual(self.store.get_document_count(), 30)
+        self.assertEqual(self.store.shards["easy_rl"].get_document_count(), 10)
+        self.assertEqual(default_shard_key(Document(page_content="无来源")), "default")
+
+    def test_merge_matches_single_store(self):
+        """测试各分片合并后的 top-k 与不分片时一致"""
+        single = VectorStore(persist_directory=None, embedding=self.embedding, backend="flat")
+        single.add_documents(self.test_docs)
+        queries = ["easy_rl的第3段内容", "pumkin_book的第7段内容", "其他问题"]
+        batch_results = self.store.similarity_search_batch(queries, k=5)
+        for query, results in zip(queries, batch_results):
+            expected = single.similarity_search_with_score(query, k=5)
+            self.assertEqual([doc.page_content for doc, _ in results], [doc.page_content for doc, _ in expected])
+            for (_, score), (_, expected_score) in zip(results, expected):
+                self.assertAlmostEqual(score, expected_score, places=5)
+        self.assertEqual(self.store.similarity_search("easy_rl的第3段内容", k=1)[0].metadata[SHARD_FIELD], "easy_rl")
+
+    def test_filter_skips_shards(self):
+        """测试过滤条件排除的分片不参与查询"""
+        shards = ["easy_rl", "prompt_engineering", "pumkin_book"]
+        self.assertEqual(shards_for_filter({"shard": "easy_rl"}, shards), {"easy_rl"})
+        self.assertEqual(shards_for_filter({"shard": {"$nin": ["easy_rl"]}}, shards), {"prompt_engineering", "pumkin_book"})
+        self.assertEqual(shards_for_filter({"source": "x"}, shards), set(shards))
+        self.assertEqual(
+            shards_for_filter({"$and": [{"shard": {"$in": ["easy_rl", "pumkin_book"]}}, {"shard": {"$ne": "easy_rl"}}]}, shards),
+            {"pumkin_book"}
+        )
+        self.assertEqual(
+            shards_for_filter({"$or": [{"shard": "easy_rl"}, {"shard": "pumkin_book"}]}, shards),
+            {"easy_rl", "pumkin_book"}
+        )
+
+        queried = []
+        for name, shard in self.store.shards.items():
+            search = shard.similarity_search_by_vectors_with_score
+            def recording_search(embeddings, k=4, filter=None, name=name, search=search):
+                queried.append(name)
+                return search(embeddings, k=k, filter=filter)
+            shard.similarity_search_by_vectors_with_score = recording_search
+        results = self.store.similarity_search("easy_rl的第3段内容", k=5, filter={"shard": "pumkin_book"})
+        self.assertEqual(queried, ["pumkin_book"])
+        self.assertTrue(all(doc.metadata[SHARD_FIELD] == "pumkin_book" for doc in results))
+
+    def test_rebuild_and_delete(self):
+        """测试单独重建分片和按来源删除"""
+        stats = self.store.rebuild_shard("easy_rl", self.test_docs[:3])
+        self.assertEqual(stats, {"added": 3, "removed": 10})
+        # 重建后的分块使用稳定ID
+        self.assertEqual(
+            sorted(self.store.shards["easy_rl"].vectordb.get()["ids"]),
+            sorted(make_chunk_id(doc) for doc in self.test_docs[:3])
+        )
+        self.assertEqual(self.store.get_document_count(), 23)
+        self.assertEqual(self.store.delete_by_source("data/knowledge_db/pumkin_book/doc.txt"), 10)
+        self.assertEqual(self.store.get_document_count(), 13)
+
+    def test_persist_and_reopen(self):
+        """测试持久化后按子目录重新打开分片"""
+        store = ShardedVectorStore(persist_directory=self.test_dir, embedding=self.embedding, backend="flat")
+        self.addCleanup(store.close)
+        stats = store.upsert_documents(self.test_docs)
+        self.assertEqual(stats, {"added": 30, "unchanged": 0, "removed": 0})
+
+        reopened = ShardedVectorStore(persist_directory=self.test_dir, embedding=self.embedding, backend="flat")
+        self.addCleanup(reopened.close)
+        self.assertEqual(reopened.shard_names(), ["easy_rl", "prompt_engineering", "pumkin_book"])
+        self.assertEqual(reopened.upsert_documents(self.test_docs)["unchanged"], 30)
+
+    def test_export_includes_buffered(self):
+        """测试导出快照时包含写入缓冲中尚未提交的文档"""
+        store = ShardedVectorStore(persist_directory=self.test_dir, embedding=self.embedding, backend="flat", commit_size=1000)
+        self.addCleanup(store.close)
+        store.add_documents(self.test_docs)
+        self.assertEqual(sum(len(shard._pending) for shard in store.shards.values()), 30)
+        records = store.shards["easy_rl"].get_records(include=["metadatas"])
+        self.assertEqual(len(records["ids"]), 10)
+        self.assertFalse(store.shards["easy_rl"]._pending)
+        manifest = store.export_snapshot(os.path.join(self.test_dir, "snapshot"))
+        self.assertEqual(manifest["count"], 30)
+
+    def test_chroma_shards(self):
+        """测试 Chroma 分片各自使用独立的集合"""
+        suffix = uuid.uuid4().hex[:8]
+        store = ShardedVectorStore(persist_directory=None, embedding=self.embedding)
+        self.addCleanup(store.close)
+        docs = [
+            Document(page_content="分片A的内容", metadata={"source": "x.txt", SHARD_FIELD: f"a_{suffix}"}),
+            Document(page_content="分片B的内容", metadata={"source": "y.txt", SHARD_FIELD: f"b_{suffix}"})
+        ]
+        store.upsert_documents(docs)
+        self.addCleanup(store.clear)
+        self.assertEqual(store.shards[f"a_{suffix}"].get_document_count(), 1)
+        results = store.similarity_search_with_score("分片B的内容", k=2)
+        self.assertEqual(len(results), 2)
+        self.assertEqual(results[0][0].page_content, "分片B的内容")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,156 @@
+import unittest
+import os
+import shutil
+import numpy as np
+from langchain_core.documents import Document
+from src.snapshot import SnapshotIndex, write_snapshot, publish_snapshot, read_manifest, is_snapshot, current_version
+from src.vector_store import VectorStore
+from src.zhipuai_embedding import ZhipuAIEmbeddings
+
+class TestSnapshot(unittest.TestCase):
+    def setUp(self):
+        """测试前的准备工作"""
+        self.embedding = ZhipuAIEmbeddings(api_key="test_key_snapshot", return_numpy=True)
+        self.test_dir = os.path.join(os.path.dirname(__file__), "test_snapshot")
+        self.test_docs = [
+            Document(page_content="强化学习的基本概念", metadata={"source": "rl.txt", "page": 1, "date": "2024-01-01"}),
+            Document(page_content="提示工程的基本原则", metadata={"source": "prompt.md", "page": 2, "draft": True}),
+            Document(page_content="机器学习中的线性模型", metadata={"source": "book.pdf", "page": "三"})
+        ]
+        self.store = VectorStore(persist_directory=None, embedding=self.embedding, backend="flat")
+        self.store.add_documents(self.test_docs)
+
+    def tearDown(self):
+        """测试后的清理工作"""
+        if os.path.exists(self.test_dir):
+            shutil.rmtree(self.test_dir)
+
+    def test_export_and_open(self):
+        """测试导出快照后直接映射打开，结果与原库一致"""
+        manifest = self.store.export_snapshot(self.test_dir, chunking={"chunk_size": 500, "chunk_overlap": 50})
+        self.assertTrue(is_snapshot(self.test_dir))
+        self.assertEqual(manifest["count"], 3)
+        self.assertEqual(read_manifest(self.test_dir)["chunking"], {"chunk_size": 500, "chunk_overlap": 50})
+        self.assertEqual(manifest["embedding"]["model"], "embedding-2")
+
+        snapshot = VectorStore(persist_directory=self.test_dir, embedding=self.embedding, backend="snapshot")
+        self.assertIsInstance(snapshot.vectordb._vectors, np.memmap)
+        self.assertEqual(snapshot.get_document_count(), 3)
+        for doc in self.test_docs:
+            results = snapshot.similarity_search_with_score(doc.page_content, k=1)
+            expected = self.store.similarity_search_with_score(doc.page_content, k=1)
+            self.assertEqual(results[0][0].page_content, doc.page_content)
+            self.assertEqual(results[0][0].metadata, expected[0][0].metadata)
+            self.assertAlmostEqual(results[0][1], expected[0][1], places=5)
+
+        # 过滤条件同样可用，类型混杂的列按原值还原
+        results = snapshot.similarity_search("强化学习的基本概念", k=3, filter={"page": {"$gte": 2}})
+        self.assertEqual([doc.metadata["source"] for doc in results], ["prompt.md"])
+        self.assertEqual(snapshot.vectordb.get(ids=[snapshot.vectordb._ids[2]])["metadatas"][0]["page"], "三")
+
+    def test_int8_snapshot(self):
+        """测试 int8 快照的体积和检索"""
+        self.store.export_snapshot(self.test_dir, dtype="int8")
+        index = SnapshotIndex(self.embedding, self.test_dir)
+        self.assertEqual(index._vectors.dtype, np.int8)
+        results = index.similarity_search("提示工程的基本原则", k=1)
+        self.assertEqual(results[0].page_content, "提示工程的基本原则")
+
+    def test_int8_get_embeddings(self):
+        """测试 int8 快照读取的是还原后的向量，重新导出后检索结果不变"""
+        self.store.export_snapshot(self.test_dir, dtype="int8")
+        snapshot = VectorStore(persist_directory=self.test_dir, embedding=self.embedding, backend="snapshot")
+        records = snapshot.vectordb.get(include=["embeddings"])
+        expected = self.store.vectordb.get(ids=records["ids"], include=["embeddings"])["embeddings"]
+        self.assertEqual(records["embeddings"].dtype, np.float32)
+        np.testing.assert_allclose(records["embeddings"], expected, atol=0.02)
+
+        copy_dir = self.test_dir + "_copy"
+        self.addCleanup(shutil.rmtree, copy_dir, True)
+        snapshot.export_snapshot(copy_dir)
+        copy = SnapshotIndex(self.embedding, copy_dir)
+        for doc in self.test_docs:
+            self.assertEqual(copy.similarity_search(doc.page_content, k=1)[0].page_content, doc.page_content)
+
+    def test_write_after_open(self):
+        """测试打开快照后写入并重新写出"""
+        self.store.export_snapshot(self.test_dir)
+        snapshot = VectorStore(persist_directory=self.test_dir, embedding=self.embedding, backend="snapshot")
+        snapshot.add_documents([Document(page_content="新增的文档", metadata={"source": "new.txt"})])
+        snapshot.vectordb.delete(ids=[snapshot.vectordb.get(where={"source": "rl.txt"})["ids"][0]])
+        snapshot.persist()
+
+        reopened = SnapshotIndex(self.embedding, self.test_dir)
+        self.assertEqual(reopened.count(), 3)
+        self.assertEqual(reopened.similarity_search("新增的文档", k=1)[0].page_content, "新增的文档")
+        self.assertEqual(reopened.get(where={"source": "rl.txt"})["ids"], [])
+
+    def test_delete_without_copy(self):
+        """测试删除快照中的记录不复制映射的数据"""
+        self.store.export_snapshot(self.test_dir, dtype="int8")
+        index = SnapshotIndex(self.embedding, self.test_dir)
+        index.delete(ids=index.get(where={"source": "rl.txt"})["ids"])
+        self.assertIsInstance(index._vectors, np.memmap)
+        self.assertEqual(index.count(), 2)
+        self.assertEqual(index.similarity_search("强化学习的基本概念", k=1, filter={"source": "rl.txt"}), [])
+
+        index.persist()
+        self.assertEqual(read_manifest(self.test_dir)["count"], 2)
+        self.assertEqual(SnapshotIndex(self.embedding, self.test_dir).count(), 2)
+
+    def test_publish_versions(self):
+        """测试发布新版本后只读进程自动切换，旧版本按数量清理"""
+        manifest = self.store.export_snapshot(self.test_dir, publish=True)
+        self.assertEqual(manifest["snapshot_version"], "v000001")
+        self.assertTrue(is_snapshot(self.test_dir))
+        reader = VectorStore(persist_directory=self.test_dir, embedding=self.embedding, backend="snapshot", read_only=True)
+        reader.vectordb.refresh_interval = 0
+        self.assertEqual(reader.get_document_count(), 3)
+        with self.assertRaises(ValueError):
+            reader.add_documents([Document(page_content="只读模式不能写入")])
+        with self.assertRaises(ValueError):
+            reader.delete_by_source("rl.txt")
+
+        self.store.add_documents([Document(page_content="第二个版本的文档", metadata={"source": "v2.txt"})])
+        self.store.export_snapshot(self.test_dir, publish=True)
+        self.store.export_snapshot(self.test_dir, publish=True)
+        self.assertEqual(current_version(self.test_dir), "v000003")
+        self.assertEqual(sorted(name for name in os.listdir(self.test_dir) if name.startswith("v")), ["v000002", "v000003"])
+        results = reader.similarity_search("第二个版本的文档", k=1)
+        self.assertEqual(results[0].page_content, "第二个版本的文档")
+        self.assertEqual(reader.vectordb.version, "v000003")
+
+    def test_persist_publishes(self):
+        """测试可写打开版本化快照时 persist 发布新版本"""
+        publish_snapshot(self.test_dir, ["a"], ["文本"], [{"source": "a.txt"}], self.embedding.embed_documents(["文本"]))
+        index = SnapshotIndex(self.embedding, self.test_dir)
+        index.add_texts(["新增文本"], ids=["b"])
+        index.persist()
+        self.assertEqual(current_version(self.test_dir), "v000002")
+        self.assertEqual(index.count(), 2)
+        self.assertEqual(read_manifest(os.path.join(self.test_dir, "v000001"))["count"], 1)
+
+    def test_model_mismatch(self):
+        """测试嵌入模型不一致时拒绝打开"""
+        write_snapshot(
+            self.test_dir, ["a"], ["文本"], [None], np.ones((1, 4), dtype=np.float32),
+            embedding={"model": "other-model"}
+        )
+        with self.assertRaises(ValueError):
+            SnapshotIndex(self.embedding, self.test_dir)
+
+    def test_export_chroma(self):
+        """测试从 Chroma 后端导出快照"""
+        source = f"chroma_snapshot_{os.getpid()}.txt"
+        store = VectorStore(persist_directory=None, embedding=self.embedding)
+        store.upsert_documents([Document(page_content="从Chroma导出的文档", metadata={"source": source})])
+        # 内存模式的 Chroma 在进程内共享集合，导出后删除，避免影响其他测试
+        self.addCleanup(lambda: store.vectordb.delete(ids=store.vectordb.get(where={"source": source})["ids"]))
+        store.export_snapshot(self.test_dir)
+
+        index = SnapshotIndex(self.embedding, self.test_dir)
+        results = index.similarity_search("从Chroma导出的文档", k=1, filter={"source": source})
+        self.assertEqual(results[0].page_content, "从Chroma导出的文档")
+
+if __name__ == "__main__":
+    unittest.main()
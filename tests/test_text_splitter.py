@@ -0,0 +1,81 @@
+import unittest
+from src.text_splitter import CJKTextSplitter
+from src.document_processor import DocumentProcessor
+
+class TestCJKTextSplitter(unittest.TestCase):
+    def setUp(self):
+        """测试前的准备工作"""
+        self.text = (
+            "# 第一章 强化学习\n\n"
+            + "强化学习研究智能体如何在环境中采取行动！它的目标是什么？是最大化累积奖励；这需要探索与利用的平衡。" * 4
+            + "\n\n## 1.1 基本概念\n\n"
+            + "状态、动作和奖励是三个基本概念。“策略”决定了在每个状态下选择的动作。" * 6
+        )
+        self.splitter = CJKTextSplitter(chunk_size=120, chunk_overlap=20)
+
+    def test_offsets(self):
+        """测试分块的起止偏移与原文一致，且不超过分块大小"""
+        chunks = self.splitter.create_documents([self.text], [{"source": "test.md"}])
+        self.assertGreater(len(chunks), 3)
+        for chunk in chunks:
+            start, end = chunk.metadata["start_index"], chunk.metadata["end_index"]
+            self.assertEqual(self.text[start:end], chunk.page_content)
+            self.assertLessEqual(len(chunk.page_content), 120)
+            self.assertEqual(chunk.metadata["source"], "test.md")
+
+    def test_sentence_boundaries(self):
+        """测试分块在中文句末标点处结束，重叠部分从句子开头开始"""
+        chunks = self.splitter.split_text(self.text)
+        for chunk in chunks[:-1]:
+            self.assertTrue(chunk[-1] in "。！？；”" or chunk.endswith("强化学习"), chunk)
+        for previous, chunk in zip(chunks, chunks[1:]):
+            self.assertNotIn(chunk[0], "，。！？；")
+
+    def test_heading_boundary(self):
+        """测试 Markdown 标题作为新分块的开头"""
+        chunks = self.splitter.split_text(self.text)
+        self.assertTrue(any(chunk.startswith("## 1.1 基本概念") for chunk in chunks))
+        self.assertTrue(chunks[0].startswith("# 第一章 强化学习"))
+
+    def test_hard_cut(self):
+        """测试没有切分点的长文本按长度切分并保持重叠"""
+        text = "无标点长文本" * 50
+        chunks = CJKTextSplitter(chunk_size=100, chunk_overlap=10).create_documents([text])
+        self.assertEqual([len(chunk.page_content) for chunk in chunks[:-1]], [100] * (len(chunks) - 1))
+        for previous, chunk in zip(chunks, chunks[1:]):
+            self.assertEqual(chunk.metadata["start_index"], previous.metadata["end_index"] - 10)
+        self.assertEqual(chunks[-1].metadata["end_index"], len(text))
+
+    def test_spans_cover_text(self):
+        """测试分块覆盖原文中的每个非空白字符，标题前的文本不会丢失"""
+        texts = [
+            self.text,
+            "甲" * 90 + "。" + "乙" * 12 + "\n# 标题\n" + "丙" * 50,
+            ("段落内容，句子。" * 9 + "\n## 小节\n") * 8,
+        ]
+        for text in texts:
+            for overlap in (0, 20):
+                covered = [False] * len(text)
+                for start, end in CJKTextSplitter(chunk_size=100, chunk_overlap=overlap).split_spans(text):
+                    covered[start:end] = [True] * (end - start)
+                missing = [i for i, char in enumerate(text) if not char.isspace() and not covered[i]]
+                self.assertEqual(missing, [], (text[:20], overlap))
+
+    def test_english_text(self):
+        """测试英文句号后切分"""
+        text = "Reinforcement learning is a branch of machine learning. " * 10
+        chunks = CJKTextSplitter(chunk_size=100, chunk_overlap=0).split_text(text)
+        self.assertTrue(all(chunk.endswith(".") for chunk in chunks))
+
+    def test_processor_splitter(self):
+        """测试文档处理器默认使用中文分割器，也可以选择递归字符分割器"""
+        self.assertIsInstance(DocumentProcessor().text_splitter, CJKTextSplitter)
+        processor = DocumentProcessor(splitter="recursive")
+        self.assertNotIsInstance(processor.text_splitter, CJKTextSplitter)
+        processor.chunk_size = 200
+        self.assertNotIsInstance(processor.text_splitter, CJKTextSplitter)
+        with self.assertRaises(ValueError):
+            DocumentProcessor(splitter="unknown")
+
+if __name__ == "__main__":
+    unittest.main()
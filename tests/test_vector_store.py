@@ -1,9 +1,12 @@
 import unittest
 import os
 import shutil
+import time
+from unittest import mock
 from datetime import datetime
+import numpy as np
 from langchain_core.documents import Document
-from src.vector_store import VectorStore
+from src.vector_store import VectorStore, make_chunk_id, DATE_EPOCH_FIELD
 from src.zhipuai_embedding import ZhipuAIEmbeddings
 
 class TestVectorStore(unittest.TestCase):
@@ -55,6 +58,49 @@ class TestVectorStore(unittest.TestCase):
         self.assertEqual(len(results), 2)
         self.assertIn("测试文档", results[0].page_content)
         
+    def test_similarity_search_batch(self):
+        """测试批量相似度搜索与逐条搜索结果一致"""
+        # 内存模式的 Chroma 在进程内共享集合，用稳定ID写入避免重复
+        self.vector_store.upsert_documents(self.test_docs)
+        
+        queries = ["测试文档", "另一个测试文档2"]
+        batch_results = self.vector_store.similarity_search_batch(queries, k=2)
+        self.assertEqual(len(batch_results), 2)
+        for query, results in zip(queries, batch_results):
+            expected = self.vector_store.similarity_search_with_score(query, k=2)
+            self.assertEqual(
+                [doc.page_content for doc, _ in results],
+                [doc.page_content for doc, _ in expected]
+            )
+            for (_, score), (_, expected_score) in zip(results, expected):
+                self.assertAlmostEqual(score, expected_score, places=4)
+        
+        # 过滤条件作用于每个查询
+        batch_results = self.vector_store.similarity_search_batch(queries, k=2, filter={"source": "test2.txt"})
+        for results in batch_results:
+            self.assertTrue(all(doc.metadata["source"] == "test2.txt" for doc, _ in results))
+        
+    def test_date_epoch_metadata(self):
+        """测试日期元数据同时保存为数值时间戳"""
+        source = f"epoch_{datetime.now().timestamp()}.txt"
+        doc = Document(page_content="带日期的文档", metadata={"source": source, "date": "2024-03-01"})
+        self.vector_store.add_documents([doc])
+        # 内存模式的 Chroma 在进程内共享集合，测试后删除，避免影响其他测试的检索结果
+        self.addCleanup(self.vector_store.delete_by_source, source)
+        
+        results = self.vector_store.similarity_search_with_score(
+            "带日期的文档",
+            k=1,
+            filter={"$and": [
+                {"source": source},
+                {DATE_EPOCH_FIELD: {"$gte": datetime(2024, 1, 1).timestamp()}}
+            ]}
+        )
+        self.assertEqual(len(results), 1)
+        self.assertEqual(results[0][0].metadata[DATE_EPOCH_FIELD], datetime(2024, 3, 1).timestamp())
+        # 原文档的元数据不被修改
+        self.assertNotIn(DATE_EPOCH_FIELD, doc.metadata)
+        
     def test_persist_and_load(self):
         """测试持久化和加载功能"""
         # 创建临时目录
@@ -100,6 +146,148 @@ class TestVectorStore(unittest.TestCase):
         )
         self.assertEqual(len(results), 2)
         self.assertIn("测试文档", results[0].page_content)
+
+    def test_numpy_embeddings(self):
+        """测试嵌入模型返回 ndarray 时的写入与检索"""
+        embedding = ZhipuAIEmbeddings(api_key="test_key_numpy", return_numpy=True)
+        store = VectorStore(persist_directory=None, embedding=embedding)
+        # 内存模式的 Chroma 在进程内共享集合，只比较增量
+        count = store.get_document_count()
+        store.add_documents(self.test_docs)
+        
+        texts = ["预先计算向量的文档"]
+        store.add_embeddings(texts, embedding.embed_documents(texts), [{"source": "vec.txt"}])
+        
+        self.assertEqual(store.get_document_count(), count + 3)
+        results = store.similarity_search_with_score("预先计算向量的文档", k=1)
+        self.assertEqual(results[0][0].page_content, "预先计算向量的文档")
+        self.assertAlmostEqual(results[0][1], 0.0, places=4)
+
+
+    def test_upsert_documents(self):
+        """测试使用稳定ID增量写入"""
+        source = f"upsert_{datetime.now().timestamp()}.txt"
+        docs = [
+            Document(page_content="第一段内容", metadata={"source": source, "start_index": 0}),
+            Document(page_content="第二段内容", metadata={"source": source, "start_index": 6})
+        ]
+        count = self.vector_store.get_document_count()
+        
+        stats = self.vector_store.upsert_documents(docs)
+        self.assertEqual(stats, {"added": 2, "unchanged": 0, "removed": 0})
+        
+        # 重复写入未变化的分块不做任何操作
+        stats = self.vector_store.upsert_documents(docs)
+        self.assertEqual(stats, {"added": 0, "unchanged": 2, "removed": 0})
+        
+        # 修改一个分块后，旧分块被替换
+        docs[1] = Document(page_content="修改后的第二段", metadata={"source": source, "start_index": 6})
+        stats = self.vector_store.upsert_documents(docs)
+        self.assertEqual(stats, {"added": 1, "unchanged": 1, "removed": 1})
+        self.assertEqual(self.vector_store.get_document_count(), count + 2)
+        
+    def test_delete_by_source(self):
+        """测试按来源和按ID删除"""
+        source = f"delete_{datetime.now().timestamp()}.txt"
+        docs = [
+            Document(page_content="待删除的第一段", metadata={"source": source, "start_index": 0}),
+            Document(page_content="待删除的第二段", metadata={"source": source, "start_index": 8})
+        ]
+        count = self.vector_store.get_document_count()
+        self.vector_store.upsert_documents(docs)
+        self.assertEqual(self.vector_store.delete([make_chunk_id(docs[0]), "missing"]), 1)
+        self.assertEqual(self.vector_store.delete_by_source(source), 1)
+        self.assertEqual(self.vector_store.get_document_count(), count)
+
+    def test_tombstone_compaction(self):
+        """测试 flat 后端删除后立即不可检索，后台任务回收空间"""
+        store = VectorStore(persist_directory=None, embedding=ZhipuAIEmbeddings(), backend="flat")
+        store.add_documents(self.test_docs)
+        self.assertEqual(store.delete_by_source(["test1.txt"]), 1)
+        results = store.similarity_search("这是一个测试文档1", k=2)
+        self.assertEqual([doc.metadata["source"] for doc in results], ["test2.txt"])
+        self.assertEqual(store.vectordb.tombstone_count(), 1)
+
+        store.start_compaction(interval=0.01, min_tombstone_ratio=0.5)
+        self.addCleanup(store.close)
+        for _ in range(200):
+            if not store.vectordb.tombstone_count():
+                break
+            time.sleep(0.01)
+        self.assertEqual(store.vectordb.tombstone_count(), 0)
+        self.assertEqual(store.get_document_count(), 1)
+
+        self.assertEqual(store.clear(), 1)
+        self.assertEqual(store.get_document_count(), 0)
+
+    def test_write_buffer(self):
+        """测试写入缓冲按数量阈值合并提交"""
+        test_dir = os.path.join(os.path.dirname(__file__), "test_write_buffer")
+        self.addCleanup(shutil.rmtree, test_dir, True)
+        embedding = ZhipuAIEmbeddings()
+        calls = []
+        embed_documents = embedding.embed_documents
+        def counting_embed(texts):
+            calls.append(len(texts))
+            return embed_documents(texts)
+        embedding.embed_documents = counting_embed
+
+        store = VectorStore(persist_directory=test_dir, embedding=embedding, backend="flat", commit_size=3)
+        self.addCleanup(store.close)
+        store.add_documents(self.test_docs[:1])
+        store.add_documents(self.test_docs[1:])
+        # 未达到阈值时既不嵌入也不写盘
+        self.assertEqual(calls, [])
+        self.assertEqual(VectorStore(persist_directory=test_dir, embedding=embedding, backend="flat").get_document_count(), 0)
+
+        store.add_documents(self.test_docs[:1])
+        self.assertEqual(calls, [3])
+        self.assertEqual(VectorStore(persist_directory=test_dir, embedding=embedding, backend="flat").get_document_count(), 3)
+
+        # 读取时先写入缓冲中的文档，持久化仍等到 flush
+        store.add_documents(self.test_docs[1:])
+        self.assertEqual(store.get_document_count(), 4)
+        self.assertEqual(VectorStore(persist_directory=test_dir, embedding=embedding, backend="flat").get_document_count(), 3)
+        self.assertEqual(store.flush(), 0)
+        self.assertEqual(VectorStore(persist_directory=test_dir, embedding=embedding, backend="flat").get_document_count(), 4)
+
+    def test_write_buffer_interval(self):
+        """测试写入缓冲按时间提交，关闭时提交剩余文档"""
+        test_dir = os.path.join(os.path.dirname(__file__), "test_write_buffer_interval")
+        self.addCleanup(shutil.rmtree, test_dir, True)
+        store = VectorStore(persist_directory=test_dir, embedding=ZhipuAIEmbeddings(), backend="flat", commit_interval=0.02)
+        store.add_documents(self.test_docs[:1])
+        for _ in range(200):
+            persisted = VectorStore(persist_directory=test_dir, embedding=ZhipuAIEmbeddings(), backend="flat")
+            if persisted.get_document_count():
+                break
+            time.sleep(0.01)
+        self.assertEqual(persisted.get_document_count(), 1)
+
+        store.add_documents(self.test_docs[1:])
+        store.close()
+        self.assertEqual(VectorStore(persist_directory=test_dir, embedding=ZhipuAIEmbeddings(), backend="flat").get_document_count(), 2)
+
+    def test_close_unregisters_exit_hook(self):
+        """测试关闭时只注销本实例的退出钩子"""
+        with mock.patch("src.vector_store.atexit") as hooks:
+            first = VectorStore(persist_directory=None, embedding=ZhipuAIEmbeddings(), backend="flat", commit_size=10)
+            second = VectorStore(persist_directory=None, embedding=ZhipuAIEmbeddings(), backend="flat", commit_size=10)
+            first.close()
+            first.close()
+        registered = [call.args[0] for call in hooks.register.call_args_list]
+        self.assertEqual(len(registered), 2)
+        hooks.unregister.assert_called_once_with(registered[0])
+        self.assertIsNot(registered[0], registered[1])
+        second.close()
+
+    def test_chunk_id_stable(self):
+        """测试分块ID只取决于来源、位置和内容"""
+        doc = Document(page_content="内容", metadata={"source": "a.txt", "start_index": 0, "date": "2024-01-01"})
+        same = Document(page_content="内容", metadata={"source": "a.txt", "start_index": 0, "date": "2024-02-01"})
+        moved = Document(page_content="内容", metadata={"source": "a.txt", "start_index": 10})
+        self.assertEqual(make_chunk_id(doc), make_chunk_id(same))
+        self.assertNotEqual(make_chunk_id(doc), make_chunk_id(moved))
         
 if __name__ == "__main__":
     unittest.main() 
\ No newline at end of file
@@ -1,6 +1,48 @@
 import unittest
 import os
-from src.zhipuai_embedding import ZhipuAIEmbeddings
+import time
+import json
+import asyncio
+import threading
+from types import SimpleNamespace
+import httpx
+import numpy as np
+from src.zhipuai_embedding import ZhipuAIEmbeddings, RateLimiter
+
+class FakeStatusError(Exception):
+    """带状态码的模拟接口错误"""
+    def __init__(self, status_code):
+        super().__init__(f"status {status_code}")
+        self.status_code = status_code
+
+class FakeEmbeddingsAPI:
+    """模拟 client.embeddings，记录每次请求的输入"""
+    def __init__(self, fail_on=None):
+        self.calls = []
+        self.fail_on = fail_on
+        # 依次抛出的错误，用于模拟限流等暂时性故障
+        self.errors = []
+
+    def create(self, model, input):
+        self.calls.append(list(input))
+        if self.errors:
+            raise self.errors.pop(0)
+        if self.fail_on is not None and len(input) > 1 and self.fail_on in input:
+            # 与输入有关的错误（如内容审核不通过）
+            raise FakeStatusError(400)
+        # 倒序返回，验证结果会按 index 还原
+        data = [
+            SimpleNamespace(index=i, embedding=[float(len(text)), float(i)])
+            for i, text in enumerate(input)
+        ]
+        return SimpleNamespace(data=list(reversed(data)))
+
+def make_api_embedding(**kwargs):
+    """构造一个使用模拟客户端的非演示模式实例"""
+    embedding = ZhipuAIEmbeddings(api_key="test_key_fake", **kwargs)
+    embedding.demo_mode = False
+    embedding.client = SimpleNamespace(embeddings=FakeEmbeddingsAPI())
+    return embedding
 
 class TestZhipuAIEmbeddings(unittest.TestCase):
     def setUp(self):
@@ -53,5 +95,240 @@ class TestZhipuAIEmbeddings(unittest.TestCase):
         self.assertGreaterEqual(similarity, -1)
         self.assertLessEqual(similarity, 1)
 
+    def test_demo_embeddings_batch(self):
+        """测试演示模式批量生成的向量确定、归一化且不修改全局随机状态"""
+        texts = ["文本一", "文本二", "文本一"]
+        state = np.random.get_state()[1].copy()
+        matrix = ZhipuAIEmbeddings._get_demo_embeddings(texts)
+
+        self.assertEqual(matrix.shape, (3, 1024))
+        self.assertEqual(matrix.dtype, np.float32)
+        np.testing.assert_allclose(np.linalg.norm(matrix, axis=1), 1.0, rtol=1e-5)
+        np.testing.assert_array_equal(matrix[0], matrix[2])
+        np.testing.assert_array_equal(np.random.get_state()[1], state)
+
+    def test_return_numpy(self):
+        """测试以 float32 ndarray 返回向量"""
+        embedding = ZhipuAIEmbeddings(api_key="test_key_numpy", return_numpy=True)
+        embeddings = embedding.embed_documents(["文本一", "文本二"])
+        query = embedding.embed_query("文本一")
+
+        self.assertIsInstance(embeddings, np.ndarray)
+        self.assertEqual(embeddings.dtype, np.float32)
+        self.assertEqual(embeddings.shape, (2, 1024))
+        self.assertTrue(embeddings.flags["C_CONTIGUOUS"])
+        np.testing.assert_array_equal(query, embeddings[0])
+
+        api_embedding = make_api_embedding(batch_size=1, return_numpy=True)
+        result = api_embedding.embed_documents(["a", "bb"])
+        self.assertEqual(result.dtype, np.float32)
+        np.testing.assert_array_equal(result[:, 0], [1.0, 2.0])
+
+    def test_batched_requests(self):
+        """测试按条数和字符数分批请求"""
+        embedding = make_api_embedding(batch_size=3, max_batch_chars=10)
+        texts = ["a", "bb", "ccc", "dddd", "eeeee", "f"]
+        embeddings = embedding.embed_documents(texts)
+
+        # 结果按输入顺序返回
+        self.assertEqual([e[0] for e in embeddings], [float(len(t)) for t in texts])
+        # 每批不超过3条且总字符数不超过10
+        calls = embedding.client.embeddings.calls
+        self.assertEqual(calls, [["a", "bb", "ccc"], ["dddd", "eeeee", "f"]])
+
+    def test_failed_subbatch_retry(self):
+        """测试只重试失败的子批次"""
+        embedding = make_api_embedding(batch_size=4)
+        embedding.client.embeddings.fail_on = "c"
+        embeddings = embedding.embed_documents(["a", "b", "c", "d"])
+
+        self.assertEqual(len(embeddings), 4)
+        calls = embedding.client.embeddings.calls
+        # 整批失败后拆分，未包含失败文本的子批次只请求一次
+        self.assertEqual(calls, [["a", "b", "c", "d"], ["a", "b"], ["c", "d"], ["c"], ["d"]])
+
+    def test_non_item_error_not_split(self):
+        """测试认证失败等与输入无关的错误直接抛出，不拆分批次"""
+        embedding = make_api_embedding(batch_size=4)
+        embedding.client.embeddings.errors = [FakeStatusError(401)]
+        with self.assertRaises(FakeStatusError):
+            embedding.embed_documents(["a", "b", "c", "d"])
+        self.assertEqual(embedding.client.embeddings.calls, [["a", "b", "c", "d"]])
+
+    def test_deduplicate_within_batch(self):
+        """测试批内重复文本只请求一次"""
+        embedding = make_api_embedding()
+        embeddings = embedding.embed_documents(["a", "bb", "a", "a"])
+
+        self.assertEqual(embedding.client.embeddings.calls, [["a", "bb"]])
+        self.assertEqual([e[0] for e in embeddings], [1.0, 2.0, 1.0, 1.0])
+        self.assertEqual(embedding.coalesced_count, 2)
+
+    def test_single_flight(self):
+        """测试并发的相同请求共享一次调用"""
+        embedding = make_api_embedding()
+        api = embedding.client.embeddings
+        started = threading.Event()
+        release = threading.Event()
+        original_create = api.create
+
+        def slow_create(model, input):
+            started.set()
+            release.wait(timeout=5)
+            return original_create(model, input)
+
+        api.create = slow_create
+        results = {}
+        first = threading.Thread(target=lambda: results.update(first=embedding.embed_query("相同查询")))
+        first.start()
+        started.wait(timeout=5)
+        second = threading.Thread(target=lambda: results.update(second=embedding.embed_query("相同查询")))
+        second.start()
+        # 等待第二个请求进入等待状态后再放行
+        while embedding.coalesced_count == 0:
+            time.sleep(0.01)
+        release.set()
+        first.join()
+        second.join()
+
+        self.assertEqual(len(api.calls), 1)
+        self.assertEqual(results["first"], results["second"])
+
+    def test_retry_on_rate_limit(self):
+        """测试限流和服务端错误时退避重试"""
+        embedding = make_api_embedding(backoff_base=0)
+        embedding.client.embeddings.errors = [FakeStatusError(429), FakeStatusError(503)]
+        embeddings = embedding.embed_documents(["a"])
+
+        self.assertEqual(len(embeddings), 1)
+        self.assertEqual(len(embedding.client.embeddings.calls), 3)
+
+    def test_no_retry_on_client_error(self):
+        """测试客户端错误不重试"""
+        embedding = make_api_embedding(backoff_base=0)
+        embedding.client.embeddings.errors = [FakeStatusError(400)]
+        with self.assertRaises(FakeStatusError):
+            embedding.embed_documents(["a"])
+        self.assertEqual(len(embedding.client.embeddings.calls), 1)
+
+    def test_concurrent_batches_keep_order(self):
+        """测试并发请求多个批次时结果保持输入顺序"""
+        embedding = make_api_embedding(batch_size=1, max_workers=4)
+        texts = ["x" * n for n in range(1, 9)]
+        embeddings = embedding.embed_documents(texts)
+        self.assertEqual([e[0] for e in embeddings], [float(len(t)) for t in texts])
+
+    def test_rate_limiter(self):
+        """测试令牌桶限流"""
+        limiter = RateLimiter(rate=20, capacity=1)
+        start = time.monotonic()
+        for _ in range(4):
+            limiter.acquire()
+        # 桶容量为1，后3次各需等待约0.05秒
+        self.assertGreaterEqual(time.monotonic() - start, 0.12)
+
+    def test_async_embed_documents(self):
+        """测试异步批量嵌入"""
+        requests = []
+
+        def handler(request):
+            body = json.loads(request.content)
+            requests.append(body["input"])
+            if len(requests) == 1:
+                return httpx.Response(429, json={"error": {"message": "rate limited"}})
+            data = [
+                {"index": i, "embedding": [float(len(text))]}
+                for i, text in enumerate(body["input"])
+            ]
+            return httpx.Response(200, json={"data": list(reversed(data))})
+
+        embedding = ZhipuAIEmbeddings(
+            api_key="abc.def",
+            batch_size=2,
+            backoff_base=0,
+            max_concurrency=2,
+            async_client=httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        )
+
+        async def run():
+            try:
+                documents = await embedding.aembed_documents(["a", "bb", "ccc"])
+                query = await embedding.aembed_query("dddd")
+                return documents, query
+            finally:
+                await embedding._async_client.aclose()
+
+        documents, query = asyncio.run(run())
+        self.assertEqual(documents, [[1.0], [2.0], [3.0]])
+        self.assertEqual(query, [4.0])
+        # 首次请求被限流后重试，共4次请求
+        self.assertEqual(len(requests), 4)
+
+    def test_async_uses_sdk_settings(self):
+        """测试异步请求使用真实 SDK 客户端的地址和认证头，只模拟传输层"""
+        requests = []
+
+        def handler(request):
+            requests.append(request)
+            return httpx.Response(200, json={"data": [{"index": 0, "embedding": [1.0]}]})
+
+        transport = httpx.MockTransport(handler)
+        for base_url, expected in (
+            (None, "https://open.bigmodel.cn/api/paas/v4/embeddings"),
+            ("https://example.com/v4/", "https://example.com/v4/embeddings")
+        ):
+            previous = os.environ.pop("ZHIPUAI_BASE_URL", None)
+            if base_url is not None:
+                os.environ["ZHIPUAI_BASE_URL"] = base_url
+            try:
+                embedding = ZhipuAIEmbeddings(
+                    api_key="abc.def",
+                    async_client=httpx.AsyncClient(transport=transport)
+                )
+            finally:
+                os.environ.pop("ZHIPUAI_BASE_URL", None)
+                if previous is not None:
+                    os.environ["ZHIPUAI_BASE_URL"] = previous
+
+            async def run():
+                try:
+                    return await embedding.aembed_query("hi")
+                finally:
+                    await embedding._async_client.aclose()
+
+            self.assertEqual(asyncio.run(run()), [1.0])
+            self.assertEqual(str(requests[-1].url), expected)
+            self.assertEqual(requests[-1].headers["Authorization"], "Bearer abc.def")
+            self.assertEqual(json.loads(requests[-1].content)["input"], ["hi"])
+
+    def test_async_client_per_loop(self):
+        """测试自行创建的连接池在所属事件循环结束时关闭，演示模式不创建连接池"""
+        embedding = make_api_embedding()
+        clients = []
+
+        async def run():
+            clients.append(await embedding._get_async_client())
+            self.assertIs(await embedding._get_async_client(), clients[-1])
+
+        asyncio.run(run())
+        asyncio.run(run())
+        self.assertEqual(len(clients), 2)
+        self.assertIsNot(clients[0], clients[1])
+        self.assertTrue(all(client.is_closed for client in clients))
+
+        demo = ZhipuAIEmbeddings(api_key="test_key_async")
+
+        async def run_demo():
+            await demo.aembed_documents(["测试文档"])
+            return [state["client"] for state in demo._loop_states.values()]
+
+        self.assertEqual(asyncio.run(run_demo()), [None])
+
+    def test_async_demo_mode(self):
+        """测试演示模式下的异步接口与同步结果一致"""
+        embedding = ZhipuAIEmbeddings(api_key="test_key_async")
+        result = asyncio.run(embedding.aembed_query("测试查询"))
+        self.assertEqual(result, embedding.embed_query("测试查询"))
+
 if __name__ == "__main__":
     unittest.main() 
\ No newline at end of file